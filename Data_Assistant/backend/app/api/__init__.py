@@ -1,3 +1,3 @@
-from app.api import session, chat
+from app.api import session, chat, datasets
 
-__all__ = ["session", "chat"]
+__all__ = ["session", "chat", "datasets"]
@@ -7,10 +7,12 @@ import logging
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, Dict, Optional
 import json
 
 from app.core.agent import DataAnalysisAgent
+from app.db.result import Columnar
+from app.db.result_store import result_store
 from app.db.session_store import session_store
 
 logger = logging.getLogger(__name__)
@@ -29,6 +31,31 @@ CORS_HEADERS = {
 }
 
 
+async def _persisted_data(
+    first_page: Optional[Dict[str, Any]], complete: Optional[Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    """
+    助手消息中保存的数据
+
+    首个 data 事件只含第一页；结果不止一页时从溢出文件读回完整的（有界）结果，
+    溢出文件过期后重新加载历史消息仍能看到全部行
+
+    Args:
+        first_page: 首个 data 事件的内容
+        complete: data_complete 事件
+    """
+    if first_page is None or complete is None:
+        return first_page
+    total = complete.get("total") or 0
+    if total <= len(Columnar.from_dict(first_page)):
+        return first_page
+    page = await result_store.page(complete["result_id"], offset=0, limit=total)
+    if page is None:
+        logger.warning("result %s expired before it was persisted, keeping the first page only", complete["result_id"])
+        return first_page
+    return page["data"]
+
+
 class ChatQueryRequest(BaseModel):
     session_id: str
     question: str
@@ -42,6 +69,8 @@ async def chat_query(body: ChatQueryRequest):
     返回 SSE 格式的流式数据：
     - type: status / sql / data / chart / answer / error / done
     - content: 对应类型的数据
+    - data 事件只含首页结果，附带 result_id / has_more，其余通过 /results/{id} 分页获取
+    - data_complete 事件给出 total / truncated / truncate_reason
     """
     try:
         session = await session_store.get_session(body.session_id)
@@ -68,6 +97,7 @@ async def chat_query(body: ChatQueryRequest):
             # 收集结果
             sql_result = None
             data_result = None
+            data_complete = None
             chart_result = None
             answer_result = ""
             
@@ -76,14 +106,16 @@ async def chat_query(body: ChatQueryRequest):
                 event_type = event.get("type")
                 content = event.get("content")
                 
-                # 发送 SSE 事件
-                yield f"data: {json.dumps({'type': event_type, 'content': content}, ensure_ascii=False)}\n\n"
+                # 发送 SSE 事件（附带 count / truncated 等元数据）
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
                 
                 # 收集结果
                 if event_type == "sql":
                     sql_result = content
                 elif event_type == "data":
                     data_result = content
+                elif event_type == "data_complete":
+                    data_complete = event
                 elif event_type == "chart":
                     chart_result = content
                 elif event_type == "answer":
@@ -95,7 +127,7 @@ async def chat_query(body: ChatQueryRequest):
                 role="assistant",
                 content=answer_result,
                 sql=sql_result,
-                data=data_result,
+                data=await _persisted_data(data_result, data_complete),
                 chart=chart_result
             )
             
@@ -148,7 +180,8 @@ async def chat_query_sync(body: ChatQueryRequest):
             "sql": result.sql,
             "data": result.data,
             "chart": result.chart_config,
-            "answer": result.answer
+            "answer": result.answer,
+            "truncated": result.truncated,
         }
         
     except Exception as e:
@@ -156,3 +189,16 @@ async def chat_query_sync(body: ChatQueryRequest):
             "success": False,
             "error": str(e)
         }
+
+
+@router.get("/results/{result_id}")
+async def get_result_page(result_id: str, offset: int = 0, limit: Optional[int] = None):
+    """
+    分页获取查询结果
+    
+    结果来自查询时写入的溢出文件，不会重新执行 SQL
+    """
+    page = await result_store.page(result_id, offset=offset, limit=limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+    return page
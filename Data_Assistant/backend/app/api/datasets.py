@@ -0,0 +1,56 @@
+"""
+数据集 API 路由
+"""
+
+from fastapi import APIRouter, HTTPException, Request
+from typing import Optional
+
+from app.db.ingest import dataset_loader, IngestError, FORMATS
+
+
+router = APIRouter(prefix="/api/datasets", tags=["Datasets"])
+
+# Content-Type 与导入格式的对应
+_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/json-lines": "ndjson",
+}
+
+
+@router.post("/{table_name}")
+async def upload_dataset(
+    table_name: str,
+    request: Request,
+    format: Optional[str] = None,
+    indexes: Optional[str] = None,
+    transaction_rows: Optional[int] = None,
+):
+    """
+    上传数据集并导入到指定表
+
+    请求体为 CSV（首行为表头）或 NDJSON 原始内容，边接收边写入；
+    format 缺省时按 Content-Type 判断，indexes 为导入后建索引的列（逗号分隔）。
+    返回导入行数、耗时与每秒行数。
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        format = _CONTENT_TYPES.get(content_type, "csv")
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    index_columns = [c.strip() for c in indexes.split(",") if c.strip()] if indexes else None
+
+    try:
+        report = await dataset_loader.load(
+            table_name,
+            request.stream(),
+            fmt=format,
+            indexes=index_columns,
+            transaction_rows=transaction_rows,
+        )
+    except IngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return report.to_dict()
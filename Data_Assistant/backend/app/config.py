@@ -13,9 +13,132 @@ class Settings(BaseSettings):
     # 阿里云百炼 API 配置
     dashscope_api_key: Optional[str] = None
     
+    # LLM HTTP 客户端：进程内共享连接池（安装 h2 时启用 HTTP/2）
+    llm_http2: bool = True
+    llm_max_connections: int = 20
+    llm_max_keepalive: int = 10
+    llm_keepalive_expiry: float = 60.0
+    llm_connect_timeout: float = 5.0
+    llm_read_timeout: float = 60.0
+    llm_write_timeout: float = 10.0
+    llm_pool_timeout: float = 10.0
+    
+    # LLM 调用弹性：429 / 5xx 与网络错误的重试次数与退避（秒）；
+    # 等待超过端点最近延迟的分位数时发出对冲请求（样本数达到下限后生效）；连续失败达到阈值时熔断
+    llm_retry_max: int = 3
+    llm_retry_base_delay: float = 0.5
+    llm_retry_max_delay: float = 8.0
+    llm_hedge_enabled: bool = True
+    llm_hedge_percentile: float = 0.95
+    llm_hedge_min_samples: int = 20
+    llm_latency_window: int = 200
+    llm_breaker_failures: int = 5
+    llm_breaker_reset_seconds: float = 30.0
+    
     # 数据库配置
     database_url: str = "sqlite+aiosqlite:///./data/app.db"
     
+    # 连接池配置
+    db_pool_readers: int = 4
+    db_pool_writers: int = 1
+    db_pool_timeout: float = 10.0
+    
+    # 存储模式：wal 为读写分离（只读连接 + 单写任务），delete 为默认回滚日志
+    db_journal_mode: str = "wal"
+    db_synchronous: str = "NORMAL"
+    db_mmap_size: int = 268435456
+    db_cache_size: int = -65536
+    db_busy_timeout: int = 5000
+    
+    # 查询结果上限（超出部分截断）
+    query_max_rows: int = 10000
+    query_max_bytes: int = 8 * 1024 * 1024
+    query_batch_size: int = 500
+    
+    # 查询看门狗：时限（秒）与 VM 指令数预算，0 表示不限
+    query_timeout_seconds: float = 15.0
+    query_max_vm_steps: int = 0
+    query_progress_interval: int = 10000
+    
+    # 结果分页：首屏行数、溢出文件目录（默认系统临时目录）、句柄有效期
+    result_page_size: int = 100
+    result_spill_dir: Optional[str] = None
+    result_ttl_seconds: int = 1800
+    result_max_handles: int = 200
+    
+    # 查询结果缓存：按规范化 SQL 与表版本缓存，条目数与字节数上限
+    result_cache_enabled: bool = True
+    result_cache_max_entries: int = 256
+    result_cache_max_bytes: int = 64 * 1024 * 1024
+    
+    # 预聚合表：按常用维度组合维护汇总表，聚合查询透明改写
+    rollup_enabled: bool = True
+    
+    # 向量化聚合引擎（需安装 numpy）：加载为列数组的表、启用的最小行数、
+    # 快照的最大行数与估算内存上限（字节）
+    vector_engine_enabled: bool = False
+    vector_engine_tables: str = "sales"
+    vector_engine_min_rows: int = 1_000_000
+    vector_engine_max_rows: int = 50_000_000
+    vector_engine_max_bytes: int = 2 * 1024 ** 3
+    
+    # NL→SQL 缓存：规范化问题 + 表结构指纹 → 函数调用参数
+    sql_cache_enabled: bool = True
+    sql_cache_ttl_seconds: int = 7 * 24 * 3600
+    sql_cache_max_entries: int = 5000
+    
+    # 请求合并：相同问题（规范化后、同一表结构）同时在处理时只计算一次
+    singleflight_enabled: bool = True
+    
+    # 流式生成 SQL：边接收函数调用参数边下发 SQL，sql 字段完整即开始执行
+    sql_stream_enabled: bool = True
+    
+    # 图表推荐：常见结果形态按规则在本地生成，规则无法确定时调用 LLM
+    chart_rules_enabled: bool = True
+    # 结构化回答：规则无法确定图表时，由一次流式调用同时返回图表规格与回答（省去单独的图表推荐调用）
+    structured_answer_enabled: bool = False
+    
+    # 回答摘要（需安装 numpy）：在全部结果上计算合计、占比、最高 / 最低等写入回答提示词，及每项列出的条数
+    answer_digest_enabled: bool = True
+    answer_digest_top_k: int = 5
+    
+    # 相似问题检索：历史问答对的字符 n-gram TF-IDF 索引；
+    # 相似度达到复用阈值时复用 SQL，达到示例阈值时作为少样本示例注入提示词
+    question_index_enabled: bool = True
+    question_index_max_pairs: int = 5000
+    question_match_reuse: float = 0.85
+    question_match_fewshot: float = 0.3
+    question_match_examples: int = 3
+    
+    # 查询计划检查：off / warn / reject / rewrite，及全表扫描、嵌套扫描的行数阈值
+    query_gate_mode: str = "warn"
+    query_gate_scan_rows: int = 1_000_000
+    query_gate_nested_rows: int = 10_000_000
+    
+    # 索引建议：同一查询形态出现次数、表行数达到阈值后建议覆盖索引，可选自动创建
+    index_advisor_enabled: bool = True
+    index_advisor_min_hits: int = 3
+    index_advisor_min_rows: int = 10000
+    index_advisor_auto_create: bool = False
+    
+    # Schema 链接：表数超过阈值时按问题只向模型提供最相关的若干张表
+    schema_link_enabled: bool = True
+    schema_link_min_tables: int = 8
+    schema_link_top_k: int = 5
+    
+    # 列画像：采样行数上限、每列展示的高频取值数、按枚举展示的最大不同值数、
+    # 表写入后 rowid 范围变化超过该比例才重新采样
+    profile_enabled: bool = True
+    profile_sample_rows: int = 20000
+    profile_top_k: int = 8
+    profile_max_distinct: int = 30
+    profile_refresh_ratio: float = 0.1
+    
+    # 批量导入：类型推断采样行数、每次 executemany 的行数、每个写事务的行数
+    ingest_sample_rows: int = 1000
+    ingest_chunk_rows: int = 5000
+    ingest_transaction_rows: int = 100000
+    
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -3,12 +3,29 @@
 集成 LLM + 数据库 + 图表推荐
 """
 
+import asyncio
 import json
-from typing import AsyncGenerator, Dict, Any, List, Optional
+import logging
+from typing import AsyncGenerator, Dict, Any, List, Optional, Tuple
 from dataclasses import dataclass
 
+from app.config import settings
+from app.core import chart_rules
+from app.core.executor import StageExecutor
 from app.core.llm import Qwen3LLM, ToolCall
-from app.db.sqlite_manager import SQLiteManager
+from app.core.schema_linker import SchemaLinker, schema_linker
+from app.core.singleflight import Singleflight, singleflight
+from app.core.summarizer import summarize
+from app.db.query_plan import QueryPlanGate, IndexAdvisor, plan_gate, index_advisor
+from app.db.result import Columnar, ResultSet
+from app.db.result_store import ResultStore, result_store
+from app.db.sqlite_manager import QueryCancelledError, SQLiteManager, db as shared_db
+from app.memory.question_index import QuestionIndex, question_index
+from app.memory.sql_cache import SQLCache, sql_cache
+from app.utils.metrics import metrics
+from app.utils.text import normalize_question
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -18,6 +35,7 @@ class QueryResult:
     data: List[Dict[str, Any]]
     chart_config: Optional[Dict[str, Any]]
     answer: str
+    truncated: bool = False
 
 
 class DataAnalysisAgent:
@@ -27,9 +45,159 @@ class DataAnalysisAgent:
         self,
         llm: Optional[Qwen3LLM] = None,
         db: Optional[SQLiteManager] = None,
+        results: Optional[ResultStore] = None,
     ):
         self.llm = llm or Qwen3LLM()
-        self.db = db or SQLiteManager()
+        # 默认与全局实例共享连接池
+        self.db = db or shared_db
+        self.results = results or result_store
+        if self.db is shared_db:
+            self.plan_gate = plan_gate
+            self.index_advisor = index_advisor
+            self.schema_linker = schema_linker
+            self.sql_cache = sql_cache
+            self.question_index = question_index
+            self.flights = singleflight
+        else:
+            self.plan_gate = QueryPlanGate(self.db)
+            self.index_advisor = IndexAdvisor(self.db, self.plan_gate)
+            self.schema_linker = SchemaLinker(self.db)
+            self.sql_cache = SQLCache(self.db)
+            self.question_index = QuestionIndex(self.db)
+            self.flights = Singleflight()
+    
+    async def _flight_key(self, kind: str, question: str) -> str:
+        """请求合并键：规范化问题 + 表结构指纹"""
+        return f"{kind}:{await self.db.schema_fingerprint()}:{normalize_question(question)}"
+    
+    async def _lookup_sql(self, question: str) -> Tuple[Optional[Dict[str, Any]], str, List[Any]]:
+        """
+        依次尝试 SQL 缓存与相似问题复用
+        
+        Returns:
+            (函数调用参数, 来源 cache / reuse / llm, 少样本示例)，未命中时参数为 None
+        """
+        arguments = await self.sql_cache.get(question)
+        if arguments is not None:
+            return arguments, "cache", []
+        
+        match = await self.question_index.match(question)
+        if match.sql:
+            if match.substituted:
+                values = "，".join(f"{old} → {new}" for old, new in match.substituted.items())
+                reason = f"复用相似问题「{match.source.question}」的 SQL（替换取值: {values}）"
+            else:
+                reason = f"复用相似问题「{match.source.question}」的 SQL"
+            return {"sql": match.sql, "reason": reason}, "reuse", []
+        return None, "llm", match.examples
+    
+    async def _resolve_sql(self, question: str) -> Tuple[Dict[str, Any], str]:
+        """
+        依次尝试 SQL 缓存、相似问题复用与 LLM 生成
+        
+        Returns:
+            (函数调用参数, 来源 cache / reuse / llm)
+        """
+        arguments, source, examples = await self._lookup_sql(question)
+        if arguments is not None:
+            return arguments, source
+        
+        schema = await self.schema_linker.schema_for(question)
+        tool_call = await self.llm.generate_sql_with_tool(question, schema, examples=examples)
+        return tool_call.function_arguments, "llm"
+    
+    async def _finish_tool_call(self, stream: AsyncGenerator[Tuple[str, Any], None]) -> Dict[str, Any]:
+        """接收流式函数调用的剩余部分（reason 等），返回完整参数"""
+        async for kind, value in stream:
+            if kind == "tool_call":
+                return value.function_arguments
+        return {}
+    
+    async def _remember(self, question: str, arguments: Optional[Dict[str, Any]], source: str):
+        """SQL 执行成功后写入 SQL 缓存与相似问题索引"""
+        if not arguments or source == "cache":
+            return
+        await self.sql_cache.put(question, arguments)
+        if source == "llm" and settings.question_index_enabled:
+            self.question_index.add(question, arguments.get("sql", ""))
+    
+    def _rule_chart(self, data: List[Dict[str, Any]], question: str) -> Optional[Dict[str, Any]]:
+        """按规则在本地推荐图表，规则无法确定或未开启时返回 None"""
+        if not data or not settings.chart_rules_enabled:
+            return None
+        chart = chart_rules.recommend(data, question)
+        if chart is not None:
+            metrics.incr("chart.rules")
+        return chart
+    
+    def _bind_chart(self, spec: Any, data: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """用完整结果在本地绑定 LLM 返回的图表规格"""
+        chart = chart_rules.bind(spec, data)
+        if chart is None:
+            metrics.incr("chart.invalid_spec")
+            raise ValueError(f"图表规格无效: {spec}")
+        return chart
+    
+    async def _recommend_chart(self, data: List[Dict[str, Any]], question: str, sql: str) -> Dict[str, Any]:
+        """
+        调用 LLM 推荐图表
+        
+        LLM 只返回图表规格，ECharts 配置由完整结果在本地生成
+        """
+        metrics.incr("chart.llm")
+        spec = await self.llm.recommend_chart(data, question, sql)
+        return self._bind_chart(spec, data)
+    
+    async def _analyze(self, question: str, sql: str, result: ResultSet) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        推荐图表并生成回答
+        
+        规则能确定图表时直接输出；否则默认并发调用图表推荐与回答生成，
+        开启结构化模式时由一次流式调用同时返回图表规格与回答
+        
+        Yields:
+            chart / answer_chunk 事件
+        """
+        data = result.rows
+        digest = summarize(result.data, result.truncated)
+        chart = self._rule_chart(data, question)
+        if chart is not None:
+            yield {"type": "chart", "content": chart}
+        structured = bool(data) and chart is None and settings.structured_answer_enabled
+        
+        async with StageExecutor() as stages:
+            if structured:
+                metrics.incr("chart.structured")
+                stages.run("answer", self.llm.generate_chart_and_answer(
+                    question, sql, data, truncated=result.truncated, digest=digest,
+                ))
+            else:
+                if data and chart is None:
+                    stages.run("chart", self._recommend_chart(data, question, sql))
+                stages.run("answer", self.llm.generate_answer(
+                    question, sql, data, truncated=result.truncated, digest=digest,
+                ))
+            async for event in stages.events():
+                if event.stage == "chart":
+                    if event.error:
+                        logger.warning("chart recommendation failed", exc_info=event.error)
+                    else:
+                        yield {"type": "chart", "content": event.value}
+                elif event.error:
+                    raise event.error
+                elif event.done:
+                    continue
+                elif not structured:
+                    yield {"type": "answer_chunk", "content": event.value}
+                else:
+                    kind, value = event.value
+                    if kind == "answer":
+                        yield {"type": "answer_chunk", "content": value}
+                    elif value is not None:
+                        try:
+                            yield {"type": "chart", "content": self._bind_chart(value, data)}
+                        except ValueError:
+                            logger.warning("chart spec binding failed", exc_info=True)
     
     async def process_query(
         self,
@@ -48,19 +216,48 @@ class DataAnalysisAgent:
         Returns:
             查询结果
         """
-        # 1. 获取数据库 Schema
-        schema = await self.db.get_schema()
-        
-        # 2. 生成 SQL
+        if not settings.singleflight_enabled:
+            return await self._process_query(question, use_tool)
+        # 相同问题同时在处理时共享同一次计算
+        key = await self._flight_key(f"sync-{int(use_tool)}", question)
+        return await self.flights.call(key, lambda: self._process_query(question, use_tool))
+    
+    async def _process_query(self, question: str, use_tool: bool) -> QueryResult:
+        # 1-2. 命中 SQL 缓存或相似问题时跳过 LLM，否则获取与问题相关的 Schema 并生成 SQL
+        arguments, source = None, "llm"
         if use_tool:
-            tool_call = await self.llm.generate_sql_with_tool(question, schema)
-            sql = tool_call.function_arguments.get("sql", "")
+            arguments, source = await self._resolve_sql(question)
+            sql = arguments.get("sql", "")
         else:
+            schema = await self.schema_linker.schema_for(question)
             sql = await self.llm.generate_sql(question, schema)
         
-        # 3. 执行 SQL
+        # 3. 能由预聚合表回答的查询改写为读取汇总表，否则检查查询计划
+        rollup = await self.db.rollups.rewrite(sql)
+        exec_sql = rollup[0] if rollup else sql
+        if not rollup:
+            verdict = await self.plan_gate.check(sql)
+            if verdict.action == "reject":
+                return QueryResult(
+                    sql=sql,
+                    data=[],
+                    chart_config=None,
+                    answer=f"查询代价过高，已拒绝执行: {verdict.message}"
+                )
+            sql = exec_sql = verdict.sql
+        
+        # 4. 执行 SQL（结果超过上限时截断）
         try:
-            data = await self.db.execute_query(sql)
+            result = await self.db.execute_query_bounded(exec_sql)
+            data = result.rows
+        except QueryCancelledError as e:
+            # 超时或超出步数预算被看门狗中断
+            return QueryResult(
+                sql=sql,
+                data=[],
+                chart_config=None,
+                answer=str(e)
+            )
         except Exception as e:
             # SQL 执行失败，返回错误信息
             return QueryResult(
@@ -69,26 +266,26 @@ class DataAnalysisAgent:
                 chart_config=None,
                 answer=f"SQL 执行失败: {str(e)}"
             )
+        if not rollup:
+            await self.index_advisor.observe(sql)
+        await self._remember(question, arguments, source)
         
-        # 4. 推荐图表
+        # 5-6. 推荐图表与生成回答（两者只依赖问题、SQL 与数据）
         chart_config = None
-        if data:
-            try:
-                chart_config = await self.llm.recommend_chart(data, question, sql)
-            except Exception as e:
-                print(f"Chart recommendation failed: {e}")
-        
-        # 5. 生成回答
         answer_parts = []
-        async for chunk in self.llm.generate_answer(question, sql, data):
-            answer_parts.append(chunk)
+        async for event in self._analyze(question, sql, result):
+            if event["type"] == "chart":
+                chart_config = event["content"]
+            else:
+                answer_parts.append(event["content"])
         answer = "".join(answer_parts)
         
         return QueryResult(
             sql=sql,
             data=data,
             chart_config=chart_config,
-            answer=answer
+            answer=answer,
+            truncated=result.truncated,
         )
     
     async def stream_process_query(
@@ -102,16 +299,58 @@ class DataAnalysisAgent:
         Yields:
             SSE 格式的事件
         """
-        # 1. 获取 Schema
-        schema = await self.db.get_schema()
-        
-        # 2. 生成 SQL (使用函数调用)
+        if not settings.singleflight_enabled:
+            async for event in self._stream_query(question):
+                yield event
+            return
+        # 相同问题同时在处理时，后到的请求重放已产生的事件并接收后续事件
+        key = await self._flight_key("stream", question)
+        events = self.flights.stream(key, lambda: self._stream_query(question))
+        try:
+            async for event in events:
+                yield event
+        finally:
+            # 客户端断开时退订，最后一个订阅者退订时停止计算
+            await events.aclose()
+    
+    async def _stream_query(self, question: str) -> AsyncGenerator[Dict[str, Any], None]:
+        pending: List[AsyncGenerator] = []
+        try:
+            async for event in self._stream_process(question, pending):
+                yield event
+        finally:
+            # 提前结束或客户端断开时关闭未读完的 LLM 流
+            for stream in pending:
+                await stream.aclose()
+    
+    async def _stream_process(self, question: str, pending: List[AsyncGenerator]) -> AsyncGenerator[Dict[str, Any], None]:
+        # 1-2. 命中 SQL 缓存或相似问题时跳过 LLM，否则获取与问题相关的 Schema 并生成 SQL (使用函数调用)
         yield {"type": "status", "content": "正在分析问题..."}
         
+        rest: Optional[AsyncGenerator] = None
         try:
-            tool_call = await self.llm.generate_sql_with_tool(question, schema)
-            sql = tool_call.function_arguments.get("sql", "")
-            reason = tool_call.function_arguments.get("reason", "")
+            arguments, source, examples = await self._lookup_sql(question)
+            if arguments is None and settings.sql_stream_enabled:
+                # 流式生成：边接收边下发 SQL，sql 字段完整即开始执行，reason 在查询完成后读取
+                schema = await self.schema_linker.schema_for(question)
+                stream = self.llm.stream_sql_with_tool(question, schema, examples=examples)
+                async for kind, value in stream:
+                    if kind == "sql_partial":
+                        yield {"type": "sql_partial", "content": value}
+                    elif kind == "sql":
+                        arguments = {"sql": value}
+                        rest = stream
+                        pending.append(stream)
+                        break
+                    else:
+                        arguments = value.function_arguments
+                        break
+            elif arguments is None:
+                schema = await self.schema_linker.schema_for(question)
+                tool_call = await self.llm.generate_sql_with_tool(question, schema, examples=examples)
+                arguments = tool_call.function_arguments
+            sql = arguments.get("sql", "")
+            reason = arguments.get("reason", "")
             
             yield {"type": "sql", "content": sql}
             if reason:
@@ -121,32 +360,121 @@ class DataAnalysisAgent:
             yield {"type": "error", "content": f"SQL 生成失败: {str(e)}"}
             return
         
-        # 3. 执行 SQL
+        # 3. 能由预聚合表回答的查询改写为读取汇总表，否则检查查询计划
+        rollup = await self.db.rollups.rewrite(sql)
+        exec_sql = rollup[0] if rollup else sql
+        if not rollup:
+            verdict = await self.plan_gate.check(sql)
+            if verdict.action == "reject":
+                yield {"type": "error", "content": f"查询代价过高，已拒绝执行: {verdict.message}", "code": "query_rejected"}
+                return
+            if verdict.action == "rewrite":
+                sql = exec_sql = verdict.sql
+                yield {"type": "sql", "content": sql}
+            if verdict.issues:
+                yield {"type": "warning", "content": verdict.message}
+        
+        # 4. 执行 SQL
         yield {"type": "status", "content": "正在查询数据..."}
         
-        try:
-            data = await self.db.execute_query(sql)
-            yield {"type": "data", "content": data, "count": len(data)}
-        except Exception as e:
-            yield {"type": "error", "content": f"SQL 执行失败: {str(e)}"}
-            return
+        # 首页结果就绪即下发，完整结果写入溢出文件，前端通过 result_id 分页读取
+        page_size = settings.result_page_size
+        preview: Optional[Columnar] = None
+        handle = None
+        first_page_ready = asyncio.Event()
         
-        # 4. 推荐图表
-        if data:
-            yield {"type": "status", "content": "正在分析图表..."}
+        async def spill(batch: Columnar):
+            nonlocal handle, preview
+            if handle is None:
+                handle = await self.results.create(batch.columns, batch.types)
+                preview = Columnar(batch.columns)
+            await self.results.append(handle, batch)
+            preview.extend(batch.slice(0, page_size - len(preview)))
+            if handle.count > page_size:
+                first_page_ready.set()
+        
+        query_task = asyncio.create_task(self.db.execute_query_bounded(exec_sql, on_batch=spill))
+        waiter = asyncio.create_task(first_page_ready.wait())
+        finished = False
+        try:
+            await asyncio.wait({query_task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            
+            page_sent = False
+            if first_page_ready.is_set():
+                yield {
+                    "type": "data",
+                    "content": preview.to_dict(),
+                    "format": "columnar",
+                    "count": len(preview),
+                    "result_id": handle.id,
+                    "offset": 0,
+                    "has_more": True,
+                }
+                page_sent = True
+            
             try:
-                chart_config = await self.llm.recommend_chart(data, question, sql)
-                yield {"type": "chart", "content": chart_config}
+                result = await query_task
             except Exception as e:
-                print(f"Chart recommendation failed: {e}")
+                if isinstance(e, QueryCancelledError):
+                    yield {"type": "error", "content": str(e), "code": "query_cancelled", "reason": e.reason}
+                else:
+                    yield {"type": "error", "content": f"SQL 执行失败: {str(e)}"}
+                return
+            
+            if handle is None:
+                handle = await self.results.create(result.columns, result.data.types)
+            self.results.finish(handle, result.truncated, result.truncate_reason, result.data.types)
+            finished = True
+        finally:
+            # 查询失败、客户端断开或被取消：停止查询并删除未完成的溢出文件
+            waiter.cancel()
+            if not finished:
+                query_task.cancel()
+                await asyncio.wait({query_task})
+                if handle is not None:
+                    await self.results.discard(handle.id)
         
-        # 5. 流式生成回答
+        if not page_sent:
+            yield {
+                "type": "data",
+                "content": result.data.slice(0, page_size).to_dict(),
+                "format": "columnar",
+                "count": min(len(result), page_size),
+                "result_id": handle.id,
+                "offset": 0,
+                "has_more": len(result) > page_size,
+            }
+        yield {
+            "type": "data_complete",
+            "content": None,
+            "result_id": handle.id,
+            "total": len(result),
+            "truncated": result.truncated,
+            "truncate_reason": result.truncate_reason,
+        }
+        data = result.rows
+        if not rollup:
+            await self.index_advisor.observe(sql)
+        if rest is not None:
+            # 查询期间已到达的 reason
+            try:
+                arguments = {**await self._finish_tool_call(rest), **arguments}
+            except Exception:
+                logger.warning("tool call stream failed", exc_info=True)
+            if arguments.get("reason"):
+                yield {"type": "reason", "content": arguments["reason"]}
+        await self._remember(question, arguments, source)
+        
+        # 5-6. 推荐图表与流式生成回答：回答片段边生成边输出，图表完成时立即输出
+        if data:
+            yield {"type": "status", "content": "正在分析图表..."}
         yield {"type": "status", "content": "正在生成回答..."}
         
         answer_parts = []
-        async for chunk in self.llm.generate_answer(question, sql, data):
-            answer_parts.append(chunk)
-            yield {"type": "answer_chunk", "content": chunk}
+        async for event in self._analyze(question, sql, result):
+            if event["type"] == "answer_chunk":
+                answer_parts.append(event["content"])
+            yield event
         
         yield {"type": "answer", "content": "".join(answer_parts)}
         yield {"type": "done", "content": None}
@@ -0,0 +1,296 @@
+"""
+规则图表推荐模块
+按结果列的类型（时间 / 分类 / 数值）与基数选择图表，并用全部结果行在本地生成 ECharts 配置；
+规则无法确定时返回 None，由调用方回退到 LLM 推荐。LLM 只返回紧凑的图表规格，同样在本地绑定数据
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Sequence
+
+# 文本时间取值：年、年-月、日期、日期时间、季度
+_TEMPORAL_RE = re.compile(
+    r"^\d{4}(-\d{2}(-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?)?|/\d{2}/\d{2}|-?Q[1-4])?$"
+)
+_TEMPORAL_NAME_RE = re.compile(r"(date|time|day|month|year|week|quarter|period|日期|时间|年|月|周|季度)", re.I)
+_ID_NAME_RE = re.compile(r"(^id$|_id$|^id_|编号)", re.I)
+_SHARE_RE = re.compile(r"(占比|比例|份额|构成|分布|百分比|share|proportion|percent|ratio|breakdown)", re.I)
+
+CHART_TYPES = ("bar", "line", "pie", "scatter", "radar")
+
+# 规则阈值
+PIE_MAX_SLICES = 10
+SERIES_MAX = 10
+MEASURES_MAX = 4
+ZOOM_MIN_CATEGORIES = 20
+
+
+@dataclass
+class FieldProfile:
+    """结果列画像"""
+    name: str
+    kind: str  # temporal / categorical / numeric / empty
+    distinct: int
+    non_negative: bool = True
+
+
+@dataclass
+class ChartSpec:
+    """
+    紧凑图表规格
+
+    chart_type 为 bar / line / pie / scatter / radar；x 为类目（或散点的横轴数值）字段，
+    y 为度量字段，series 为按取值拆分系列的字段
+    """
+    chart_type: str
+    x: str
+    y: List[str] = field(default_factory=list)
+    series: Optional[str] = None
+    title: str = ""
+    summary: str = ""
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def classify_column(name: str, values: Sequence[Any]) -> FieldProfile:
+    """按一列的全部取值推断类型（temporal / categorical / numeric / empty）与基数"""
+    values = [v for v in values if v is not None]
+    distinct = len(set(values))
+    if not values:
+        return FieldProfile(name, "empty", 0)
+    if all(_is_number(v) for v in values):
+        # 四位整数且列名像年份时视为时间
+        if _TEMPORAL_NAME_RE.search(name) and all(isinstance(v, int) and 1900 <= v <= 2100 for v in values):
+            return FieldProfile(name, "temporal", distinct)
+        return FieldProfile(name, "numeric", distinct, all(v >= 0 for v in values))
+    if all(isinstance(v, str) and _TEMPORAL_RE.match(v) for v in values):
+        return FieldProfile(name, "temporal", distinct)
+    return FieldProfile(name, "categorical", distinct)
+
+
+def is_measure(profile: FieldProfile) -> bool:
+    """数值列且不像编号"""
+    return profile.kind == "numeric" and not _ID_NAME_RE.search(profile.name)
+
+
+def profile_fields(data: List[Dict[str, Any]]) -> List[FieldProfile]:
+    """按全部结果行推断各列的类型与基数"""
+    if not data:
+        return []
+    return [classify_column(name, [row.get(name) for row in data]) for name in data[0].keys()]
+
+
+def _title(question: str) -> str:
+    return question.strip().rstrip("？?。.!！") or "数据可视化"
+
+
+def choose_spec(data: List[Dict[str, Any]], question: str = "") -> Optional[ChartSpec]:
+    """
+    按规则选择图表规格
+
+    - 时间 + 度量：折线图（另有低基数分类列且只有一个度量时按该列拆分系列）
+    - 分类 + 度量：柱状图；问题询问占比且类目较少、取值非负时为饼图
+    - 两个分类 + 一个度量：按第二个分类拆分系列的柱状图
+    - 只有两个数值列：散点图
+
+    Returns:
+        图表规格，规则无法确定时返回 None
+    """
+    profiles = profile_fields(data)
+    if len(data) < 2 or not profiles:
+        return None
+    measures = [p for p in profiles if is_measure(p)]
+    temporal = [p for p in profiles if p.kind == "temporal"]
+    categorical = [p for p in profiles if p.kind == "categorical"]
+    title = _title(question)
+    if not measures or len(measures) > MEASURES_MAX:
+        return None
+
+    if len(temporal) == 1 and len(categorical) <= 1:
+        x = temporal[0].name
+        if categorical:
+            if len(measures) != 1 or categorical[0].distinct > SERIES_MAX:
+                return None
+            return ChartSpec("line", x, [measures[0].name], categorical[0].name, title,
+                             f"按 {categorical[0].name} 拆分的 {measures[0].name} 随 {x} 的变化趋势")
+        if temporal[0].distinct < len(data):
+            return None
+        return ChartSpec("line", x, [m.name for m in measures], None, title,
+                         f"{'、'.join(m.name for m in measures)} 随 {x} 的变化趋势")
+
+    if temporal:
+        return None
+
+    if len(categorical) == 1:
+        x = categorical[0]
+        if x.distinct < len(data):
+            # 类目重复且没有拆分依据
+            return None
+        if len(measures) == 1 and _SHARE_RE.search(question) and len(data) <= PIE_MAX_SLICES and measures[0].non_negative:
+            return ChartSpec("pie", x.name, [measures[0].name], None, title,
+                             f"各 {x.name} 的 {measures[0].name} 占比")
+        return ChartSpec("bar", x.name, [m.name for m in measures], None, title,
+                         f"按 {x.name} 比较 {'、'.join(m.name for m in measures)}")
+
+    if len(categorical) == 2 and len(measures) == 1:
+        # 低基数的一列拆分系列，另一列作为类目轴
+        first, second = sorted(categorical, key=lambda p: -p.distinct)
+        if second.distinct > SERIES_MAX:
+            return None
+        return ChartSpec("bar", first.name, [measures[0].name], second.name, title,
+                         f"按 {first.name} 与 {second.name} 比较 {measures[0].name}")
+
+    if not categorical and len(measures) == 2 and len(profiles) == 2:
+        return ChartSpec("scatter", measures[0].name, [measures[1].name], None, title,
+                         f"{measures[0].name} 与 {measures[1].name} 的关系")
+    return None
+
+
+def _ordered(values) -> List[Any]:
+    return list(dict.fromkeys(values))
+
+
+def build_option(spec: ChartSpec, data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """用全部结果行生成 ECharts 配置"""
+    option: Dict[str, Any] = {"title": {"text": spec.title}, "tooltip": {}}
+
+    if spec.chart_type == "pie":
+        measure = spec.y[0]
+        option["tooltip"] = {"trigger": "item"}
+        option["legend"] = {"type": "scroll", "bottom": 0}
+        option["series"] = [{
+            "name": measure,
+            "type": "pie",
+            "radius": "60%",
+            "data": [{"name": str(row.get(spec.x)), "value": row.get(measure)} for row in data],
+        }]
+        return option
+
+    if spec.chart_type == "scatter":
+        option["xAxis"] = {"type": "value", "name": spec.x, "scale": True}
+        option["yAxis"] = {"type": "value", "name": spec.y[0], "scale": True}
+        option["series"] = [{
+            "name": spec.y[0],
+            "type": "scatter",
+            "data": [[row.get(spec.x), row.get(spec.y[0])] for row in data],
+        }]
+        return option
+
+    if spec.chart_type == "radar":
+        # x 的每个取值为一个系列，各度量为雷达指标
+        maxima = {m: max((row.get(m) for row in data if _is_number(row.get(m))), default=0) for m in spec.y}
+        option["legend"] = {"type": "scroll", "bottom": 0}
+        option["radar"] = {"indicator": [{"name": m, "max": maxima[m] or 1} for m in spec.y]}
+        option["series"] = [{
+            "type": "radar",
+            "data": [{"name": str(row.get(spec.x)), "value": [row.get(m) for m in spec.y]} for row in data],
+        }]
+        return option
+
+    rows = data
+    if spec.chart_type == "line":
+        # 时间轴按取值排序（ISO 格式的文本排序即时间顺序）
+        rows = sorted(data, key=lambda row: (row.get(spec.x) is None, str(row.get(spec.x))))
+    categories = _ordered(row.get(spec.x) for row in rows)
+
+    if spec.series:
+        measure = spec.y[0]
+        cells = {(row.get(spec.x), row.get(spec.series)): row.get(measure) for row in rows}
+        series = [
+            {
+                "name": str(name),
+                "type": spec.chart_type,
+                "data": [cells.get((category, name)) for category in categories],
+            }
+            for name in _ordered(row.get(spec.series) for row in rows)
+        ]
+    else:
+        positions = {category: i for i, category in enumerate(categories)}
+        series = []
+        for measure in spec.y:
+            values: List[Any] = [None] * len(categories)
+            for row in rows:
+                values[positions[row.get(spec.x)]] = row.get(measure)
+            series.append({"name": measure, "type": spec.chart_type, "data": values})
+
+    if spec.chart_type == "line":
+        for item in series:
+            item["connectNulls"] = True
+    option["tooltip"] = {"trigger": "axis"}
+    option["xAxis"] = {"type": "category", "name": spec.x, "data": [str(c) for c in categories]}
+    option["yAxis"] = {"type": "value", "name": spec.y[0] if len(spec.y) == 1 else ""}
+    option["series"] = series
+    if len(series) > 1:
+        option["legend"] = {"type": "scroll", "top": 28}
+    if len(categories) > ZOOM_MIN_CATEGORIES:
+        option["dataZoom"] = [{"type": "inside"}, {"type": "slider"}]
+    return option
+
+
+def recommend(data: List[Dict[str, Any]], question: str = "") -> Optional[Dict[str, Any]]:
+    """
+    规则推荐图表
+
+    Returns:
+        与 LLM 推荐相同格式的 {"chart_type", "echarts_option", "summary"}，规则无法确定时返回 None
+    """
+    spec = choose_spec(data, question)
+    if spec is None:
+        return None
+    return {
+        "chart_type": spec.chart_type,
+        "echarts_option": build_option(spec, data),
+        "summary": spec.summary,
+    }
+
+
+def spec_from_payload(payload: Dict[str, Any], data: List[Dict[str, Any]]) -> Optional[ChartSpec]:
+    """
+    校验 LLM 返回的图表规格
+
+    类型须受支持，字段须来自结果列，y 至少包含一个字段；不合法时返回 None
+    """
+    if not data or not isinstance(payload, dict):
+        return None
+    columns = list(data[0].keys())
+    chart_type = str(payload.get("chart_type") or "").lower()
+    x = payload.get("x")
+    y = payload.get("y")
+    if isinstance(y, str):
+        y = [y]
+    series = payload.get("series") or None
+    if chart_type not in CHART_TYPES or x not in columns or not isinstance(y, list):
+        return None
+    y = [field_name for field_name in y if field_name in columns and field_name != x]
+    if not y or (series is not None and (series not in columns or series in y or series == x)):
+        return None
+    if chart_type in ("pie", "scatter"):
+        y = y[:1]
+        series = None
+    if chart_type == "radar":
+        series = None
+    title = str(payload.get("title") or "") or "数据可视化"
+    return ChartSpec(chart_type, x, y, series, title, str(payload.get("summary") or ""))
+
+
+def bind(payload: Dict[str, Any], data: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    用全部结果行绑定 LLM 返回的图表规格
+
+    已包含 echarts_option 的旧格式原样返回
+
+    Returns:
+        {"chart_type", "echarts_option", "summary"}，规格不合法时返回 None
+    """
+    if isinstance(payload, dict) and "echarts_option" in payload:
+        return payload
+    spec = spec_from_payload(payload, data)
+    if spec is None:
+        return None
+    return {
+        "chart_type": spec.chart_type,
+        "echarts_option": build_option(spec, data),
+        "summary": spec.summary,
+    }
@@ -0,0 +1,97 @@
+"""
+阶段执行器模块
+并发运行互不依赖的阶段（如图表推荐与回答生成），按产生顺序合并各阶段的输出；
+退出时取消仍在运行的阶段，客户端断开时不遗留后台 LLM 调用
+"""
+
+import asyncio
+import inspect
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Awaitable, Dict, Optional, Union, AsyncIterator
+
+from app.utils.metrics import metrics
+
+
+@dataclass
+class StageEvent:
+    """
+    阶段事件
+
+    协程阶段在完成时产生一个事件（value 为返回值）；异步生成器阶段每个元素产生一个事件，
+    结束时再产生一个 done 事件。阶段抛出异常时产生 error 事件并结束该阶段。
+    """
+    stage: str
+    value: Any = None
+    error: Optional[BaseException] = None
+    done: bool = False
+
+
+class StageExecutor:
+    """
+    并发阶段执行器
+
+    用法:
+        async with StageExecutor() as stages:
+            stages.run("chart", llm.recommend_chart(...))
+            stages.run("answer", llm.generate_answer(...))
+            async for event in stages.events():
+                ...
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.timings: Dict[str, float] = {}
+
+    async def __aenter__(self) -> "StageExecutor":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.cancel()
+
+    def run(self, name: str, stage: Union[Awaitable, AsyncIterator]):
+        """启动一个阶段（协程或异步生成器）"""
+        if name in self._tasks:
+            raise ValueError(f"阶段已存在: {name}")
+        self._tasks[name] = asyncio.create_task(self._pump(name, stage))
+
+    async def _pump(self, name: str, stage: Union[Awaitable, AsyncIterator]):
+        started = time.perf_counter()
+        try:
+            if inspect.isawaitable(stage):
+                value = await stage
+                await self._queue.put(StageEvent(name, value=value, done=True))
+            else:
+                try:
+                    async for item in stage:
+                        await self._queue.put(StageEvent(name, value=item))
+                finally:
+                    # 取消时关闭生成器，释放其持有的流式连接
+                    await stage.aclose()
+                await self._queue.put(StageEvent(name, done=True))
+        except asyncio.CancelledError:
+            metrics.incr(f"stage.{name}.cancelled")
+            raise
+        except Exception as e:
+            metrics.incr(f"stage.{name}.error")
+            await self._queue.put(StageEvent(name, error=e, done=True))
+        finally:
+            self.timings[name] = time.perf_counter() - started
+
+    async def events(self) -> AsyncGenerator[StageEvent, None]:
+        """按产生顺序返回各阶段的事件，全部阶段结束后停止"""
+        finished = set()
+        while len(finished) < len(self._tasks):
+            event = await self._queue.get()
+            if event.done:
+                finished.add(event.stage)
+            yield event
+
+    async def cancel(self):
+        """取消仍在运行的阶段并等待其退出"""
+        running = [task for task in self._tasks.values() if not task.done()]
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
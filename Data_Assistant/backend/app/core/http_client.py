@@ -0,0 +1,121 @@
+"""
+共享 HTTP 客户端模块
+进程内复用同一个 httpx.AsyncClient：连接保活与上限、可用时启用 HTTP/2 多路复用、
+连接 / 读取超时分离，应用关闭时统一释放
+"""
+
+import asyncio
+import logging
+from typing import Dict, Any, Optional
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class SharedHTTPClient:
+    """
+    惰性创建的共享客户端
+
+    httpx 的连接绑定创建时的事件循环，检测到事件循环变化（如测试中多次 asyncio.run）
+    时丢弃旧客户端并重新创建。
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.created = 0
+        self.requests = 0
+        self.streams = 0
+        self.errors = 0
+
+    @property
+    def http2(self) -> bool:
+        return settings.llm_http2 and HTTP2_AVAILABLE
+
+    def _build(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=settings.llm_max_connections,
+                max_keepalive_connections=settings.llm_max_keepalive,
+                keepalive_expiry=settings.llm_keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                connect=settings.llm_connect_timeout,
+                read=settings.llm_read_timeout,
+                write=settings.llm_write_timeout,
+                pool=settings.llm_pool_timeout,
+            ),
+            trust_env=False,
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """当前事件循环上的客户端（需在协程中访问）"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = self._build()
+            self._loop = loop
+            self.created += 1
+        return self._client
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        """发送 POST 请求（复用连接）"""
+        self.requests += 1
+        try:
+            return await self.client.post(url, **kwargs)
+        except httpx.HTTPError:
+            self.errors += 1
+            raise
+
+    def stream(self, method: str, url: str, **kwargs):
+        """发起流式请求，返回异步上下文管理器"""
+        self.streams += 1
+        return self.client.stream(method, url, **kwargs)
+
+    async def close(self):
+        """关闭客户端与其连接（应用关闭时调用）"""
+        if self._client is not None and not self._client.is_closed:
+            try:
+                await self._client.aclose()
+            except RuntimeError as e:
+                # 事件循环已变化，连接随旧循环一起释放
+                logger.debug("http client close skipped: %s", e)
+        self._client = None
+        self._loop = None
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """连接池状态（读取 httpcore 连接池，未创建时为空）"""
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        idle = sum(1 for conn in connections if conn.is_idle())
+        http2 = sum(1 for conn in connections if "HTTP/2" in conn.info())
+        return {
+            "connections": len(connections),
+            "idle": idle,
+            "active": len(connections) - idle,
+            "http2_connections": http2,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "http2": self.http2,
+            "clients_created": self.created,
+            "requests": self.requests,
+            "streams": self.streams,
+            "errors": self.errors,
+            "pool": self.pool_stats(),
+        }
+
+
+# 创建全局实例
+llm_http = SharedHTTPClient()
@@ -3,12 +3,15 @@ Qwen3 LLM 封装模块
 支持基础对话、流式输出、函数调用
 """
 
-import httpx
 import json
-from typing import AsyncGenerator, Optional, List, Dict, Any
+import re
+from typing import AsyncGenerator, Optional, List, Dict, Any, Tuple
 from dataclasses import dataclass
 
 from app.config import settings
+from app.core.chart_rules import profile_fields
+from app.core.http_client import SharedHTTPClient, llm_http
+from app.core.resilience import ResilientCaller, llm_resilience
 
 
 @dataclass
@@ -29,6 +32,192 @@ class ToolCall:
     function_arguments: Dict[str, Any]
 
 
+# 图表规格的输出格式（单独推荐与单次结构化输出共用）
+CHART_SPEC_FORMAT = """支持的图表类型:
+- bar: 柱状图（适合分类比较）
+- line: 折线图（适合趋势分析）
+- pie: 饼图（适合占比分析）
+- scatter: 散点图（适合相关性分析）
+- radar: 雷达图（适合多维度对比）
+
+只返回图表规格（JSON），不要生成数据，字段名必须来自结果列:
+{
+    "chart_type": "bar|line|pie|scatter|radar",
+    "x": "类目轴字段（饼图为名称字段，散点图为横轴数值字段）",
+    "y": ["度量字段", ...],
+    "series": "按取值拆分系列的字段，没有则为 null",
+    "title": "图表标题",
+    "summary": "数据摘要说明"
+}"""
+
+
+class StructuredAnswerParser:
+    """
+    单次结构化输出的增量解析器
+
+    输出格式为 <chart>图表规格 JSON</chart> 后接回答正文。按到达的片段逐步解析：
+    图表块闭合时产出 ("chart", 规格)，之后的内容边到达边产出 ("answer", 文本)。
+    输出不以 <chart> 开头时全部视为回答；图表块无法解析时规格为 None
+    """
+
+    OPEN = "<chart>"
+    CLOSE = "</chart>"
+
+    def __init__(self):
+        self._buffer = ""
+        self._state = "start"  # start / chart / answer
+        self._answer_started = False
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """输入一个片段，返回解析出的事件"""
+        self._buffer += text
+        events: List[Tuple[str, Any]] = []
+        if self._state == "start":
+            head = self._buffer.lstrip()
+            if head.startswith(self.OPEN):
+                self._state = "chart"
+                self._buffer = head[len(self.OPEN):]
+            elif self.OPEN.startswith(head):
+                # 可能是被拆开的开始标签，等待更多内容
+                return events
+            else:
+                self._state = "answer"
+        if self._state == "chart":
+            end = self._buffer.find(self.CLOSE)
+            if end < 0:
+                return events
+            events.append(("chart", self._parse_spec(self._buffer[:end])))
+            self._buffer = self._buffer[end + len(self.CLOSE):]
+            self._state = "answer"
+        if self._state == "answer":
+            self._emit_answer(events)
+        return events
+
+    def close(self) -> List[Tuple[str, Any]]:
+        """输出结束：处理未闭合的图表块与剩余内容"""
+        events: List[Tuple[str, Any]] = []
+        if self._state == "chart":
+            events.append(("chart", self._parse_spec(self._buffer)))
+            self._buffer = ""
+        elif self._state == "start":
+            self._state = "answer"
+        self._emit_answer(events)
+        return events
+
+    def _emit_answer(self, events: List[Tuple[str, Any]]):
+        text, self._buffer = self._buffer, ""
+        if not self._answer_started:
+            # 去掉图表块与正文之间的空白
+            text = text.lstrip()
+            self._answer_started = bool(text)
+        if text:
+            events.append(("answer", text))
+
+    @staticmethod
+    def _parse_spec(text: str) -> Optional[Dict[str, Any]]:
+        text = re.sub(r"^\s*```(?:json)?|```\s*$", "", text.strip(), flags=re.IGNORECASE).strip()
+        if not text or text == "null":
+            return None
+        try:
+            spec = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        return spec if isinstance(spec, dict) else None
+
+
+_HIGH_SURROGATE_ESCAPE = re.compile(r"\\u[dD][89abAB][0-9a-fA-F]{2}$")
+
+
+def _scan_json_string(text: str, start: int) -> Tuple[str, int, bool]:
+    """
+    从 start 处的引号开始读取 JSON 字符串
+
+    Returns:
+        (已到达部分的解码值, 字符串之后的位置, 是否已闭合)
+    """
+    i = start + 1
+    n = len(text)
+    while i < n:
+        char = text[i]
+        if char == "\\":
+            if i + 1 >= n or (text[i + 1] == "u" and i + 6 > n):
+                break
+            i += 6 if text[i + 1] == "u" else 2
+            continue
+        if char == '"':
+            return json.loads(text[start:i + 1]), i + 1, True
+        i += 1
+    raw = text[start + 1:min(i, n)]
+    # 去掉不完整的代理对前半部分，等待后半部分到达
+    raw = _HIGH_SURROGATE_ESCAPE.sub("", raw)
+    return json.loads(f'"{raw}"'), n, False
+
+
+def _skip_json_value(text: str, i: int) -> Optional[int]:
+    """跳过一个非字符串的 JSON 值，返回其后的位置；值尚未完整时返回 None"""
+    depth = 0
+    n = len(text)
+    while i < n:
+        char = text[i]
+        if char == '"':
+            _, i, closed = _scan_json_string(text, i)
+            if not closed:
+                return None
+            continue
+        if char in "[{":
+            depth += 1
+        elif char in "]}":
+            if depth == 0:
+                return i
+            depth -= 1
+        elif char == "," and depth == 0:
+            return i
+        i += 1
+    return None
+
+
+def partial_json_field(text: str, name: str) -> Tuple[Optional[str], bool]:
+    """
+    从尚未传完的 JSON 对象文本中读取顶层字符串字段
+
+    Args:
+        text: 已到达的函数调用参数文本
+        name: 字段名
+
+    Returns:
+        (字段已到达部分的值, 是否已完整)；字段尚未出现时值为 None
+    """
+    i = text.find("{")
+    if i < 0:
+        return None, False
+    i += 1
+    n = len(text)
+    while True:
+        while i < n and text[i] in " \t\r\n,":
+            i += 1
+        if i >= n or text[i] != '"':
+            return None, False
+        key, i, closed = _scan_json_string(text, i)
+        if not closed:
+            return None, False
+        while i < n and text[i] in " \t\r\n:":
+            i += 1
+        if i >= n:
+            return None, False
+        if text[i] == '"':
+            value, i, closed = _scan_json_string(text, i)
+            if key == name:
+                return value, closed
+            if not closed:
+                return None, False
+        elif key == name:
+            return None, False
+        else:
+            i = _skip_json_value(text, i)
+            if i is None:
+                return None, False
+
+
 class Qwen3LLM:
     """Qwen3 LLM 封装类"""
     
@@ -39,10 +228,17 @@ class Qwen3LLM:
         api_key: Optional[str] = None,
         model: str = "qwen3-max",
         temperature: float = 0.7,
+        http: Optional[SharedHTTPClient] = None,
+        base_url: Optional[str] = None,
+        resilience: Optional[ResilientCaller] = None,
     ):
         self.api_key = api_key or settings.dashscope_api_key
         self.model = model
         self.temperature = temperature
+        self.base_url = (base_url or self.BASE_URL).rstrip("/")
+        # 默认使用进程内共享的连接池与重试 / 熔断状态
+        self.http = http or llm_http
+        self.resilience = resilience or llm_resilience
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
@@ -65,7 +261,7 @@ class Qwen3LLM:
         Returns:
             完整响应
         """
-        url = f"{self.BASE_URL}/chat/completions"
+        url = f"{self.base_url}/chat/completions"
         
         payload = {
             "model": self.model,
@@ -77,10 +273,12 @@ class Qwen3LLM:
             payload["tools"] = tools
             payload["tool_choice"] = tool_choice
         
-        async with httpx.AsyncClient(timeout=60, trust_env=False) as client:
-            response = await client.post(url, headers=self.headers, json=payload)
-            response.raise_for_status()
-            return response.json()
+        # 429 / 5xx 重试，慢于 p95 时对冲，熔断期间直接失败
+        response = await self.resilience.call(
+            url, lambda: self.http.post(url, headers=self.headers, json=payload)
+        )
+        response.raise_for_status()
+        return response.json()
     
     async def stream_chat(
         self,
@@ -94,7 +292,7 @@ class Qwen3LLM:
         Yields:
             每个 chunk 的增量内容
         """
-        url = f"{self.BASE_URL}/chat/completions"
+        url = f"{self.base_url}/chat/completions"
         
         payload = {
             "model": self.model,
@@ -107,25 +305,32 @@ class Qwen3LLM:
             payload["tools"] = tools
             payload["tool_choice"] = tool_choice
         
-        async with httpx.AsyncClient(timeout=60, trust_env=False) as client:
-            async with client.stream("POST", url, headers=self.headers, json=payload) as response:
-                response.raise_for_status()
+        done = False
+        # 收到响应头之前的 429 / 5xx 与网络错误可重试
+        async with self.resilience.stream(
+            url, lambda: self.http.stream("POST", url, headers=self.headers, json=payload)
+        ) as response:
+            response.raise_for_status()
+            
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
                 
-                async for line in response.aiter_lines():
-                    if not line:
+                if line.startswith("data:"):
+                    data_str = line[5:].strip()
+                    if data_str == "[DONE]":
+                        # 读完响应体再退出，连接才能放回连接池复用
+                        done = True
+                        continue
+                    if done:
                         continue
                     
-                    if line.startswith("data:"):
-                        data_str = line[5:].strip()
-                        if data_str == "[DONE]":
-                            break
-                        
-                        try:
-                            chunk = json.loads(data_str)
-                            yield chunk
-                        except json.JSONDecodeError:
-                            continue
-    
+                    try:
+                        chunk = json.loads(data_str)
+                        yield chunk
+                    except json.JSONDecodeError:
+                        continue
+
     async def generate_sql(
         self,
         question: str,
@@ -176,6 +381,7 @@ class Qwen3LLM:
         self,
         question: str,
         schema: str,
+        examples: Optional[List[Any]] = None,
     ) -> ToolCall:
         """
         生成 SQL 查询（函数调用模式）
@@ -183,10 +389,92 @@ class Qwen3LLM:
         Args:
             question: 用户问题
             schema: 数据库 Schema
+            examples: 相似的历史问题（含 question / sql 属性），作为少样本示例
         
         Returns:
             ToolCall 对象
         """
+        messages, tools = self._sql_tool_request(question, schema, examples)
+        
+        result = await self.chat(messages, tools=tools)
+        message = result["choices"][0]["message"]
+        
+        if "tool_calls" in message and message["tool_calls"]:
+            tc = message["tool_calls"][0]
+            return ToolCall(
+                id=tc["id"],
+                type=tc["type"],
+                function_name=tc["function"]["name"],
+                function_arguments=json.loads(tc["function"]["arguments"])
+            )
+        
+        raise ValueError("No tool_calls in response")
+    
+    async def stream_sql_with_tool(
+        self,
+        question: str,
+        schema: str,
+        examples: Optional[List[Any]] = None,
+    ) -> AsyncGenerator[Tuple[str, Any], None]:
+        """
+        生成 SQL 查询（流式函数调用模式）
+        
+        边接收 tool_calls 参数增量边解析 JSON：sql 字段每次增长时产出已到达的部分，
+        sql 字段闭合时立即产出完整 SQL，不等待 reason 等其余字段
+        
+        Args:
+            question: 用户问题
+            schema: 数据库 Schema
+            examples: 相似的历史问题（含 question / sql 属性），作为少样本示例
+        
+        Yields:
+            ("sql_partial", 已到达的 SQL)、("sql", 完整 SQL)，最后为 ("tool_call", ToolCall)
+        """
+        messages, tools = self._sql_tool_request(question, schema, examples)
+        
+        call: Dict[str, str] = {"id": "", "type": "function", "name": "", "arguments": ""}
+        sent = ""
+        complete = False
+        async for chunk in self.stream_chat(messages, tools=tools):
+            if not chunk.get("choices"):
+                continue
+            for delta in chunk["choices"][0].get("delta", {}).get("tool_calls") or []:
+                # 只处理第一个函数调用
+                if delta.get("index", 0) != 0:
+                    continue
+                call["id"] = delta.get("id") or call["id"]
+                call["type"] = delta.get("type") or call["type"]
+                function = delta.get("function") or {}
+                call["name"] += function.get("name") or ""
+                call["arguments"] += function.get("arguments") or ""
+            if complete or not call["arguments"]:
+                continue
+            sql, complete = partial_json_field(call["arguments"], "sql")
+            if complete:
+                yield "sql", sql
+            elif sql and sql != sent:
+                sent = sql
+                yield "sql_partial", sql
+        
+        if not call["name"]:
+            raise ValueError("No tool_calls in response")
+        arguments = json.loads(call["arguments"] or "{}")
+        if not complete and "sql" in arguments:
+            yield "sql", arguments["sql"]
+        yield "tool_call", ToolCall(
+            id=call["id"],
+            type=call["type"],
+            function_name=call["name"],
+            function_arguments=arguments,
+        )
+    
+    @staticmethod
+    def _sql_tool_request(
+        question: str,
+        schema: str,
+        examples: Optional[List[Any]],
+    ) -> Tuple[List[Dict[str, Any]], List[Dict]]:
+        """生成 SQL 的函数调用请求（消息与工具定义）"""
         tools = [
             {
                 "type": "function",
@@ -220,25 +508,15 @@ class Qwen3LLM:
 1. 使用 SQLite 语法
 2. 调用 execute_sql 函数执行查询
 3. SQL 必须符合数据库结构"""
+        if examples:
+            shots = "\n\n".join(f"问题: {e.question}\nSQL: {e.sql}" for e in examples)
+            system_prompt += f"\n\n参考示例（相似的历史问题及其 SQL）:\n{shots}"
 
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": question}
         ]
-        
-        result = await self.chat(messages, tools=tools)
-        message = result["choices"][0]["message"]
-        
-        if "tool_calls" in message and message["tool_calls"]:
-            tc = message["tool_calls"][0]
-            return ToolCall(
-                id=tc["id"],
-                type=tc["type"],
-                function_name=tc["function"]["name"],
-                function_arguments=json.loads(tc["function"]["arguments"])
-            )
-        
-        raise ValueError("No tool_calls in response")
+        return messages, tools
     
     async def recommend_chart(
         self,
@@ -247,7 +525,10 @@ class Qwen3LLM:
         sql: str,
     ) -> Dict[str, Any]:
         """
-        推荐图表类型并生成 ECharts 配置
+        推荐图表规格
+        
+        模型只返回紧凑的图表规格（类型、x 字段、y 字段、系列字段、标题），
+        由调用方用完整结果在本地生成 ECharts 配置，输出长度与数据量无关
         
         Args:
             data: 查询结果数据
@@ -255,31 +536,20 @@ class Qwen3LLM:
             sql: 执行的 SQL
         
         Returns:
-            图表配置
+            图表规格 {"chart_type", "x", "y", "series", "title", "summary"}
         """
-        system_prompt = """你是一个数据可视化专家。根据查询数据和用户问题，推荐最合适的图表类型并生成 ECharts 配置。
-
-支持的图表类型:
-- bar: 柱状图（适合分类比较）
-- line: 折线图（适合趋势分析）
-- pie: 饼图（适合占比分析）
-- scatter: 散点图（适合相关性分析）
-- radar: 雷达图（适合多维度对比）
+        system_prompt = f"""你是一个数据可视化专家。根据查询结果的列和用户问题，推荐最合适的图表。
 
-返回格式（JSON）:
-{
-    "chart_type": "bar|line|pie|scatter|radar",
-    "echarts_option": { ... ECharts 配置 ... },
-    "summary": "数据摘要说明"
-}"""
+{CHART_SPEC_FORMAT}"""
 
-        data_preview = data[:10] if len(data) > 10 else data
+        data_preview = data[:5] if len(data) > 5 else data
         
         user_message = f"""用户问题: {question}
 执行的 SQL: {sql}
-查询结果数据（前10条）: {json.dumps(data_preview, ensure_ascii=False)}
+{self._columns_text(data)}
+示例数据（前5条）: {json.dumps(data_preview, ensure_ascii=False)}
 
-请分析数据并推荐最合适的图表类型，生成 ECharts 配置。"""
+请推荐最合适的图表并返回图表规格。"""
 
         messages = [
             {"role": "system", "content": system_prompt},
@@ -297,6 +567,8 @@ class Qwen3LLM:
         question: str,
         sql: str,
         data: List[Dict[str, Any]],
+        truncated: bool = False,
+        digest: Optional[str] = None,
     ) -> AsyncGenerator[str, None]:
         """
         生成自然语言回答（流式）
@@ -305,6 +577,8 @@ class Qwen3LLM:
             question: 用户问题
             sql: 执行的 SQL
             data: 查询结果
+            truncated: 结果是否因超过上限被截断
+            digest: 基于全部结果计算的摘要（合计、占比、最高 / 最低、变化、异常值）
         
         Yields:
             增量回答内容
@@ -316,20 +590,59 @@ class Qwen3LLM:
 2. 包含关键数据
 3. 提供数据洞察"""
 
-        data_preview = data[:5] if len(data) > 5 else data
+        user_message = self._answer_context(question, sql, data, truncated, digest)
+        user_message += f"\n\n请{'依据结果摘要' if digest else ''}用自然语言回答用户的问题。"
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
         
-        user_message = f"""用户问题: {question}
-执行的 SQL: {sql}
-查询结果: {json.dumps(data_preview, ensure_ascii=False)}
-总记录数: {len(data)}
+        async for content in self._stream_content(messages):
+            yield content
+    
+    async def generate_chart_and_answer(
+        self,
+        question: str,
+        sql: str,
+        data: List[Dict[str, Any]],
+        truncated: bool = False,
+        digest: Optional[str] = None,
+    ) -> AsyncGenerator[Tuple[str, Any], None]:
+        """
+        单次流式调用同时生成图表规格与回答
+        
+        模型先输出 <chart>图表规格</chart>，再输出回答正文，由 StructuredAnswerParser 边到达边拆分，
+        省去单独的图表推荐调用及其提示词
+        
+        Yields:
+            ("chart", 图表规格或 None) 或 ("answer", 增量回答内容)
+        """
+        system_prompt = f"""你是一个数据分析助手。根据用户问题和查询结果，先推荐图表，再用自然语言回答用户的问题。
+
+输出格式:
+1. 第一部分为图表规格，用 <chart> 和 </chart> 包裹；不适合画图时写 <chart>null</chart>
+2. 随后直接输出回答正文，回答要简洁明了、包含关键数据并提供数据洞察
 
-请用自然语言回答用户的问题。"""
+{CHART_SPEC_FORMAT}"""
+
+        user_message = self._answer_context(question, sql, data, truncated, digest)
+        user_message += f"\n{self._columns_text(data)}\n\n请先输出图表规格，再回答用户的问题。"
 
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_message}
         ]
         
+        parser = StructuredAnswerParser()
+        async for content in self._stream_content(messages):
+            for event in parser.feed(content):
+                yield event
+        for event in parser.close():
+            yield event
+    
+    async def _stream_content(self, messages: List[Dict[str, Any]]) -> AsyncGenerator[str, None]:
+        """流式对话，只产出非空的增量文本"""
         async for chunk in self.stream_chat(messages):
             if "choices" in chunk and len(chunk["choices"]) > 0:
                 delta = chunk["choices"][0].get("delta", {})
@@ -337,6 +650,36 @@ class Qwen3LLM:
                 if content:
                     yield content
     
+    @staticmethod
+    def _columns_text(data: List[Dict[str, Any]]) -> str:
+        """结果列的类型与基数说明"""
+        columns = "\n".join(
+            f"- {p.name}: {p.kind}，{p.distinct} 个不同值" for p in profile_fields(data)
+        )
+        return f"结果列（共 {len(data)} 行）:\n{columns}"
+    
+    @staticmethod
+    def _answer_context(
+        question: str,
+        sql: str,
+        data: List[Dict[str, Any]],
+        truncated: bool,
+        digest: Optional[str],
+    ) -> str:
+        """回答提示词中的问题、SQL 与结果部分"""
+        data_preview = data[:5] if len(data) > 5 else data
+        if digest:
+            # 摘要覆盖全部结果，原始行只作示例
+            return f"""用户问题: {question}
+执行的 SQL: {sql}
+结果摘要（基于全部结果计算）:
+{digest}
+示例数据（前{len(data_preview)}条）: {json.dumps(data_preview, ensure_ascii=False)}"""
+        return f"""用户问题: {question}
+执行的 SQL: {sql}
+查询结果: {json.dumps(data_preview, ensure_ascii=False)}
+总记录数: {len(data)}{"（结果过大已截断，实际记录更多）" if truncated else ""}"""
+    
     def _extract_sql(self, content: str) -> str:
         """从内容中提取 SQL"""
         import re
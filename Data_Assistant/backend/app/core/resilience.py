@@ -0,0 +1,315 @@
+"""
+LLM 调用弹性模块
+- 429 / 5xx 与网络错误按带抖动的指数退避重试（优先遵循 Retry-After）
+- 按端点记录最近的响应延迟，等待超过 p95 时发出对冲请求，先返回者胜出
+- 连续失败达到阈值时熔断，冷却期内直接失败，冷却后放行一个探测请求
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncContextManager, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from app.config import settings
+from app.utils.metrics import metrics
+
+# 可重试的状态码：限流与服务端错误
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# 可重试的异常：连接、读写超时与协议错误
+RETRY_ERRORS = (httpx.TransportError,)
+
+
+class CircuitOpenError(Exception):
+    """熔断期间直接失败"""
+
+
+def _succeeded(task: asyncio.Future) -> bool:
+    """已完成的请求是否得到不需要重试的响应"""
+    return task.exception() is None and task.result().status_code not in RETRY_STATUSES
+
+
+class LatencyTracker:
+    """端点最近若干次成功响应的延迟"""
+
+    def __init__(self, window: int):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    closed：正常放行，连续失败达到阈值后 open；open：直接失败，冷却期满后 half_open；
+    half_open：只放行一个探测请求，成功则 closed，失败则重新 open
+    """
+
+    def __init__(self):
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self._probing = False
+
+    def allow(self) -> Optional[float]:
+        """放行时返回 None，否则返回剩余冷却秒数"""
+        if self.state == "closed":
+            return None
+        remaining = self.opened_at + settings.llm_breaker_reset_seconds - time.monotonic()
+        if self.state == "open" and remaining <= 0:
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return None
+        return max(remaining, 0.0)
+
+    def release(self):
+        """探测请求被取消或意外失败（未得到结果）时归还探测名额，下一个请求重新探测"""
+        if self.state == "half_open":
+            self._probing = False
+
+    def success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= settings.llm_breaker_failures:
+            if self.state != "open":
+                self.opened += 1
+                metrics.incr("llm.breaker_open")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class ResilientCaller:
+    """
+    按端点执行带重试、对冲与熔断的 HTTP 调用
+
+    用法:
+        response = await resilience.call(url, lambda: http.post(url, json=payload))
+        async with resilience.stream(url, lambda: http.stream("POST", url, json=payload)) as response:
+            ...
+    """
+
+    def __init__(self):
+        self._latency: Dict[str, LatencyTracker] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.retries = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.rejected = 0
+
+    def latency(self, endpoint: str) -> LatencyTracker:
+        tracker = self._latency.get(endpoint)
+        if tracker is None:
+            tracker = self._latency[endpoint] = LatencyTracker(settings.llm_latency_window)
+        return tracker
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = CircuitBreaker()
+        return breaker
+
+    def hedge_delay(self, endpoint: str) -> Optional[float]:
+        """发出对冲请求前的等待时间（端点延迟的 p95），样本不足或未开启时返回 None"""
+        tracker = self._latency.get(endpoint)
+        if not settings.llm_hedge_enabled or tracker is None or len(tracker.samples) < settings.llm_hedge_min_samples:
+            return None
+        return tracker.percentile(settings.llm_hedge_percentile)
+
+    async def call(self, endpoint: str, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """
+        发送请求（非流式）
+
+        Args:
+            endpoint: 端点（用于延迟统计与熔断）
+            send: 发送一次请求的函数，重试与对冲时重复调用
+
+        Returns:
+            最后一次响应（重试用尽时可能仍为错误状态，由调用方 raise_for_status）
+
+        Raises:
+            CircuitOpenError: 端点处于熔断期
+        """
+        attempt = 0
+        while True:
+            probe = self._allow(endpoint)
+            response = None
+            try:
+                response, started = await self._hedged(endpoint, send)
+            except RETRY_ERRORS:
+                self.breaker(endpoint).failure()
+                if attempt >= settings.llm_retry_max:
+                    raise
+            except BaseException:
+                if probe:
+                    self.breaker(endpoint).release()
+                raise
+            else:
+                if not self._observe(endpoint, response, started) or attempt >= settings.llm_retry_max:
+                    return response
+            await self._backoff(attempt, response)
+            attempt += 1
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        endpoint: str,
+        open_stream: Callable[[], AsyncContextManager[httpx.Response]],
+    ) -> AsyncIterator[httpx.Response]:
+        """
+        打开流式响应
+
+        只在收到响应头之前重试（此时尚未向调用方输出任何内容），不发对冲请求
+        """
+        attempt = 0
+        while True:
+            probe = self._allow(endpoint)
+            response = None
+            async with AsyncExitStack() as stack:
+                started = time.monotonic()
+                try:
+                    response = await stack.enter_async_context(open_stream())
+                except RETRY_ERRORS:
+                    self.breaker(endpoint).failure()
+                    if attempt >= settings.llm_retry_max:
+                        raise
+                except BaseException:
+                    if probe:
+                        self.breaker(endpoint).release()
+                    raise
+                if response is not None:
+                    if not self._observe(endpoint, response, started) or attempt >= settings.llm_retry_max:
+                        yield response
+                        return
+            await self._backoff(attempt, response)
+            attempt += 1
+
+    def _allow(self, endpoint: str) -> bool:
+        """检查熔断器，返回本次请求是否为半开状态下的探测请求"""
+        breaker = self.breaker(endpoint)
+        remaining = breaker.allow()
+        if remaining is not None:
+            self.rejected += 1
+            metrics.incr("llm.breaker_rejected")
+            raise CircuitOpenError(f"LLM 服务暂时不可用（熔断中，{remaining:.0f}s 后重试）")
+        return breaker.state == "half_open"
+
+    def _observe(self, endpoint: str, response: httpx.Response, started: float) -> bool:
+        """记录一次响应的结果与延迟，返回是否应重试"""
+        status = response.status_code
+        if status >= 500:
+            self.breaker(endpoint).failure()
+        else:
+            self.breaker(endpoint).success()
+            if status < 400:
+                self.latency(endpoint).record(time.monotonic() - started)
+        return status in RETRY_STATUSES
+
+    async def _backoff(self, attempt: int, response: Optional[httpx.Response]):
+        """带抖动的指数退避；429 / 503 带 Retry-After 时按其等待（不超过退避上限）"""
+        self.retries += 1
+        metrics.incr("llm.retry")
+        ceiling = min(settings.llm_retry_max_delay, settings.llm_retry_base_delay * 2 ** attempt)
+        delay = random.uniform(0, ceiling)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                delay = min(float(retry_after), settings.llm_retry_max_delay)
+            except ValueError:
+                pass
+        await asyncio.sleep(delay)
+
+    async def _hedged(
+        self,
+        endpoint: str,
+        send: Callable[[], Awaitable[httpx.Response]],
+    ) -> Tuple[httpx.Response, float]:
+        """
+        发送请求，等待超过端点 p95 时再发一个相同的请求，取先成功返回的一个
+
+        返回可重试状态（429 / 5xx）或抛出异常的请求不算成功：继续等待另一个请求，
+        都不成功时返回其中一个可重试的响应（没有则抛出异常），由调用方重试
+
+        Returns:
+            (响应, 该请求的发出时间)
+        """
+        delay = self.hedge_delay(endpoint)
+        first = asyncio.ensure_future(send())
+        started: Dict[asyncio.Future, float] = {first: time.monotonic()}
+        try:
+            done: Set[asyncio.Future] = set()
+            pending = {first}
+            if delay is not None:
+                done, pending = await asyncio.wait(pending, timeout=delay)
+                if not done:
+                    self.hedged += 1
+                    metrics.incr("llm.hedge")
+                    hedge = asyncio.ensure_future(send())
+                    started[hedge] = time.monotonic()
+                    pending.add(hedge)
+            finished: List[asyncio.Future] = []
+            while True:
+                finished.extend(done)
+                winner = next((task for task in finished if _succeeded(task)), None)
+                if winner is None and pending:
+                    # 尚无结果或一个请求失败，继续等待其余请求
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                if winner is None:
+                    # 都没有成功：返回可重试的响应（没有则抛出异常），由调用方重试
+                    fallback = next((task for task in finished if task.exception() is None), finished[0])
+                    return fallback.result(), started[fallback]
+                if winner is not first:
+                    self.hedge_wins += 1
+                    metrics.incr("llm.hedge_won")
+                return winner.result(), started[winner]
+        finally:
+            for task in started:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint in set(self._latency) | set(self._breakers):
+            tracker = self._latency.get(endpoint)
+            breaker = self._breakers.get(endpoint)
+            p50 = tracker.percentile(0.5) if tracker else None
+            p95 = tracker.percentile(0.95) if tracker else None
+            endpoints[endpoint] = {
+                "requests": tracker.count if tracker else 0,
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "breaker": breaker.state if breaker else "closed",
+                "breaker_opened": breaker.opened if breaker else 0,
+            }
+        return {
+            "retries": self.retries,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "rejected": self.rejected,
+            "endpoints": endpoints,
+        }
+
+
+# 创建全局实例
+llm_resilience = ResilientCaller()
@@ -0,0 +1,214 @@
+"""
+Schema 链接模块
+在本地为表名、列名、列注释与示例取值建立 BM25 索引（英文按词与三元组、中文按单字与双字切分），
+按问题选出最相关的若干张表，使提示词大小随相关性而非库的规模增长
+"""
+
+import logging
+import math
+import re
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
+
+from app.config import settings
+from app.db.sqlite_manager import SQLiteManager, db as shared_db
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_CAMEL_RE = re.compile(r"([a-z0-9])([A-Z])")
+_TERM_RE = re.compile(r"[a-z]+|\d+|[一-鿿]+")
+# 建表语句中列定义后的行注释
+_COLUMN_COMMENT_RE = re.compile(r'^\s*["`\[]?(\w+)["`\]]?\s[^\n]*?--\s*(.+)$', re.MULTILINE)
+
+# 各字段的权重（按重复次数计入词频）
+_TABLE_WEIGHT = 3
+_COLUMN_WEIGHT = 2
+_VALUE_WEIGHT = 1
+_SAMPLE_ROWS = 50
+_MAX_VALUES_PER_COLUMN = 20
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    切分为检索词
+
+    英文标识符按下划线 / 驼峰拆词，词本身之外再加入三元组以匹配单复数等变形；
+    中文按单字与相邻双字切分
+    """
+    text = _CAMEL_RE.sub(r"\1 \2", text).lower()
+    terms: List[str] = []
+    for run in _TERM_RE.findall(text):
+        if run[0] >= "一":
+            terms.extend(run)
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        elif run.isdigit():
+            terms.append(run)
+        else:
+            terms.append(run)
+            if len(run) >= 4:
+                padded = f"#{run}#"
+                terms.extend("~" + padded[i:i + 3] for i in range(len(padded) - 2))
+    return terms
+
+
+class BM25Index:
+    """Okapi BM25"""
+
+    def __init__(self, documents: Dict[str, Counter], k1: float = 1.2, b: float = 0.75):
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self.lengths = {name: sum(tf.values()) for name, tf in documents.items()}
+        self.avg_length = sum(self.lengths.values()) / len(documents) if documents else 0.0
+        df: Counter = Counter()
+        for tf in documents.values():
+            df.update(tf.keys())
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - count + 0.5) / (count + 0.5)) for term, count in df.items()}
+
+    def score(self, terms: List[str]) -> Dict[str, float]:
+        scores: Dict[str, float] = {}
+        query = Counter(t for t in terms if t in self.idf)
+        for name, tf in self.documents.items():
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[name] / (self.avg_length or 1))
+            total = 0.0
+            for term in query:
+                freq = tf.get(term)
+                if freq:
+                    total += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            if total > 0:
+                scores[name] = total
+        return scores
+
+
+class SchemaLinker:
+    """按问题选择相关表"""
+
+    def __init__(self, db: SQLiteManager):
+        self.db = db
+        self._index: Optional[Tuple[int, BM25Index, Dict[str, List[str]]]] = None
+        self.linked = 0
+        self.fallbacks = 0
+        self.last_selected: List[str] = []
+
+    async def _table_document(self, conn, table_name: str) -> Tuple[Counter, List[str]]:
+        """
+        构造单张表的检索文档
+
+        Returns:
+            (词频, 外键引用的表)
+        """
+        quoted = '"' + table_name.replace('"', '""') + '"'
+        tf: Counter = Counter()
+        for _ in range(_TABLE_WEIGHT):
+            tf.update(tokenize(table_name))
+
+        cursor = await conn.execute(f"PRAGMA table_info({quoted})")
+        columns = [(row[1], (row[2] or "").upper()) for row in await cursor.fetchall()]
+        for name, _ in columns:
+            for _ in range(_COLUMN_WEIGHT):
+                tf.update(tokenize(name))
+
+        # 建表语句中的表 / 列注释
+        cursor = await conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
+        row = await cursor.fetchone()
+        if row and row[0]:
+            for _, comment in _COLUMN_COMMENT_RE.findall(row[0]):
+                for _ in range(_COLUMN_WEIGHT):
+                    tf.update(tokenize(comment))
+
+        # 文本列的示例取值：优先用列画像的高频值，否则读取开头若干行
+        profile = self.db.profiles.cached(table_name)
+        values: List[str] = []
+        if profile:
+            for column in profile.columns.values():
+                values.extend(str(v) for v, _ in column.top if isinstance(v, str))
+        else:
+            text_columns = [name for name, col_type in columns if not any(
+                t in col_type for t in ("INT", "REAL", "FLOA", "DOUB", "NUM", "DEC", "BLOB"))]
+            if text_columns:
+                column_list = ", ".join('"' + c.replace('"', '""') + '"' for c in text_columns)
+                cursor = await conn.execute(f"SELECT {column_list} FROM {quoted} LIMIT {_SAMPLE_ROWS}")
+                rows = await cursor.fetchall()
+                for i in range(len(text_columns)):
+                    distinct = dict.fromkeys(r[i] for r in rows if isinstance(r[i], str))
+                    values.extend(list(distinct)[:_MAX_VALUES_PER_COLUMN])
+        for value in values:
+            for _ in range(_VALUE_WEIGHT):
+                tf.update(tokenize(value))
+
+        cursor = await conn.execute(f"PRAGMA foreign_key_list({quoted})")
+        references = list(dict.fromkeys(row[2] for row in await cursor.fetchall()))
+        return tf, references
+
+    async def index(self) -> Tuple[BM25Index, Dict[str, List[str]]]:
+        """获取索引（DDL 变化时重建）"""
+        schema_version, _, _ = await self.db.version_key()
+        if self._index is not None and self._index[0] == schema_version:
+            return self._index[1], self._index[2]
+        tables = await self.db.schema_tables()
+        documents: Dict[str, Counter] = {}
+        references: Dict[str, List[str]] = {}
+        async with self.db.get_connection() as conn:
+            for table_name in tables:
+                documents[table_name], references[table_name] = await self._table_document(conn, table_name)
+        bm25 = BM25Index(documents)
+        self._index = (schema_version, bm25, references)
+        return bm25, references
+
+    async def link(self, question: str) -> Optional[List[str]]:
+        """
+        选出与问题相关的表
+
+        Returns:
+            表名列表（按相关性排序，补充外键引用的表）；
+            表数不超过阈值、未开启或没有任何表命中时返回 None，表示使用完整 Schema
+        """
+        if not settings.schema_link_enabled:
+            return None
+        tables = await self.db.schema_tables()
+        if len(tables) <= settings.schema_link_min_tables:
+            return None
+
+        bm25, references = await self.index()
+        scores = bm25.score(tokenize(question))
+        if not scores:
+            self.fallbacks += 1
+            metrics.incr("schema_link.fallback")
+            return None
+
+        ranked = sorted(scores, key=lambda t: (-scores[t], t))[:settings.schema_link_top_k]
+        selected = list(ranked)
+        # 补充外键引用的表，保证连接路径完整
+        for table_name in ranked:
+            for ref in references.get(table_name, []):
+                match = next((t for t in tables if t.lower() == ref.lower()), None)
+                if match and match not in selected:
+                    selected.append(match)
+
+        self.linked += 1
+        self.last_selected = selected
+        metrics.incr("schema_link.linked")
+        return selected
+
+    async def schema_for(self, question: str) -> str:
+        """返回用于提示词的 Schema：链接成功时只包含选中的表"""
+        try:
+            tables = await self.link(question)
+        except Exception as e:
+            logger.warning("schema linking failed: %s", e)
+            tables = None
+        return await self.db.get_schema(tables)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "indexed_tables": len(self._index[1].documents) if self._index else 0,
+            "linked": self.linked,
+            "fallbacks": self.fallbacks,
+            "last_selected": self.last_selected,
+        }
+
+
+# 创建全局实例
+schema_linker = SchemaLinker(shared_db)
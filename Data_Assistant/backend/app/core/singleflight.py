@@ -0,0 +1,142 @@
+"""
+请求合并模块
+相同的问题同时在处理时只计算一次：第一个请求（领导者）在后台任务中运行，
+之后到达的请求（跟随者）先重放已产生的事件，再接收后续事件。
+突发流量的开销随不同问题数增长，而不是随请求数增长
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from app.utils.metrics import metrics
+
+
+class Flight:
+    """一次进行中的计算：按顺序记录产生的事件，供所有订阅者读取"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.events: List[Any] = []
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self.cancelled = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, event: Any):
+        self.events.append(event)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.error = error
+        self.done = True
+        self._notify()
+
+    def _notify(self):
+        # 唤醒当前的等待者，之后的等待使用新的事件对象
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        """从第一个事件开始读取，读完已产生的事件后等待新事件"""
+        position = 0
+        while True:
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.done:
+                break
+            await self._changed.wait()
+        if self.error is not None:
+            raise self.error
+
+
+class Singleflight:
+    """
+    进程内请求合并
+
+    用法:
+        async for event in flights.stream(key, lambda: agent_stream(question)):
+            ...
+
+    所有订阅者都断开时取消后台计算；计算结束后移除，之后相同的请求重新计算
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """
+        订阅 key 对应的计算，没有进行中的计算时由 factory 创建
+
+        Args:
+            key: 合并键
+            factory: 创建事件流（异步生成器）的函数，只在成为领导者时调用
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = Flight(key)
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(flight, factory()))
+            self.leaders += 1
+            metrics.incr("singleflight.leader")
+        else:
+            self.followers += 1
+            metrics.incr("singleflight.follower")
+
+        flight.subscribers += 1
+        try:
+            async for event in flight.subscribe():
+                yield event
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # 没有订阅者了：停止计算，之后相同的请求重新开始
+                flight.cancelled = True
+                self._forget(flight)
+                flight.task.cancel()
+                await asyncio.wait({flight.task})
+
+    async def call(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """合并协程调用，所有调用方得到同一个返回值"""
+        async def single():
+            yield await factory()
+
+        events = self.stream(key, single)
+        try:
+            return await events.__anext__()
+        finally:
+            await events.aclose()
+
+    async def _run(self, flight: Flight, source: AsyncIterator[Any]):
+        error: Optional[BaseException] = None
+        try:
+            async for event in source:
+                flight.publish(event)
+        except asyncio.CancelledError as e:
+            if not flight.cancelled:
+                error = e
+                raise
+        except Exception as e:
+            error = e
+        finally:
+            self._forget(flight)
+            flight.finish(error)
+
+    def _forget(self, flight: Flight):
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
+
+
+# 创建全局实例
+singleflight = Singleflight()
@@ -0,0 +1,198 @@
+"""
+结果摘要模块
+在全部结果行上计算合计、占比、最高 / 最低、环比变化与异常值，生成大小固定的文本摘要，
+替代把原始行写入回答提示词：回答覆盖全部数据，提示词长度不随结果增长
+
+NumPy 为可选依赖，未安装时不生成摘要（回答提示词退回前几行预览）
+"""
+
+import logging
+import numbers
+from typing import List, Any, Optional, Sequence, Tuple
+
+from app.config import settings
+from app.core.chart_rules import FieldProfile, classify_column, is_measure
+from app.db.result import Columnar
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - 可选依赖
+    np = None
+
+logger = logging.getLogger(__name__)
+
+_KIND_NAMES = {"temporal": "时间", "categorical": "分类", "numeric": "数值", "empty": "空"}
+# 摘要中最多描述的度量列与分类列数
+_MAX_MEASURES = 4
+_MAX_DIMENSIONS = 3
+_MAX_DESCRIBED_COLUMNS = 20
+# 异常值：超出四分位距的倍数
+_IQR_FACTOR = 1.5
+
+
+def fmt(value: Any) -> str:
+    """紧凑的数值格式：整数加千分位，小数最多保留两位"""
+    if isinstance(value, numbers.Integral) or (isinstance(value, float) and value.is_integer() and abs(value) < 1e15):
+        return f"{int(value):,}"
+    if isinstance(value, numbers.Real):
+        return f"{value:,.2f}".rstrip("0").rstrip(".")
+    return str(value)
+
+
+def _pct(value: float) -> str:
+    return f"{value:+.1%}"
+
+
+def _grouped(labels: Sequence[Any], values: "np.ndarray", ordered: bool) -> Tuple[List[Any], "np.ndarray"]:
+    """
+    按标签求和（标签唯一时保持原值）
+
+    Args:
+        ordered: 是否按标签排序（时间维度），否则保持首次出现的顺序
+    """
+    keys = ["" if label is None else label for label in labels]
+    if len(set(keys)) == len(keys):
+        if not ordered:
+            return keys, values
+        order = sorted(range(len(keys)), key=lambda i: str(keys[i]))
+        return [keys[i] for i in order], values[order]
+    unique = list(dict.fromkeys(keys))
+    if ordered:
+        unique.sort(key=str)
+    positions = {key: i for i, key in enumerate(unique)}
+    index = np.fromiter((positions[key] for key in keys), dtype=np.int64, count=len(keys))
+    return unique, np.bincount(index, weights=np.nan_to_num(values), minlength=len(unique))
+
+
+def _measure_lines(
+    name: str,
+    values: "np.ndarray",
+    label: Optional[FieldProfile],
+    labels: Optional[Sequence[Any]],
+    top_k: int,
+) -> List[str]:
+    """单个度量列的摘要行"""
+    valid = values[~np.isnan(values)]
+    if valid.size == 0:
+        return [f"{name}: 全部为空"]
+    total = float(valid.sum())
+    line = f"{name}: 合计 {fmt(total)}，均值 {fmt(float(valid.mean()))}，中位数 {fmt(float(np.median(valid)))}"
+    if valid.size < values.size:
+        line += f"，空值 {values.size - valid.size} 个"
+    lines = [line]
+    if label is None or labels is None:
+        lines[0] += f"，最小 {fmt(float(valid.min()))}，最大 {fmt(float(valid.max()))}"
+        return lines
+
+    temporal = label.kind == "temporal"
+    mask = ~np.isnan(values)
+    keys, sums = _grouped([key for key, ok in zip(labels, mask) if ok], values[mask], ordered=temporal)
+    if len(keys) < 2:
+        return lines
+    by_label = f"按 {label.name}" + (" 汇总后" if len(keys) < int(mask.sum()) else "")
+    non_negative = bool((sums >= 0).all()) and sums.sum() > 0
+    share_base = float(sums.sum())
+
+    def item(i: int) -> str:
+        text = f"{keys[i]} {fmt(float(sums[i]))}"
+        if non_negative and not temporal:
+            text += f" ({sums[i] / share_base:.1%})"
+        return text
+
+    order = np.argsort(-sums, kind="stable")
+    k = min(top_k, len(keys))
+    lines.append(f"  {by_label} 最高: " + "，".join(item(i) for i in order[:k]))
+    if len(keys) > k:
+        # 与最高项不重叠
+        lines.append(f"  {by_label} 最低: " + "，".join(item(i) for i in order[::-1][:min(k, len(keys) - k)]))
+    if non_negative and not temporal and len(keys) > k:
+        lines.append(f"  前 {k} 项合计占比 {float(sums[order[:k]].sum()) / share_base:.1%}")
+
+    if temporal:
+        previous = sums[:-1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            changes = np.where(previous != 0, np.diff(sums) / np.abs(previous), np.nan)
+        change_text = f"  变化: {keys[-1]} 较 {keys[-2]} {fmt(float(sums[-1] - sums[-2]))}"
+        if not np.isnan(changes[-1]):
+            change_text += f" ({_pct(float(changes[-1]))})"
+        if sums[0] != 0:
+            change_text += f"；{keys[0]} → {keys[-1]} {_pct(float((sums[-1] - sums[0]) / abs(sums[0])))}"
+        if len(keys) > 2 and not np.isnan(changes).all():
+            up, down = int(np.nanargmax(changes)), int(np.nanargmin(changes))
+            change_text += f"；最大增幅 {keys[up + 1]} {_pct(float(changes[up]))}，最大降幅 {keys[down + 1]} {_pct(float(changes[down]))}"
+        lines.append(change_text)
+
+    # 四分位距之外的异常值（至少 8 个数据点才判断）
+    if len(keys) >= 8:
+        q1, q3 = np.percentile(sums, [25, 75])
+        spread = q3 - q1
+        median = np.median(sums)
+        if spread > 0:
+            outliers = np.flatnonzero((sums < q1 - _IQR_FACTOR * spread) | (sums > q3 + _IQR_FACTOR * spread))
+        else:
+            # 大多数取值相同：少数不同的取值即为异常值
+            outliers = np.flatnonzero(sums != median)
+            if outliers.size > len(keys) // 4:
+                outliers = outliers[:0]
+        if outliers.size:
+            ranked = outliers[np.argsort(-np.abs(sums[outliers] - median))][:top_k]
+            lines.append("  异常值: " + "，".join(f"{keys[i]} {fmt(float(sums[i]))}" for i in ranked))
+    return lines
+
+
+def summarize(result: Columnar, truncated: bool = False) -> Optional[str]:
+    """
+    生成结果摘要
+
+    Args:
+        result: 列式查询结果（全部行）
+        truncated: 结果是否被截断
+
+    Returns:
+        摘要文本，未开启、未安装 NumPy 或结果为空时返回 None
+    """
+    if not settings.answer_digest_enabled or np is None or len(result) == 0:
+        return None
+    try:
+        return _summarize(result, truncated)
+    except Exception as e:
+        logger.warning("result summarization failed: %s", e)
+        return None
+
+
+def _summarize(result: Columnar, truncated: bool) -> str:
+    top_k = settings.answer_digest_top_k
+    columns = {name: list(values) for name, values in zip(result.columns, result.values)}
+    profiles = [classify_column(name, values) for name, values in columns.items()]
+
+    described = "，".join(
+        f"{p.name}({_KIND_NAMES[p.kind]}" + (f"，{p.distinct} 个取值)" if p.kind != "numeric" else ")")
+        for p in profiles[:_MAX_DESCRIBED_COLUMNS]
+    )
+    if len(profiles) > _MAX_DESCRIBED_COLUMNS:
+        described += f" 等 {len(profiles)} 列"
+    lines = [f"共 {len(result)} 行{'（已截断，只统计了前面的行）' if truncated else ''}；列: {described}"]
+
+    measures = [p for p in profiles if is_measure(p)][:_MAX_MEASURES]
+    dimensions = [p for p in profiles if p.kind in ("temporal", "categorical")]
+    # 标签列：优先时间列，其次分类列
+    label = next((p for p in dimensions if p.kind == "temporal"), dimensions[0] if dimensions else None)
+    labels = columns[label.name] if label else None
+
+    for measure in measures:
+        values = np.array([np.nan if v is None else v for v in columns[measure.name]], dtype=float)
+        lines.extend(_measure_lines(measure.name, values, label, labels, top_k))
+
+    # 没有度量列时描述分类列的高频取值
+    if not measures:
+        for dimension in dimensions[:_MAX_DIMENSIONS]:
+            keys, counts = np.unique(
+                np.array(["" if v is None else str(v) for v in columns[dimension.name]], dtype=object),
+                return_counts=True,
+            )
+            order = np.argsort(-counts, kind="stable")[:top_k]
+            lines.append(
+                f"{dimension.name}: {len(keys)} 个取值，最常见: "
+                + "，".join(f"{keys[i]} ({int(counts[i])} 行)" for i in order)
+            )
+    return "\n".join(lines)
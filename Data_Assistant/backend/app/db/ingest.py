@@ -0,0 +1,423 @@
+"""
+批量导入模块
+流式读取 CSV / NDJSON，按采样推断列类型，分事务批量写入，导入后可选建索引
+"""
+
+import codecs
+import csv
+import json
+import logging
+import re
+import sqlite3
+import time
+from typing import List, Dict, Any, Optional, AsyncIterable, AsyncIterator, Callable, Sequence, Tuple
+from dataclasses import dataclass, field, asdict
+
+from app.config import settings
+from app.db.sqlite_manager import SQLiteManager, db as shared_db
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson")
+
+_TABLE_NAME_RE = re.compile(r"^[^\W\d]\w*$")
+_INTEGER_RE = re.compile(r"^[+-]?(?:0|[1-9]\d*)$")
+_LEADING_ZERO_RE = re.compile(r"^[+-]?0\d")
+
+Converter = Callable[[Any], Any]
+
+
+class IngestError(ValueError):
+    """上传的数据无法导入"""
+
+
+@dataclass
+class IngestReport:
+    """导入结果"""
+    table: str
+    format: str
+    rows: int
+    columns: Dict[str, str]
+    created: bool
+    transactions: int
+    seconds: float
+    indexes: List[str] = field(default_factory=list)
+    ignored_columns: List[str] = field(default_factory=list)
+
+    @property
+    def rows_per_second(self) -> float:
+        return round(self.rows / self.seconds, 1) if self.seconds > 0 else float(self.rows)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["seconds"] = round(self.seconds, 3)
+        data["rows_per_second"] = self.rows_per_second
+        return data
+
+
+async def iter_lines(chunks: AsyncIterable[bytes], encoding: str = "utf-8-sig") -> AsyncIterator[str]:
+    """
+    把字节块解码并切分为行（跨块的多字节字符与行均可正确拼接）
+
+    只按 "\n" 切分（行尾的 "\r" 去掉，换行统一为 "\n"）：str.splitlines 还会在
+    \x0b、\x0c、\x1c-\x1e、\x85、\u2028 等字符处切分，字段中含有这些字符时会拆出错误的行
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    buffer = ""
+    try:
+        async for chunk in chunks:
+            buffer += decoder.decode(chunk)
+            lines = buffer.split("\n")
+            buffer = lines.pop()
+            for line in lines:
+                yield (line[:-1] if line.endswith("\r") else line) + "\n"
+        buffer += decoder.decode(b"", final=True)
+    except UnicodeDecodeError as e:
+        raise IngestError(f"文件不是有效的 {encoding} 编码：{e}")
+    if buffer.endswith("\r"):
+        buffer = buffer[:-1]
+    if buffer:
+        yield buffer
+
+
+async def iter_csv(chunks: AsyncIterable[bytes], delimiter: str = ",") -> AsyncIterator[List[str]]:
+    """
+    流式解析 CSV，逐条产出记录（第一条为表头）
+
+    引号内允许换行：引号个数为奇数时继续拼接下一行，直到记录完整
+    """
+    pending: List[str] = []
+    quotes = 0
+    async for line in iter_lines(chunks):
+        pending.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        record = "".join(pending)
+        pending, quotes = [], 0
+        for row in csv.reader([record], delimiter=delimiter):
+            if row:
+                yield row
+    if pending:
+        raise IngestError("CSV 结尾存在未闭合的引号")
+
+
+async def iter_ndjson(chunks: AsyncIterable[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    """流式解析 NDJSON（每行一个 JSON 对象，空行忽略）"""
+    line_no = 0
+    async for line in iter_lines(chunks):
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise IngestError(f"第 {line_no} 行不是有效的 JSON：{e.msg}")
+        if not isinstance(record, dict):
+            raise IngestError(f"第 {line_no} 行不是 JSON 对象")
+        yield record
+
+
+def _text_kind(value: str) -> str:
+    """文本值的类型（前导零视为编码，保留为文本）"""
+    if _INTEGER_RE.match(value):
+        return "INTEGER"
+    if _LEADING_ZERO_RE.match(value):
+        return "TEXT"
+    try:
+        float(value)
+    except ValueError:
+        return "TEXT"
+    return "REAL" if value.strip().lower() not in ("nan", "inf", "-inf", "+inf", "infinity") else "TEXT"
+
+
+def _value_kind(value: Any) -> Optional[str]:
+    """JSON 值的类型，None 表示 NULL"""
+    if value is None:
+        return None
+    if isinstance(value, (bool, int)):
+        return "INTEGER"
+    if isinstance(value, float):
+        return "REAL"
+    if isinstance(value, str):
+        return "TEXT"
+    return "TEXT"  # 对象 / 数组按 JSON 文本存储
+
+
+def _merge_kinds(kinds: Sequence[Optional[str]]) -> str:
+    """合并同一列的采样类型：全为整数取 INTEGER，整数与小数取 REAL，其余为 TEXT"""
+    present = {k for k in kinds if k is not None}
+    if not present:
+        return "TEXT"
+    if present == {"INTEGER"}:
+        return "INTEGER"
+    if present <= {"INTEGER", "REAL"}:
+        return "REAL"
+    return "TEXT"
+
+
+def infer_csv_types(header: List[str], sample: List[List[str]]) -> List[str]:
+    """按采样推断 CSV 各列类型（空字符串视为 NULL）"""
+    return [
+        _merge_kinds([_text_kind(row[i]) if i < len(row) and row[i] != "" else None for row in sample])
+        for i in range(len(header))
+    ]
+
+
+def infer_json_types(columns: List[str], sample: List[Dict[str, Any]]) -> List[str]:
+    """按采样推断 NDJSON 各列类型"""
+    return [_merge_kinds([_value_kind(row.get(col)) for row in sample]) for col in columns]
+
+
+def declared_kind(declared: str) -> str:
+    """按 SQLite 类型亲和性规则把已有列的声明类型归为 INTEGER / REAL / TEXT / NUMERIC"""
+    declared = (declared or "").upper()
+    if "INT" in declared:
+        return "INTEGER"
+    if any(t in declared for t in ("CHAR", "CLOB", "TEXT")):
+        return "TEXT"
+    if any(t in declared for t in ("REAL", "FLOA", "DOUB")):
+        return "REAL"
+    return "NUMERIC"
+
+
+def _to_number(value: str) -> Any:
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value  # 与推断不符的值按原文本写入，由 SQLite 的动态类型保存
+
+
+def _to_real(value: str) -> Any:
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def csv_converter(kind: str) -> Converter:
+    """CSV 文本到列类型的转换（空字符串写为 NULL）"""
+    if kind in ("INTEGER", "NUMERIC"):
+        return lambda v: None if v == "" else _to_number(v)
+    if kind == "REAL":
+        return lambda v: None if v == "" else _to_real(v)
+    return lambda v: None if v == "" else v
+
+
+def json_value(value: Any) -> Any:
+    """JSON 值到 SQLite 值的转换"""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _column_names(header: List[str]) -> List[str]:
+    """清理表头：去空白，空名与重名补序号"""
+    names: List[str] = []
+    seen = set()
+    for i, raw in enumerate(header):
+        name = raw.strip() or f"column_{i + 1}"
+        base, n = name, 2
+        while name.lower() in seen:
+            name = f"{base}_{n}"
+            n += 1
+        seen.add(name.lower())
+        names.append(name)
+    return names
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class DatasetLoader:
+    """把 CSV / NDJSON 流导入 SQLite 表"""
+
+    def __init__(self, db: SQLiteManager):
+        self.db = db
+
+    async def _target_columns(
+        self, table_name: str, columns: List[str], inferred: List[str]
+    ) -> Tuple[bool, List[str]]:
+        """
+        确定目标表：不存在时按推断类型建表，已存在时按声明类型转换
+
+        Returns:
+            (是否新建, 各列类型)
+        """
+        if not await self.db.table_exists(table_name):
+            try:
+                await self.db.create_table(
+                    table_name, {_quote(col): kind for col, kind in zip(columns, inferred)}
+                )
+            except sqlite3.Error as e:
+                raise IngestError(f"无法创建表 {table_name}：{e}")
+            return True, inferred
+        schema = await self.db.get_table_schema(table_name)
+        declared = {col["name"].lower(): col["type"] for col in schema["columns"]}
+        missing = [col for col in columns if col.lower() not in declared]
+        if missing:
+            raise IngestError(f"表 {table_name} 中不存在列：{', '.join(missing)}")
+        return False, [declared_kind(declared[col.lower()]) for col in columns]
+
+    async def build_indexes(self, table_name: str, columns: Sequence[str]) -> List[str]:
+        """导入完成后建索引并更新统计信息"""
+        schema = await self.db.get_table_schema(table_name)
+        existing = {col["name"].lower() for col in schema["columns"]}
+        unknown = [col for col in columns if col.lower() not in existing]
+        if unknown:
+            raise IngestError(f"表 {table_name} 中不存在索引列：{', '.join(unknown)}")
+        names = []
+        statements = []
+        for col in columns:
+            name = f"idx_{table_name}_{col}"
+            names.append(name)
+            statements.append(f"CREATE INDEX IF NOT EXISTS {_quote(name)} ON {_quote(table_name)} ({_quote(col)})")
+        statements.append(f"ANALYZE {_quote(table_name)}")
+
+        async def job(conn):
+            for statement in statements:
+                await conn.execute(statement)
+            await conn.commit()
+            await self.db._mark_written([table_name])
+
+        await self.db.pool.write(job)
+        self.db.invalidate_schema(table_name)
+        return names
+
+    async def load(
+        self,
+        table_name: str,
+        chunks: AsyncIterable[bytes],
+        fmt: str = "csv",
+        indexes: Optional[Sequence[str]] = None,
+        transaction_rows: Optional[int] = None,
+    ) -> IngestReport:
+        """
+        流式导入数据集
+
+        先读取采样行推断列类型（表已存在时沿用其声明类型），之后每累积
+        transaction_rows 行提交一个写事务。各事务单独排入写队列，
+        导入期间其他写操作可以穿插执行，读连接不受影响。
+
+        Args:
+            table_name: 目标表（不存在时自动创建）
+            chunks: 请求体字节流
+            fmt: csv / ndjson
+            indexes: 导入后建索引的列
+            transaction_rows: 每个事务的行数，默认取配置
+
+        Returns:
+            导入结果
+
+        Raises:
+            IngestError: 表名、格式或内容无效（之前已提交的事务保留）
+        """
+        if not _TABLE_NAME_RE.match(table_name):
+            raise IngestError(f"无效的表名：{table_name}")
+        if fmt not in FORMATS:
+            raise IngestError(f"不支持的格式：{fmt}")
+        if self.db.rollups.is_rollup(table_name):
+            raise IngestError(f"{table_name} 是汇总表，不能直接导入")
+        if self.db.is_reserved_table(table_name):
+            raise IngestError(f"{table_name} 是内部表，不能导入")
+        transaction_rows = max(1, transaction_rows or settings.ingest_transaction_rows)
+        started = time.perf_counter()
+
+        records = iter_csv(chunks) if fmt == "csv" else iter_ndjson(chunks)
+        header: Optional[List[str]] = None
+        if fmt == "csv":
+            try:
+                header = await records.__anext__()
+            except StopAsyncIteration:
+                raise IngestError("文件为空")
+        sample = []
+        async for record in records:
+            sample.append(record)
+            if len(sample) >= settings.ingest_sample_rows:
+                break
+
+        ignored: List[str] = []
+        if fmt == "csv":
+            columns = _column_names(header)
+            inferred = infer_csv_types(columns, sample)
+        else:
+            if not sample:
+                raise IngestError("文件为空")
+            columns = list(dict.fromkeys(key for row in sample for key in row))
+            inferred = infer_json_types(columns, sample)
+
+        created, kinds = await self._target_columns(table_name, columns, inferred)
+
+        line = 1  # 当前记录序号（CSV 表头为第 1 条）
+        if fmt == "csv":
+            converters = [csv_converter(kind) for kind in kinds]
+            width = len(columns)
+
+            def convert(record):
+                if len(record) != width:
+                    raise IngestError(f"第 {line} 条记录有 {len(record)} 列，表头为 {width} 列")
+                return tuple(conv(value) for conv, value in zip(converters, record))
+        else:
+            known = set(columns)
+
+            def convert(record):
+                for key in record.keys() - known:
+                    known.add(key)
+                    ignored.append(key)
+                return tuple(json_value(record.get(col)) for col in columns)
+
+        rows = 0
+        transactions = 0
+        batch: List[tuple] = []
+
+        async def flush():
+            nonlocal rows, transactions, batch
+            if batch:
+                rows += await self.db.insert_rows(table_name, columns, batch)
+                transactions += 1
+                batch = []
+
+        async def remaining():
+            for record in sample:
+                yield record
+            async for record in records:
+                yield record
+
+        try:
+            async for record in remaining():
+                line += 1
+                batch.append(convert(record))
+                if len(batch) >= transaction_rows:
+                    await flush()
+            await flush()
+        except IngestError as e:
+            raise IngestError(f"{e}（已导入 {rows} 行）")
+
+        index_names = await self.build_indexes(table_name, indexes) if indexes else []
+        report = IngestReport(
+            table=table_name,
+            format=fmt,
+            rows=rows,
+            columns=dict(zip(columns, kinds)),
+            created=created,
+            transactions=transactions,
+            seconds=time.perf_counter() - started,
+            indexes=index_names,
+            ignored_columns=ignored,
+        )
+        logger.info(
+            "ingested %d rows into %s in %.2fs (%.0f rows/s, %d transactions)",
+            report.rows, table_name, report.seconds, report.rows_per_second, transactions,
+        )
+        return report
+
+
+# 创建全局实例
+dataset_loader = DatasetLoader(shared_db)
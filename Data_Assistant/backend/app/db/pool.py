@@ -0,0 +1,329 @@
+"""
+SQLite 连接池模块
+维护一组长连接，读写槽位分离，支持获取超时与连接池统计
+WAL 模式下读连接只读打开，写操作由单一写任务串行执行
+"""
+
+import asyncio
+import time
+import aiosqlite
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+from pathlib import Path
+from contextlib import asynccontextmanager
+
+WriteJob = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+
+class PoolTimeoutError(Exception):
+    """在超时时间内未能获取到连接"""
+
+
+class _Slot:
+    """同类连接的槽位（读或写）"""
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+        self.connections: List[aiosqlite.Connection] = []
+        self.idle: Optional[asyncio.Queue] = None
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        idle = self.idle.qsize() if self.idle else 0
+        return {
+            "size": len(self.connections),
+            "idle": idle,
+            "in_use": len(self.connections) - idle,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            "max_wait_ms": round(self.wait_max * 1000, 3),
+        }
+
+
+class SerializedWriter:
+    """
+    单写任务
+
+    所有写操作进入同一个队列，由后台任务按提交顺序在写连接上逐个执行。
+    提交方被取消时，已开始的写事务仍会完整提交或回滚。
+    """
+
+    def __init__(self, pool: "ConnectionPool"):
+        self.pool = pool
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.executed = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """处理完已排队的写操作后停止"""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, job: WriteJob) -> Any:
+        """提交写操作并等待其结果"""
+        if not self.running:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((job, future))
+        return await asyncio.shield(future)
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                break
+            job, future = item
+            try:
+                async with self.pool.acquire(write=True) as conn, self.pool.writing():
+                    result = await job(conn)
+            except Exception as e:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self.executed += 1
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "executed": self.executed,
+            "failed": self.failed,
+        }
+
+
+class ConnectionPool:
+    """aiosqlite 连接池，启动时建立连接，关闭时统一释放"""
+
+    def __init__(
+        self,
+        db_path: str,
+        readers: int = 4,
+        writers: int = 1,
+        timeout: float = 10.0,
+        journal_mode: str = "delete",
+        pragmas: Optional[Dict[str, Any]] = None,
+    ):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.journal_mode = journal_mode.lower()
+        self.pragmas = pragmas or {}
+        # WAL 模式下只保留一条写连接，由写任务串行使用
+        self._readers = _Slot("readers", max(1, readers))
+        self._writers = _Slot("writers", 1 if self.wal else max(1, writers))
+        self._writer = SerializedWriter(self) if self.wal else None
+        # 专用于读取版本号的连接：其 data_version 会随其他连接的提交而变化
+        self._probe: Optional[aiosqlite.Connection] = None
+        # 版本号读取串行执行：并发读取共用探测连接上未结束的读事务时，会读到旧快照
+        self._probe_lock = asyncio.Lock()
+        self._lock = asyncio.Lock()
+        self._opened = False
+        # 写操作计数：读取版本号期间若有本实例的写操作，data_version 的变化不能归为外部写入
+        self.writes_started = 0
+        self.writes_finished = 0
+
+    @property
+    def opened(self) -> bool:
+        return self._opened
+
+    @property
+    def wal(self) -> bool:
+        return self.journal_mode == "wal"
+
+    async def _connect(self, readonly: bool = False) -> aiosqlite.Connection:
+        """建立一个新连接并应用 PRAGMA"""
+        if readonly:
+            uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+            conn = await aiosqlite.connect(uri, uri=True)
+        else:
+            conn = await aiosqlite.connect(self.db_path)
+            await conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        for name, value in self.pragmas.items():
+            await conn.execute(f"PRAGMA {name}={value}")
+        conn.row_factory = aiosqlite.Row
+        return conn
+
+    async def open(self):
+        """建立所有连接（可重复调用）"""
+        async with self._lock:
+            if self._opened:
+                return
+            # 先建立写连接，确保数据库文件存在且已切换日志模式
+            for slot in (self._writers, self._readers):
+                readonly = self.wal and slot is self._readers
+                slot.idle = asyncio.Queue()
+                for _ in range(slot.size):
+                    conn = await self._connect(readonly=readonly)
+                    slot.connections.append(conn)
+                    slot.idle.put_nowait(conn)
+            self._probe = await self._connect(readonly=self.wal)
+            if self._writer is not None:
+                self._writer.start()
+            self._opened = True
+
+    async def close(self):
+        """关闭所有连接"""
+        async with self._lock:
+            if not self._opened:
+                return
+            if self._writer is not None:
+                await self._writer.stop()
+            self._opened = False
+            if self._probe is not None:
+                try:
+                    await self._probe.close()
+                except Exception:
+                    pass
+                self._probe = None
+            for slot in (self._readers, self._writers):
+                for conn in slot.connections:
+                    try:
+                        await conn.close()
+                    except Exception:
+                        pass
+                slot.connections.clear()
+                slot.idle = None
+
+    @asynccontextmanager
+    async def acquire(self, write: bool = False):
+        """
+        借出一个连接，使用完毕后自动归还
+
+        Args:
+            write: 是否借出写连接
+
+        Raises:
+            PoolTimeoutError: 超时仍无空闲连接
+        """
+        if not self._opened:
+            await self.open()
+
+        slot = self._writers if write else self._readers
+        start = time.monotonic()
+        if not slot.idle.empty():
+            conn = slot.idle.get_nowait()
+        else:
+            conn = await self._wait_idle(slot, write)
+
+        waited = time.monotonic() - start
+        slot.checkouts += 1
+        slot.wait_total += waited
+        slot.wait_max = max(slot.wait_max, waited)
+
+        try:
+            yield conn
+        finally:
+            # 未提交的事务不能带回池中
+            try:
+                if conn.in_transaction:
+                    await conn.rollback()
+            except Exception:
+                pass
+            if slot.idle is not None:
+                slot.idle.put_nowait(conn)
+
+    async def _wait_idle(self, slot: _Slot, write: bool) -> aiosqlite.Connection:
+        """
+        等待空闲连接
+
+        不使用 asyncio.wait_for：连接恰好就绪时到达的取消会被其吞掉，被取消的调用方仍继续执行
+        """
+        getter = asyncio.ensure_future(slot.idle.get())
+        try:
+            await asyncio.wait({getter}, timeout=self.timeout)
+        except asyncio.CancelledError:
+            # 已取到的连接放回池中，再传播取消
+            if getter.done() and not getter.cancelled():
+                slot.idle.put_nowait(getter.result())
+            else:
+                getter.cancel()
+            raise
+        if not getter.done():
+            getter.cancel()
+            slot.timeouts += 1
+            raise PoolTimeoutError(
+                f"获取{'写' if write else '读'}连接超时（{self.timeout}s）"
+            )
+        return getter.result()
+
+    async def versions(self) -> Tuple[int, int]:
+        """
+        读取数据库版本号
+
+        Returns:
+            (schema_version, data_version)：前者随 DDL 递增，
+            后者在任何其他连接提交后变化
+        """
+        if not self._opened:
+            await self.open()
+        async with self._probe_lock:
+            # 读完即关闭游标，结束本次读事务，下次读取看到最新的提交
+            async with self._probe.execute(
+                "SELECT schema_version, data_version FROM pragma_schema_version, pragma_data_version"
+            ) as cursor:
+                row = await cursor.fetchone()
+        return row[0], row[1]
+
+    async def write(self, job: WriteJob) -> Any:
+        """
+        执行写操作
+
+        WAL 模式下提交给单写任务串行执行，否则直接借出写连接执行。
+
+        Args:
+            job: 接收写连接的协程函数，需自行提交事务
+
+        Returns:
+            job 的返回值
+        """
+        if not self._opened:
+            await self.open()
+        if self._writer is not None:
+            return await self._writer.submit(job)
+        async with self.acquire(write=True) as conn, self.writing():
+            return await job(conn)
+
+    @asynccontextmanager
+    async def writing(self):
+        """标记一个写操作正在执行（包括提交之后调用方记录写入的部分）"""
+        self.writes_started += 1
+        try:
+            yield
+        finally:
+            self.writes_finished += 1
+
+    @property
+    def write_idle(self) -> bool:
+        """当前没有写操作在执行"""
+        return self.writes_started == self.writes_finished
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池统计信息"""
+        stats = {
+            "opened": self._opened,
+            "journal_mode": self.journal_mode,
+            "timeout": self.timeout,
+            "readers": self._readers.stats(),
+            "writers": self._writers.stats(),
+        }
+        if self._writer is not None:
+            stats["writer_task"] = self._writer.stats()
+        return stats
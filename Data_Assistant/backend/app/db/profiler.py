@@ -0,0 +1,368 @@
+"""
+列画像模块
+用有界采样统计各列的不同值数、最小 / 最大值、空值比例、高频取值与日期粒度，
+按表版本缓存，供 get_schema 以紧凑形式写入提示词，减少模型猜测取值与日期格式。
+表写入后只有 rowid 范围或列变化超过阈值时才重新采样，零星写入沿用已有画像
+"""
+
+import logging
+import math
+import re
+import time
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple, TYPE_CHECKING
+from dataclasses import dataclass, field
+
+from app.config import settings
+
+if TYPE_CHECKING:
+    from app.db.sqlite_manager import SQLiteManager
+
+logger = logging.getLogger(__name__)
+
+# 文本日期格式：(粒度, 展示格式, 正则)
+_DATE_FORMATS = (
+    ("day", "YYYY-MM-DD", re.compile(r"^\d{4}-\d{2}-\d{2}$")),
+    ("datetime", "YYYY-MM-DD HH:MM:SS", re.compile(r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?$")),
+    ("month", "YYYY-MM", re.compile(r"^\d{4}-\d{2}$")),
+    ("day", "YYYY/MM/DD", re.compile(r"^\d{4}/\d{2}/\d{2}$")),
+)
+
+# 分块采样的块数：从 rowid 范围内均匀分布的若干起点各顺序读取一段
+_SAMPLE_BLOCKS = 16
+_MAX_VALUE_CHARS = 30
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _short(value: Any) -> str:
+    text = str(value)
+    return text if len(text) <= _MAX_VALUE_CHARS else text[:_MAX_VALUE_CHARS] + "…"
+
+
+@dataclass
+class ColumnProfile:
+    """单列画像"""
+    name: str
+    type: str
+    pk: bool = False
+    distinct: int = 0
+    distinct_exact: bool = True
+    null_ratio: float = 0.0
+    min: Any = None
+    max: Any = None
+    range_exact: bool = True
+    top: List[Tuple[Any, int]] = field(default_factory=list)
+    date_format: Optional[str] = None
+    date_granularity: Optional[str] = None
+
+    def describe(self) -> str:
+        """紧凑描述（用于 Schema 提示词）"""
+        parts = []
+        if self.pk:
+            parts.append("主键")
+        elif self.date_format:
+            approx = "" if self.range_exact else "约 "
+            parts.append(f"日期 {self.date_format}，{approx}{self.min} ~ {self.max}")
+        elif self.top and self.distinct <= settings.profile_max_distinct and isinstance(self.min, str):
+            values = ", ".join(_short(v) for v, _ in self.top)
+            more = " 等" if self.distinct > len(self.top) else ""
+            parts.append(f"{self.distinct} 个取值: {values}{more}")
+        elif self.min is not None:
+            if isinstance(self.min, (int, float)):
+                approx = "" if self.range_exact else "约 "
+                parts.append(f"范围 {approx}{self.min} ~ {self.max}")
+            approx = "" if self.distinct_exact else "约 "
+            parts.append(f"{approx}{self.distinct} 个不同值")
+        if self.null_ratio > 0:
+            parts.append(f"空值 {self.null_ratio:.0%}" if self.null_ratio >= 0.01 else "含少量空值")
+        return "，".join(parts)
+
+
+@dataclass
+class TableProfile:
+    """表画像"""
+    table: str
+    rows: int
+    sampled_rows: int
+    exact: bool
+    columns: Dict[str, ColumnProfile]
+    seconds: float
+    # 计算时的 rowid 范围大小（WITHOUT ROWID 表为 None）
+    span: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "table": self.table,
+            "rows": self.rows,
+            "sampled_rows": self.sampled_rows,
+            "exact": self.exact,
+            "seconds": round(self.seconds, 4),
+            "columns": {
+                name: {
+                    "type": c.type, "distinct": c.distinct, "distinct_exact": c.distinct_exact,
+                    "null_ratio": round(c.null_ratio, 4), "min": c.min, "max": c.max,
+                    "top": [list(item) for item in c.top], "date_granularity": c.date_granularity,
+                }
+                for name, c in self.columns.items()
+            },
+        }
+
+
+def estimate_distinct(counts: Counter, sampled: int, total: int) -> int:
+    """
+    由样本估计总体的不同值个数（GEE 估计量）
+
+    只出现一次的值按 sqrt(总数/样本数) 放大，出现多次的值视为已被完整观测
+    """
+    if sampled >= total or sampled == 0:
+        return len(counts)
+    singletons = sum(1 for c in counts.values() if c == 1)
+    estimate = math.sqrt(total / sampled) * singletons + (len(counts) - singletons)
+    return min(total, int(round(estimate)))
+
+
+def _date_format(values: List[str]) -> Optional[Tuple[str, str]]:
+    """样本中全部非空文本值符合同一日期格式时返回 (粒度, 格式)"""
+    if not values:
+        return None
+    for granularity, fmt, pattern in _DATE_FORMATS:
+        if all(pattern.match(v) for v in values):
+            return granularity, fmt
+    return None
+
+
+def profile_column(
+    name: str,
+    col_type: str,
+    values: List[Any],
+    total: int,
+    pk: bool = False,
+    exact: bool = True,
+) -> ColumnProfile:
+    """
+    统计一列的画像
+
+    Args:
+        name: 列名
+        col_type: 声明类型
+        values: 采样到的值（含 None）
+        total: 表的（估计）总行数
+        pk: 是否主键
+        exact: 样本是否为全表
+    """
+    profile = ColumnProfile(name=name, type=col_type, pk=pk, range_exact=exact)
+    non_null = [v for v in values if v is not None]
+    if values:
+        profile.null_ratio = 1 - len(non_null) / len(values)
+    if not non_null:
+        return profile
+
+    counts = Counter(non_null)
+    profile.distinct = estimate_distinct(counts, len(values), total) if not exact else len(counts)
+    profile.distinct_exact = exact or len(counts) == profile.distinct
+    top_k = settings.profile_top_k
+    profile.top = counts.most_common(top_k)
+
+    # 混合类型的列按 SQLite 的排序规则比较：数值 < 文本 < BLOB
+    def order(v):
+        if isinstance(v, (int, float)):
+            return (0, v, "")
+        if isinstance(v, str):
+            return (1, 0, v)
+        return (2, 0, repr(v))
+
+    profile.min = min(non_null, key=order)
+    profile.max = max(non_null, key=order)
+
+    if all(isinstance(v, str) for v in non_null):
+        date = _date_format(non_null)
+        if date:
+            profile.date_granularity, profile.date_format = date
+    return profile
+
+
+def _span(bounds: Optional[Tuple[Any, Any]]) -> Optional[int]:
+    """rowid 范围大小，空表为 0"""
+    if bounds is None:
+        return None
+    lo, hi = bounds
+    return 0 if lo is None else hi - lo + 1
+
+
+class ProfileStore:
+    """按表版本缓存的列画像"""
+
+    def __init__(self, db: "SQLiteManager"):
+        self.db = db
+        self._profiles: Dict[str, Tuple[Tuple, TableProfile]] = {}
+        self.computed = 0
+        self.hits = 0
+        self.reused = 0
+
+    async def _rowid_range(self, conn, table_name: str) -> Optional[Tuple[Any, Any]]:
+        """rowid 的最小 / 最大值（两次定位），WITHOUT ROWID 表返回 None"""
+        try:
+            cursor = await conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {_quote(table_name)}")
+        except Exception:
+            return None
+        return tuple(await cursor.fetchone())
+
+    async def _sample(
+        self, conn, table_name: str, bounds: Optional[Tuple[Any, Any]],
+    ) -> Tuple[List[Dict[str, Any]], int, bool]:
+        """
+        有界采样
+
+        rowid 范围不超过采样上限时读取全表；否则从均匀分布的若干 rowid 起点
+        各顺序读取一段（每段都走 rowid 定位，不扫描全表）。
+
+        Returns:
+            (样本行, 估计总行数, 是否为全表)
+        """
+        limit = settings.profile_sample_rows
+        table = _quote(table_name)
+        if bounds is None:
+            # WITHOUT ROWID 表：只取开头的行
+            cursor = await conn.execute(f"SELECT * FROM {table} LIMIT ?", (limit + 1,))
+            rows = [dict(row) for row in await cursor.fetchall()]
+            exact = len(rows) <= limit
+            return rows[:limit], len(rows[:limit]), exact
+        lo, hi = bounds
+        if lo is None:
+            return [], 0, True
+        span = hi - lo + 1
+        if span <= limit:
+            cursor = await conn.execute(f"SELECT * FROM {table}")
+            rows = [dict(row) for row in await cursor.fetchall()]
+            return rows, len(rows), True
+
+        per_block = max(1, limit // _SAMPLE_BLOCKS)
+        rows = []
+        for i in range(_SAMPLE_BLOCKS):
+            start = lo + span * i // _SAMPLE_BLOCKS
+            cursor = await conn.execute(
+                f"SELECT * FROM {table} WHERE rowid >= ? ORDER BY rowid LIMIT ?", (start, per_block)
+            )
+            rows.extend(dict(row) for row in await cursor.fetchall())
+        return rows, span, False
+
+    async def _indexed_bounds(self, conn, table_name: str, columns: List[str]) -> Dict[str, Tuple[Any, Any]]:
+        """索引首列的精确最小 / 最大值（各一次索引定位）"""
+        table = _quote(table_name)
+        cursor = await conn.execute(f"PRAGMA index_list({table})")
+        leading = set()
+        for index in await cursor.fetchall():
+            info = await conn.execute(f"PRAGMA index_info({_quote(index[1])})")
+            first = await info.fetchone()
+            if first is not None and first[2] in columns:
+                leading.add(first[2])
+        bounds = {}
+        for col in leading:
+            column = _quote(col)
+            cursor = await conn.execute(
+                f"SELECT (SELECT MIN({column}) FROM {table}), (SELECT MAX({column}) FROM {table})"
+            )
+            bounds[col] = tuple(await cursor.fetchone())
+        return bounds
+
+    async def compute(self, conn, table_name: str) -> TableProfile:
+        """在给定连接上计算表画像"""
+        started = time.perf_counter()
+        cursor = await conn.execute(f"PRAGMA table_info({_quote(table_name)})")
+        info = await cursor.fetchall()
+        bounds = await self._rowid_range(conn, table_name)
+        rows, total, exact = await self._sample(conn, table_name, bounds)
+        names = [col[1] for col in info]
+        ranges = {} if exact else await self._indexed_bounds(conn, table_name, names)
+
+        columns = {}
+        for col in info:
+            name = col[1]
+            profile = profile_column(
+                name, col[2], [row[name] for row in rows], total, pk=bool(col[5]), exact=exact,
+            )
+            if name in ranges and ranges[name][0] is not None:
+                profile.min, profile.max = ranges[name]
+                profile.range_exact = True
+            columns[name] = profile
+
+        self.computed += 1
+        return TableProfile(
+            table=table_name,
+            rows=total,
+            sampled_rows=len(rows),
+            exact=exact,
+            columns=columns,
+            seconds=time.perf_counter() - started,
+            span=_span(bounds),
+        )
+
+    async def _still_valid(self, conn, profile: TableProfile) -> bool:
+        """
+        表写入后已有采样画像是否仍可用：列不变，且 rowid 范围变化不超过阈值
+
+        全表统计的画像（小表）不沿用：UPDATE / DELETE 几乎不改变 rowid 范围，
+        却会让取值枚举、高频值与精确行数过期，而重新计算的代价很小
+        """
+        if profile.exact or profile.span is None:
+            return False
+        cursor = await conn.execute(f"PRAGMA table_info({_quote(profile.table)})")
+        if [col[1] for col in await cursor.fetchall()] != list(profile.columns):
+            return False
+        span = _span(await self._rowid_range(conn, profile.table))
+        if span is None:
+            return False
+        return abs(span - profile.span) <= settings.profile_refresh_ratio * max(profile.span, 1)
+
+    async def get(self, conn, table_name: str, key: Tuple) -> Optional[TableProfile]:
+        """
+        获取表画像
+
+        版本键变化时全表统计的画像总是重新计算；采样画像先比较列与 rowid 范围，
+        变化不超过 profile_refresh_ratio 时沿用已有画像。内部表与会话表不做画像
+
+        Args:
+            conn: 读连接
+            table_name: 表名
+            key: 调用方取得的表版本键
+
+        Returns:
+            表画像，未开启或计算失败时返回 None
+        """
+        if not settings.profile_enabled or self.db.is_reserved_table(table_name):
+            return None
+        cached = self._profiles.get(table_name.lower())
+        if cached and cached[0] == key:
+            self.hits += 1
+            return cached[1]
+        try:
+            if cached and await self._still_valid(conn, cached[1]):
+                self.reused += 1
+                self._profiles[table_name.lower()] = (key, cached[1])
+                return cached[1]
+            profile = await self.compute(conn, table_name)
+        except Exception as e:
+            logger.warning("column profiling failed for %s: %s", table_name, e)
+            return None
+        self._profiles[table_name.lower()] = (key, profile)
+        return profile
+
+    def cached(self, table_name: str) -> Optional[TableProfile]:
+        """最近一次计算的画像（不检查版本）"""
+        cached = self._profiles.get(table_name.lower())
+        return cached[1] if cached else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tables": {
+                name: {"rows": p.rows, "sampled_rows": p.sampled_rows, "exact": p.exact,
+                       "seconds": round(p.seconds, 4)}
+                for name, (_, p) in self._profiles.items()
+            },
+            "computed": self.computed,
+            "hits": self.hits,
+            "reused": self.reused,
+        }
@@ -0,0 +1,334 @@
+"""
+查询计划检查与索引建议模块
+执行 LLM 生成的 SQL 前用 EXPLAIN QUERY PLAN 识别大表全表扫描、临时 B 树与嵌套扫描，
+并按出现频率为常见过滤 / 分组列建议（或自动创建）覆盖索引
+"""
+
+import asyncio
+import logging
+import re
+from collections import Counter
+from typing import List, Dict, Any, Optional, Set, Tuple
+from dataclasses import dataclass, field
+
+from app.config import settings
+from app.db.sqlite_manager import SQLiteManager, db as shared_db
+from app.utils.metrics import metrics
+from app.utils.sql import Token, table_aliases, filter_columns, tokenize, split_clauses
+
+logger = logging.getLogger(__name__)
+
+# EXPLAIN QUERY PLAN 的 detail 文本
+_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\S+)(?: USING (COVERING )?INDEX (\S+))?")
+_TEMP_BTREE_RE = re.compile(r"^USE TEMP B-TREE FOR (.+)$")
+# 聚合函数：结果行数与扫描行数无关，追加 LIMIT 不能减少扫描
+_AGGREGATES = {"COUNT", "SUM", "TOTAL", "AVG", "MIN", "MAX", "GROUP_CONCAT"}
+
+
+def _strip_tail(sql: str, tokens: List[Token]) -> str:
+    """去掉末尾的注释、分号与空白（在语句后追加子句前必须去掉，否则会落入 -- 注释中）"""
+    while tokens and tokens[-1].value == ";":
+        tokens = tokens[:-1]
+    last = tokens[-1]
+    return sql[:last.pos + len(last.value)]
+
+
+def _aggregates(clauses: Dict[str, List[Token]]) -> bool:
+    """顶层查询是否为聚合查询（GROUP BY、HAVING 或选择列表中的聚合函数）"""
+    if "GROUP BY" in clauses or "HAVING" in clauses:
+        return True
+    select = clauses.get("SELECT", [])
+    return any(
+        token.kind == "ident" and token.upper in _AGGREGATES and i + 1 < len(select) and select[i + 1].value == "("
+        for i, token in enumerate(select)
+    )
+
+
+@dataclass
+class PlanIssue:
+    """查询计划中的高代价操作"""
+    kind: str  # full_scan / temp_btree / nested_scan
+    table: Optional[str]
+    rows: int
+    detail: str
+
+    def describe(self) -> str:
+        if self.kind == "full_scan":
+            return f"全表扫描 {self.table}（约 {self.rows} 行）"
+        if self.kind == "temp_btree":
+            return f"临时 B 树排序/分组（{self.detail}，约 {self.rows} 行）"
+        return f"嵌套扫描（{self.detail}，约 {self.rows} 行组合）"
+
+
+@dataclass
+class PlanVerdict:
+    """检查结论"""
+    action: str  # allow / warn / reject / rewrite
+    sql: str
+    issues: List[PlanIssue] = field(default_factory=list)
+
+    @property
+    def message(self) -> str:
+        return "；".join(issue.describe() for issue in self.issues)
+
+
+class QueryPlanGate:
+    """执行前的查询代价检查"""
+
+    def __init__(self, db: SQLiteManager):
+        self.db = db
+        self._row_estimates: Dict[str, Tuple[Tuple, int]] = {}
+
+    async def estimate_rows(self, table: str) -> int:
+        """估算表行数（MAX(rowid)，按表版本缓存）"""
+        key = await self.db.version_key([table])
+        cached = self._row_estimates.get(table)
+        if cached and cached[0] == key:
+            return cached[1]
+        try:
+            rows = await self.db.execute_query(f'SELECT MAX(rowid) AS n FROM "{table}"')
+            estimate = int(rows[0]["n"] or 0)
+        except Exception:
+            estimate = 0
+        self._row_estimates[table] = (key, estimate)
+        return estimate
+
+    async def explain(self, sql: str) -> List[Dict[str, Any]]:
+        """获取查询计划"""
+        async with self.db.get_connection() as conn:
+            # EXPLAIN 不读取数据库文件，不会触发 schema 重新加载；
+            # 先读一次 sqlite_master，避免按过期 schema（如缺少新建索引）给出计划
+            cursor = await conn.execute("SELECT 1 FROM sqlite_master LIMIT 1")
+            await cursor.fetchall()
+            cursor = await conn.execute(f"EXPLAIN QUERY PLAN {sql}")
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+    async def analyze(self, sql: str) -> List[PlanIssue]:
+        """识别超过阈值的高代价操作"""
+        plan = await self.explain(sql)
+        aliases = table_aliases(sql)
+        scan_threshold = settings.query_gate_scan_rows
+
+        issues: List[PlanIssue] = []
+        # 同一父节点下的全表扫描构成嵌套循环
+        scans_by_parent: Dict[int, List[Tuple[str, int]]] = {}
+        largest = 0
+        for step in plan:
+            detail = step["detail"]
+            match = _SCAN_RE.match(detail)
+            if match:
+                table = aliases.get(match.group(1))
+                if table is None:
+                    continue  # CTE / 子查询 / 常量行
+                rows = await self.estimate_rows(table)
+                largest = max(largest, rows)
+                if match.group(3):
+                    continue  # 按索引扫描
+                scans_by_parent.setdefault(step["parent"], []).append((table, rows))
+                if rows >= scan_threshold:
+                    issues.append(PlanIssue("full_scan", table, rows, detail))
+                continue
+            match = _TEMP_BTREE_RE.match(detail)
+            if match and largest >= scan_threshold:
+                issues.append(PlanIssue("temp_btree", None, largest, match.group(1)))
+
+        for scans in scans_by_parent.values():
+            if len(scans) < 2:
+                continue
+            combined = 1
+            for _, rows in scans:
+                combined *= max(rows, 1)
+            if combined >= settings.query_gate_nested_rows:
+                tables = " × ".join(table for table, _ in scans)
+                issues.append(PlanIssue("nested_scan", None, combined, tables))
+        return issues
+
+    def _rewrite(self, sql: str) -> Optional[str]:
+        """
+        为无 LIMIT 的单条非聚合 SELECT 追加 LIMIT，使排序改用有界排序并尽早结束扫描
+
+        聚合 / 分组查询在输出第一行之前就要扫描全部输入，LIMIT 不能降低代价，不改写
+        """
+        try:
+            tokens = tokenize(sql)
+            clauses = split_clauses(tokens)
+        except ValueError:
+            return None
+        if clauses is None or "LIMIT" in clauses or _aggregates(clauses):
+            return None
+        return f"{_strip_tail(sql, tokens)} LIMIT {settings.query_max_rows + 1}"
+
+    async def check(self, sql: str) -> PlanVerdict:
+        """
+        按配置的模式给出结论
+
+        off 不检查；warn 放行并附带警告；reject 拒绝；
+        rewrite 尽量改写（追加 LIMIT），无法改写（含聚合 / 分组查询）时按 warn 处理，嵌套扫描直接拒绝
+        """
+        mode = settings.query_gate_mode
+        if mode == "off":
+            return PlanVerdict("allow", sql)
+        try:
+            issues = await self.analyze(sql)
+        except Exception as e:
+            # 计划获取失败（语法错误等）交由执行阶段报告
+            logger.debug("explain failed: %s", e)
+            return PlanVerdict("allow", sql)
+        if not issues:
+            return PlanVerdict("allow", sql)
+
+        metrics.incr("query_gate.flagged")
+        if mode == "reject":
+            metrics.incr("query_gate.rejected")
+            return PlanVerdict("reject", sql, issues)
+        if mode == "rewrite":
+            if any(issue.kind == "nested_scan" for issue in issues):
+                metrics.incr("query_gate.rejected")
+                return PlanVerdict("reject", sql, issues)
+            rewritten = self._rewrite(sql)
+            if rewritten:
+                metrics.incr("query_gate.rewritten")
+                return PlanVerdict("rewrite", rewritten, issues)
+        return PlanVerdict("warn", sql, issues)
+
+
+class IndexAdvisor:
+    """记录生成 SQL 的过滤 / 分组列，为高频查询形态建议覆盖索引"""
+
+    MAX_INDEX_COLUMNS = 6
+
+    def __init__(self, db: SQLiteManager, gate: Optional[QueryPlanGate] = None):
+        self.db = db
+        self.gate = gate or QueryPlanGate(db)
+        self.shapes: Counter = Counter()
+        self.created: List[str] = []
+        self._columns: Dict[str, Tuple[Tuple, List[str]]] = {}
+        self._pending: Dict[str, str] = {}
+        # 进行中的自动建索引任务（保留引用，避免任务被回收）
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def _table_columns(self, table: str) -> List[str]:
+        key = await self.db.version_key([table])
+        cached = self._columns.get(table)
+        if cached and cached[0] == key:
+            return cached[1]
+        info = await self.db.get_table_schema(table)
+        columns = [col["name"] for col in info["columns"]]
+        self._columns[table] = (key, columns)
+        return columns
+
+    async def candidate(self, sql: str) -> Optional[Tuple[str, Tuple[str, ...]]]:
+        """
+        由 SQL 推导候选索引：等值过滤列、范围过滤列、分组列，再补充其余引用列以覆盖查询
+
+        Returns:
+            (表名, 列元组)，无法推导时返回 None
+        """
+        refs = filter_columns(sql)
+        if refs is None:
+            return None
+        tables = set(table_aliases(sql).values())
+        if len(tables) != 1:
+            return None
+        table = tables.pop()
+        valid = set(await self._table_columns(table))
+
+        ordered: List[str] = []
+        for key in ("eq", "range", "group", "order"):
+            for ref in refs[key]:
+                if ref["column"] in valid and ref["column"] not in ordered:
+                    ordered.append(ref["column"])
+        if not ordered:
+            return None
+        for ref in refs["other"]:
+            if ref["column"] in valid and ref["column"] not in ordered:
+                ordered.append(ref["column"])
+        if len(ordered) > self.MAX_INDEX_COLUMNS:
+            # 列过多时放弃覆盖，只保留过滤与分组列
+            ordered = ordered[:self.MAX_INDEX_COLUMNS]
+        return table, tuple(ordered)
+
+    @staticmethod
+    def index_name(table: str, columns: Tuple[str, ...]) -> str:
+        return "idx_advisor_" + "_".join((table,) + columns)
+
+    async def _existing_prefixes(self, table: str) -> List[Tuple[str, ...]]:
+        """表上已有索引的列序列"""
+        info = await self.db.get_table_schema(table)
+        prefixes = []
+        for index_name in info["indexes"]:
+            rows = await self.db.execute_query(f'PRAGMA index_info("{index_name}")')
+            prefixes.append(tuple(row["name"] for row in rows))
+        return prefixes
+
+    async def observe(self, sql: str) -> Optional[str]:
+        """
+        记录一次成功执行的 SQL
+
+        Returns:
+            达到阈值时返回建议的 CREATE INDEX 语句（开启自动创建时同时创建）
+        """
+        if not settings.index_advisor_enabled:
+            return None
+        try:
+            candidate = await self.candidate(sql)
+        except Exception as e:
+            logger.debug("index advisor skipped: %s", e)
+            return None
+        if candidate is None:
+            return None
+        table, columns = candidate
+        self.shapes[candidate] += 1
+        if self.shapes[candidate] < settings.index_advisor_min_hits:
+            return None
+        if await self.gate.estimate_rows(table) < settings.index_advisor_min_rows:
+            return None
+        for prefix in await self._existing_prefixes(table):
+            if prefix[:len(columns)] == columns:
+                return None
+
+        name = self.index_name(table, columns)
+        column_list = ", ".join(f'"{c}"' for c in columns)
+        statement = f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({column_list})'
+        if name not in self._pending:
+            self._pending[name] = statement
+            logger.info("index advisor proposes: %s", statement)
+            metrics.incr("index_advisor.proposed")
+            if settings.index_advisor_auto_create:
+                task = asyncio.create_task(self._create(name, statement))
+                self._tasks.add(task)
+                task.add_done_callback(self._task_done)
+        return statement
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("index creation task failed", exc_info=task.exception())
+
+    async def drain(self):
+        """等待进行中的自动建索引任务结束（关闭连接池前调用）"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _create(self, name: str, statement: str):
+        try:
+            await self.db.execute_update(statement)
+            self.created.append(name)
+            metrics.incr("index_advisor.created")
+        except Exception as e:
+            logger.warning("index creation failed (%s): %s", name, e)
+
+    def proposals(self) -> List[Dict[str, Any]]:
+        """当前的建议与查询形态计数"""
+        return [
+            {"table": table, "columns": list(columns), "hits": hits,
+             "index": self.index_name(table, columns),
+             "created": self.index_name(table, columns) in self.created}
+            for (table, columns), hits in self.shapes.most_common(20)
+        ]
+
+
+# 创建全局实例
+plan_gate = QueryPlanGate(shared_db)
+index_advisor = IndexAdvisor(shared_db, plan_gate)
@@ -0,0 +1,200 @@
+"""
+查询结果模块
+列式结果表示（列名只出现一次）、有界结果集及其截断元数据
+
+列式 JSON 格式:
+    {"columns": [...], "types": [...], "values": [[第1列...], [第2列...]]}
+旧的行字典格式（List[Dict]）通过 decode_data / Columnar.from_rows 兼容
+"""
+
+from array import array
+from typing import List, Dict, Any, Optional, Sequence, Iterator, Tuple, Union
+from dataclasses import dataclass, field
+
+# 无空值的整数 / 浮点列使用 array 存储
+_ARRAY_TYPECODES = {"integer": "q", "real": "d"}
+
+
+def _value_type(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "integer"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "real"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "blob"
+    return "text"
+
+
+def _merge_type(current: str, value_type: str) -> str:
+    if current == value_type or value_type == "null":
+        return current
+    if current == "null":
+        return value_type
+    if {current, value_type} == {"integer", "real"}:
+        return "real"
+    return "mixed"
+
+
+def estimate_values_bytes(values: Sequence[Any]) -> int:
+    """粗略估算一行值序列化后的字节数（不含列名）"""
+    size = 2
+    for value in values:
+        if isinstance(value, str):
+            size += len(value.encode("utf-8")) + 3
+        elif isinstance(value, bytes):
+            size += len(value) * 2 + 3
+        else:
+            size += 8
+    return size
+
+
+class Columnar:
+    """列式结果：每列一个数组，无空值的数值列使用 array 存储"""
+
+    def __init__(self, columns: Sequence[str], types: Optional[Sequence[str]] = None):
+        self.columns = list(columns)
+        self.types = list(types) if types else ["null"] * len(self.columns)
+        self.values: List[Union[array, list]] = [
+            array(_ARRAY_TYPECODES[t]) if t in _ARRAY_TYPECODES else []
+            for t in self.types
+        ]
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(self, row: Sequence[Any]):
+        """追加一行（按列顺序的值序列）"""
+        for i, value in enumerate(row):
+            column = self.values[i]
+            value_type = _value_type(value)
+            merged = _merge_type(self.types[i], value_type)
+            if merged != self.types[i]:
+                self.types[i] = merged
+                if self._length == 0 and merged in _ARRAY_TYPECODES:
+                    column = self.values[i] = array(_ARRAY_TYPECODES[merged])
+            if isinstance(column, array) and (
+                value is None or _ARRAY_TYPECODES.get(value_type) != column.typecode
+            ):
+                # 出现空值或类型变化，退化为普通列表
+                column = self.values[i] = list(column)
+            column.append(value)
+        self._length += 1
+
+    def extend(self, rows: "Union[Columnar, Sequence[Sequence[Any]]]"):
+        """追加多行"""
+        source = rows.iter_rows() if isinstance(rows, Columnar) else rows
+        for row in source:
+            self.append(row)
+
+    def iter_rows(self) -> Iterator[Tuple[Any, ...]]:
+        """按行迭代值元组"""
+        return zip(*self.values) if self.values else iter(())
+
+    def slice(self, start: int, stop: Optional[int] = None) -> "Columnar":
+        """截取 [start, stop) 行"""
+        part = Columnar(self.columns)
+        part.types = list(self.types)
+        part.values = [column[start:stop] for column in self.values]
+        part._length = len(part.values[0]) if part.values else 0
+        return part
+
+    def column(self, name: str) -> Union[array, list]:
+        """按列名取列"""
+        return self.values[self.columns.index(name)]
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """转换为旧的行字典格式"""
+        return [dict(zip(self.columns, row)) for row in self.iter_rows()]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """列式 JSON 表示"""
+        return {
+            "columns": self.columns,
+            "types": self.types,
+            "values": [list(column) for column in self.values],
+        }
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]]) -> "Columnar":
+        """由行字典构建（兼容旧格式）"""
+        columns: List[str] = []
+        for row in rows:
+            for key in row:
+                if key not in columns:
+                    columns.append(key)
+        data = cls(columns)
+        for row in rows:
+            data.append([row.get(c) for c in columns])
+        return data
+
+    @classmethod
+    def from_dict(cls, payload: Dict[str, Any]) -> "Columnar":
+        """由列式 JSON 表示构建"""
+        data = cls(payload["columns"])
+        values = payload.get("values") or []
+        data.extend(zip(*values) if values else [])
+        return data
+
+
+def is_columnar(payload: Any) -> bool:
+    """是否为列式 JSON 表示"""
+    return isinstance(payload, dict) and "columns" in payload and "values" in payload
+
+
+def decode_data(payload: Any) -> Optional[List[Dict[str, Any]]]:
+    """兼容解码：列式表示或旧的行字典列表统一转换为行字典"""
+    if payload is None:
+        return None
+    if isinstance(payload, Columnar):
+        return payload.to_rows()
+    if is_columnar(payload):
+        return Columnar.from_dict(payload).to_rows()
+    return payload
+
+
+def encode_data(payload: Any) -> Optional[Dict[str, Any]]:
+    """兼容编码：行字典列表或 Columnar 统一转换为列式 JSON 表示"""
+    if payload is None:
+        return None
+    if isinstance(payload, Columnar):
+        return payload.to_dict()
+    if is_columnar(payload):
+        return payload
+    return Columnar.from_rows(payload).to_dict()
+
+
+@dataclass
+class ResultSet:
+    """有界查询结果"""
+    data: Columnar
+    truncated: bool = False
+    truncate_reason: Optional[str] = None  # max_rows / max_bytes
+    approx_bytes: int = 0
+    _rows: Optional[List[Dict[str, Any]]] = field(default=None, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def columns(self) -> List[str]:
+        return self.data.columns
+
+    @property
+    def rows(self) -> List[Dict[str, Any]]:
+        """行字典格式（兼容旧接口）"""
+        if self._rows is None or len(self._rows) != len(self.data):
+            self._rows = self.data.to_rows()
+        return self._rows
+
+    def meta(self) -> Dict[str, Any]:
+        """随结果下发的元数据"""
+        return {
+            "count": len(self.data),
+            "truncated": self.truncated,
+            "truncate_reason": self.truncate_reason,
+        }
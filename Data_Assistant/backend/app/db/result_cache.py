@@ -0,0 +1,112 @@
+"""
+查询结果缓存模块
+按规范化 SQL 缓存只读查询结果，条目带数据版本键，表被写入后自动失效；
+按条目数与结果字节数双重限制的 LRU 淘汰
+"""
+
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple, Iterable, List
+from dataclasses import dataclass
+
+from app.config import settings
+from app.db.result import ResultSet
+
+
+@dataclass
+class CacheEntry:
+    """缓存条目"""
+    version: Tuple
+    tables: Tuple[str, ...]
+    result: ResultSet
+    size: int
+
+
+class ResultCache:
+    """查询结果 LRU 缓存"""
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries or settings.result_cache_max_entries
+        self.max_bytes = max_bytes or settings.result_cache_max_bytes
+        self._entries: "OrderedDict[Tuple, CacheEntry]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Tuple, version: Tuple) -> Optional[ResultSet]:
+        """
+        查找缓存
+
+        Args:
+            key: 规范化 SQL 及结果上限组成的键
+            version: 当前数据版本键，与条目不一致时视为过期并删除
+
+        Returns:
+            缓存的结果集，未命中返回 None
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.version != version:
+            self._remove(key)
+            self.invalidations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.result
+
+    def put(self, key: Tuple, version: Tuple, tables: Iterable[str], result: ResultSet):
+        """写入缓存（超过总容量四分之一的结果不缓存）"""
+        size = result.approx_bytes
+        if size > self.max_bytes // 4:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = CacheEntry(version, tuple(t.lower() for t in tables), result, size)
+        self.bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, tables: Optional[Iterable[str]] = None):
+        """
+        删除引用了指定表的条目
+
+        Args:
+            tables: 被写入的表，None 表示全部删除
+        """
+        if tables is None:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self.bytes = 0
+            return
+        written = {t.lower() for t in tables}
+        stale: List[Tuple] = [
+            key for key, entry in self._entries.items() if written.intersection(entry.tables)
+        ]
+        for key in stale:
+            self._remove(key)
+        self.invalidations += len(stale)
+
+    def _remove(self, key: Tuple):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
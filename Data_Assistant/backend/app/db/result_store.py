@@ -0,0 +1,231 @@
+"""
+查询结果分页存储模块
+查询结果写入临时溢出文件（每行一个 JSON 数组），前端按 offset 分页读取，无需重新执行 SQL
+文件读写在线程中执行，不阻塞事件循环
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from typing import List, Dict, Any, Optional
+from dataclasses import dataclass, field
+
+from app.config import settings
+from app.db.result import Columnar
+
+# 每隔多少行记录一次文件偏移，分页时据此定位
+INDEX_STRIDE = 100
+
+
+@dataclass
+class ResultHandle:
+    """一次查询结果的句柄"""
+    id: str
+    columns: List[str]
+    types: List[str]
+    path: str
+    count: int = 0
+    complete: bool = False
+    truncated: bool = False
+    truncate_reason: Optional[str] = None
+    offsets: List[int] = field(default_factory=lambda: [0])
+    size: int = 0
+    created_at: float = field(default_factory=time.monotonic)
+    last_access: float = field(default_factory=time.monotonic)
+
+
+class ResultStore:
+    """结果句柄管理：写入溢出文件、分页读取、过期清理"""
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        ttl: Optional[float] = None,
+        max_handles: Optional[int] = None,
+    ):
+        self._directory = directory or settings.result_spill_dir
+        self._owns_directory = False
+        self.ttl = ttl or settings.result_ttl_seconds
+        self.max_handles = max_handles or settings.result_max_handles
+        self._handles: Dict[str, ResultHandle] = {}
+        self.pages_served = 0
+
+    @property
+    def directory(self) -> str:
+        if not self._directory:
+            self._directory = tempfile.mkdtemp(prefix="data_assistant_results_")
+            self._owns_directory = True
+        os.makedirs(self._directory, exist_ok=True)
+        return self._directory
+
+    async def create(self, columns: List[str], types: Optional[List[str]] = None) -> ResultHandle:
+        """登记新的结果句柄"""
+        await self._evict()
+        result_id = uuid.uuid4().hex
+        handle = ResultHandle(
+            id=result_id,
+            columns=list(columns),
+            types=list(types) if types else ["null"] * len(columns),
+            path=os.path.join(self.directory, f"{result_id}.ndjson"),
+        )
+        await asyncio.to_thread(_touch, handle.path)
+        self._handles[result_id] = handle
+        return handle
+
+    async def append(self, handle: ResultHandle, rows: Columnar):
+        """追加结果行（同一句柄的追加须依次等待完成）"""
+        if not len(rows):
+            return
+        handle.last_access = time.monotonic()
+        handle.types = list(rows.types)
+        sizes = await asyncio.to_thread(_write_rows, handle.path, rows)
+        # 行数在写入完成后才更新，分页读取只会读到完整写入的行
+        for size in sizes:
+            handle.size += size
+            handle.count += 1
+            if handle.count % INDEX_STRIDE == 0:
+                handle.offsets.append(handle.size)
+
+    def finish(
+        self,
+        handle: ResultHandle,
+        truncated: bool = False,
+        truncate_reason: Optional[str] = None,
+        types: Optional[List[str]] = None,
+    ):
+        """标记结果写入完成"""
+        handle.complete = True
+        if types:
+            handle.types = list(types)
+        handle.truncated = truncated
+        handle.truncate_reason = truncate_reason
+
+    async def get(self, result_id: str) -> Optional[ResultHandle]:
+        handle = self._handles.get(result_id)
+        if handle is None:
+            return None
+        if time.monotonic() - handle.last_access > self.ttl:
+            await self.discard(result_id)
+            return None
+        return handle
+
+    async def page(self, result_id: str, offset: int = 0, limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        读取一页结果
+
+        Args:
+            result_id: 结果句柄 ID
+            offset: 起始行
+            limit: 行数，默认取配置的分页大小
+
+        Returns:
+            分页数据，句柄不存在或已过期时返回 None
+        """
+        handle = await self.get(result_id)
+        if handle is None:
+            return None
+        handle.last_access = time.monotonic()
+        limit = limit or settings.result_page_size
+        offset = max(0, offset)
+
+        rows = Columnar(handle.columns)
+        if offset < handle.count:
+            anchor = min(offset // INDEX_STRIDE, len(handle.offsets) - 1)
+            lines = await asyncio.to_thread(
+                _read_lines,
+                handle.path,
+                handle.offsets[anchor],
+                offset - anchor * INDEX_STRIDE,
+                min(limit, handle.count - offset),
+            )
+            for line in lines:
+                rows.append(json.loads(line))
+        rows.types = list(handle.types)
+
+        self.pages_served += 1
+        return {
+            "result_id": handle.id,
+            "data": rows.to_dict(),
+            "offset": offset,
+            "total": handle.count,
+            "complete": handle.complete,
+            "has_more": offset + len(rows) < handle.count or not handle.complete,
+            "truncated": handle.truncated,
+        }
+
+    async def discard(self, result_id: str):
+        """删除结果句柄及其文件"""
+        handle = self._handles.pop(result_id, None)
+        if handle is not None:
+            await asyncio.to_thread(_remove, handle.path)
+
+    async def _evict(self):
+        """清理过期句柄，并在数量超限时淘汰最久未访问的句柄"""
+        now = time.monotonic()
+        for result_id, handle in list(self._handles.items()):
+            if now - handle.last_access > self.ttl:
+                await self.discard(result_id)
+        while len(self._handles) >= self.max_handles:
+            oldest = min(self._handles.values(), key=lambda h: h.last_access)
+            await self.discard(oldest.id)
+
+    async def close(self):
+        """删除所有溢出文件"""
+        for result_id in list(self._handles):
+            await self.discard(result_id)
+        if self._owns_directory:
+            await asyncio.to_thread(shutil.rmtree, self._directory, ignore_errors=True)
+            self._directory = None
+            self._owns_directory = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "handles": len(self._handles),
+            "bytes": sum(h.size for h in self._handles.values()),
+            "pages_served": self.pages_served,
+        }
+
+
+def _touch(path: str):
+    open(path, "wb").close()
+
+
+def _write_rows(path: str, rows: Columnar) -> List[int]:
+    """追加写入结果行，返回每行的字节数"""
+    sizes = []
+    with open(path, "ab") as f:
+        for row in rows.iter_rows():
+            line = json.dumps(row, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+            f.write(line)
+            sizes.append(len(line))
+    return sizes
+
+
+def _read_lines(path: str, start: int, skip: int, limit: int) -> List[bytes]:
+    """从文件偏移 start 处跳过 skip 行后读取至多 limit 行"""
+    lines = []
+    with open(path, "rb") as f:
+        f.seek(start)
+        for line in f:
+            if skip:
+                skip -= 1
+                continue
+            if len(lines) >= limit:
+                break
+            lines.append(line)
+    return lines
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# 创建全局实例
+result_store = ResultStore()
@@ -0,0 +1,465 @@
+"""
+预聚合表（Rollup）模块
+为事实表维护按维度组合预先聚合的汇总表，insert_data 追加数据时增量更新；
+生成的聚合 SQL 若能由汇总表回答，则改写为读取能回答它的最小汇总表
+"""
+
+import asyncio
+import logging
+from typing import List, Dict, Any, Optional, Tuple, Set, TYPE_CHECKING
+from dataclasses import dataclass
+
+from app.config import settings
+from app.utils.metrics import metrics
+from app.utils.sql import (
+    Token, tokenize, split_clauses, is_keyword, render_tokens, matching_paren,
+    split_top_level, item_alias, strip_qualifiers, source_span, single_table_source,
+)
+
+if TYPE_CHECKING:
+    from app.db.sqlite_manager import SQLiteManager
+
+logger = logging.getLogger(__name__)
+
+# 可由部分聚合合并得到的聚合函数
+_AGGREGATES = {"SUM", "TOTAL", "COUNT", "AVG", "MIN", "MAX"}
+_NUMERIC_AFFINITY = ("INT", "REAL", "FLOA", "DOUB", "NUM", "DEC")
+
+
+@dataclass(frozen=True)
+class RollupDefinition:
+    """汇总表定义"""
+    name: str
+    source: str
+    # (列名, 表达式)：列名与表达式相同表示直接取源表列，否则为派生维度
+    dimensions: Tuple[Tuple[str, str], ...]
+
+    @property
+    def dimension_names(self) -> List[str]:
+        return [name for name, _ in self.dimensions]
+
+    @property
+    def raw_dimensions(self) -> Set[str]:
+        """直接取自源表的维度列"""
+        return {name.lower() for name, expr in self.dimensions if name == expr}
+
+    @property
+    def derived_dimensions(self) -> List[Tuple[str, str]]:
+        """派生维度：(列名, 规范化后的表达式文本)"""
+        return [
+            (name, render_tokens(tokenize(expr)))
+            for name, expr in self.dimensions if name != expr
+        ]
+
+
+def _dims(*columns: str) -> Tuple[Tuple[str, str], ...]:
+    return tuple((c, c) for c in columns)
+
+
+# 按月份 / 日期 × 地区 × 品类（× 产品）的销售汇总
+DEFAULT_ROLLUPS = (
+    RollupDefinition(
+        "sales_monthly_region_category", "sales",
+        (("month", "strftime('%Y-%m', sale_date)"),) + _dims("region", "category"),
+    ),
+    RollupDefinition("sales_daily_region_category", "sales", _dims("sale_date", "region", "category")),
+    RollupDefinition(
+        "sales_daily_region_category_product", "sales",
+        _dims("sale_date", "region", "category", "product_name"),
+    ),
+)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _key_expressions(definition: RollupDefinition) -> str:
+    """
+    汇总表唯一键的索引表达式
+
+    维度可能为 NULL，而 UNIQUE 索引中的 NULL 互不相等：NULL 折叠为 '' 以便合并，
+    另加 IS NULL 与真实的空字符串区分
+    """
+    parts = []
+    for dim in definition.dimension_names:
+        col = _quote(dim)
+        parts += [f"IFNULL({col}, '')", f"{col} IS NULL"]
+    return ", ".join(parts)
+
+
+class _Unanswerable(Exception):
+    """查询无法由指定汇总表回答"""
+
+
+class RollupManager:
+    """汇总表的构建、增量维护与查询改写"""
+
+    def __init__(self, db: "SQLiteManager", definitions: Optional[Tuple[RollupDefinition, ...]] = None):
+        self.db = db
+        self.definitions = tuple(definitions if definitions is not None else DEFAULT_ROLLUPS)
+        # {汇总表名: (构建时源表的版本键, 行数)}
+        self._state: Dict[str, Tuple[Tuple, int]] = {}
+        # {源表名: (schema_version, {列名: 类型}, 主键列)}
+        self._columns: Dict[str, Tuple[int, Dict[str, str], Optional[str]]] = {}
+        self._refreshing: Optional[asyncio.Task] = None
+        self.rewrites = 0
+
+    def is_rollup(self, table_name: str) -> bool:
+        return any(d.name.lower() == table_name.lower() for d in self.definitions)
+
+    async def _source_columns(self, source: str) -> Tuple[Dict[str, str], Optional[str]]:
+        """源表列（小写列名 → 声明类型）及 INTEGER PRIMARY KEY 列"""
+        schema_version, _, _ = await self.db.version_key()
+        cached = self._columns.get(source)
+        if cached and cached[0] == schema_version:
+            return cached[1], cached[2]
+        info = await self.db.get_table_schema(source)
+        columns = {col["name"].lower(): (col["type"] or "").upper() for col in info["columns"]}
+        pk = [col["name"].lower() for col in info["columns"] if col["pk"]]
+        rowid_alias = pk[0] if len(pk) == 1 and columns[pk[0]] == "INTEGER" else None
+        self._columns[source] = (schema_version, columns, rowid_alias)
+        return columns, rowid_alias
+
+    async def _measures(self, definition: RollupDefinition) -> List[str]:
+        """数值型、非主键、非维度的列作为度量"""
+        columns, rowid_alias = await self._source_columns(definition.source)
+        dims = definition.raw_dimensions
+        return [
+            name for name, col_type in columns.items()
+            if name != rowid_alias and name not in dims
+            and any(affinity in col_type for affinity in _NUMERIC_AFFINITY)
+        ]
+
+    async def _source_key(self, source: str) -> Tuple:
+        # 去掉 schema_version：重建其他汇总表的 DDL 不应使本表过期
+        return (await self.db.version_key([source]))[1:]
+
+    async def is_fresh(self, definition: RollupDefinition) -> bool:
+        state = self._state.get(definition.name)
+        return state is not None and state[0] == await self._source_key(definition.source)
+
+    async def _applicable(self, definition: RollupDefinition) -> bool:
+        """源表存在且包含全部原始维度列"""
+        if not await self.db.table_exists(definition.source):
+            return False
+        columns, _ = await self._source_columns(definition.source)
+        return definition.raw_dimensions <= set(columns)
+
+    # ------------------------------------------------------------------
+    # 构建与维护
+    # ------------------------------------------------------------------
+
+    def _aggregate_select(self, definition: RollupDefinition, measures: List[str]) -> str:
+        parts = [expr for _, expr in definition.dimensions]
+        for m in measures:
+            col = _quote(m)
+            parts += [f"SUM({col})", f"COUNT({col})", f"MIN({col})", f"MAX({col})"]
+        parts.append("COUNT(*)")
+        return ", ".join(parts)
+
+    def _rollup_columns(self, definition: RollupDefinition, measures: List[str]) -> List[str]:
+        columns = list(definition.dimension_names)
+        for m in measures:
+            columns += [f"sum_{m}", f"count_{m}", f"min_{m}", f"max_{m}"]
+        columns.append("row_count")
+        return columns
+
+    async def refresh(self, source: Optional[str] = None, force: bool = False) -> List[str]:
+        """
+        全量重建过期的汇总表
+
+        Args:
+            source: 只处理该源表的汇总表，None 表示全部
+            force: 忽略新鲜度强制重建
+
+        Returns:
+            重建的汇总表名
+        """
+        if not settings.rollup_enabled:
+            return []
+        rebuilt = []
+        for definition in self.definitions:
+            if source is not None and definition.source.lower() != source.lower():
+                continue
+            if not await self._applicable(definition):
+                continue
+            if not force and await self.is_fresh(definition):
+                continue
+            await self._build(definition)
+            rebuilt.append(definition.name)
+        return rebuilt
+
+    async def _build(self, definition: RollupDefinition):
+        measures = await self._measures(definition)
+        columns = self._rollup_columns(definition, measures)
+        group_by = ", ".join(str(i + 1) for i in range(len(definition.dimensions)))
+        name = _quote(definition.name)
+        self._state.pop(definition.name, None)
+
+        async def job(conn):
+            # 在同一事务中重建，读连接在提交前看到的仍是旧表
+            await conn.execute("BEGIN")
+            await conn.execute(f"DROP TABLE IF EXISTS {name}")
+            await conn.execute(f"CREATE TABLE {name} ({', '.join(_quote(c) for c in columns)})")
+            await conn.execute(
+                f"INSERT INTO {name} SELECT {self._aggregate_select(definition, measures)} "
+                f"FROM {_quote(definition.source)} GROUP BY {group_by}"
+            )
+            await conn.execute(
+                f"CREATE UNIQUE INDEX {_quote('ux_' + definition.name)} ON {name} ({_key_expressions(definition)})"
+            )
+            await conn.commit()
+            await self.db._mark_written([definition.name])
+            cursor = await conn.execute(f"SELECT COUNT(*) FROM {name}")
+            return (await cursor.fetchone())[0]
+
+        rows = await self.db.pool.write(job)
+        self._state[definition.name] = (await self._source_key(definition.source), rows)
+        metrics.incr("rollup.rebuilt")
+        logger.info("rollup %s rebuilt (%d rows)", definition.name, rows)
+
+    async def fresh_for(self, source: str) -> List[RollupDefinition]:
+        """源表当前新鲜的汇总表（写入前调用，之后可增量维护）"""
+        if not settings.rollup_enabled:
+            return []
+        return [
+            d for d in self.definitions
+            if d.source.lower() == source.lower() and await self.is_fresh(d)
+        ]
+
+    async def can_append(self, source: str, columns: List[str]) -> bool:
+        """写入的列不含 INTEGER PRIMARY KEY 时，新行的 rowid 一定大于写入前的最大值"""
+        _, rowid_alias = await self._source_columns(source)
+        return rowid_alias is None or rowid_alias not in {c.lower() for c in columns}
+
+    async def apply_insert(self, conn, definitions: List[RollupDefinition], after_rowid: int) -> List[str]:
+        """
+        将 rowid 大于 after_rowid 的新行合并进汇总表（在写入事务中、提交前调用）
+
+        Returns:
+            更新的汇总表名
+        """
+        updated = []
+        for definition in definitions:
+            measures = await self._measures(definition)
+            columns = self._rollup_columns(definition, measures)
+            group_by = ", ".join(str(i + 1) for i in range(len(definition.dimensions)))
+            assignments = []
+            for m in measures:
+                s, c, lo, hi = (_quote(f"{p}_{m}") for p in ("sum", "count", "min", "max"))
+                assignments += [
+                    f"{s} = CASE WHEN excluded.{s} IS NULL THEN {s} WHEN {s} IS NULL THEN excluded.{s} "
+                    f"ELSE {s} + excluded.{s} END",
+                    f"{c} = {c} + excluded.{c}",
+                    f"{lo} = MIN(COALESCE({lo}, excluded.{lo}), COALESCE(excluded.{lo}, {lo}))",
+                    f"{hi} = MAX(COALESCE({hi}, excluded.{hi}), COALESCE(excluded.{hi}, {hi}))",
+                ]
+            assignments.append('"row_count" = "row_count" + excluded."row_count"')
+            await conn.execute(
+                f"INSERT INTO {_quote(definition.name)} ({', '.join(_quote(c) for c in columns)}) "
+                f"SELECT {self._aggregate_select(definition, measures)} FROM {_quote(definition.source)} "
+                f"WHERE rowid > ? GROUP BY {group_by} "
+                f"ON CONFLICT ({_key_expressions(definition)}) DO UPDATE SET {', '.join(assignments)}",
+                (after_rowid,),
+            )
+            updated.append(definition.name)
+        return updated
+
+    async def mark_fresh(self, names: List[str]):
+        """增量维护提交后记录新的源表版本"""
+        for definition in self.definitions:
+            if definition.name not in names:
+                continue
+            cursor_rows = await self.db.execute_query(f"SELECT COUNT(*) AS n FROM {_quote(definition.name)}")
+            self._state[definition.name] = (await self._source_key(definition.source), cursor_rows[0]["n"])
+        metrics.incr("rollup.incremental", len(names))
+
+    def _schedule_refresh(self, source: str):
+        """后台重建过期的汇总表"""
+        if self._refreshing is not None and not self._refreshing.done():
+            return
+        self._refreshing = asyncio.create_task(self._refresh_quietly(source))
+
+    async def drain(self):
+        """等待进行中的后台重建结束（关闭连接池前调用）"""
+        if self._refreshing is not None:
+            await asyncio.gather(self._refreshing, return_exceptions=True)
+            self._refreshing = None
+
+    async def _refresh_quietly(self, source: str):
+        try:
+            await self.refresh(source)
+        except Exception as e:
+            logger.warning("rollup refresh failed: %s", e)
+
+    # ------------------------------------------------------------------
+    # 查询改写
+    # ------------------------------------------------------------------
+
+    async def rewrite(self, sql: str) -> Optional[Tuple[str, str]]:
+        """
+        将可由汇总表回答的聚合查询改写为读取最小的汇总表
+
+        Args:
+            sql: 生成的 SQL
+
+        Returns:
+            (改写后的 SQL, 汇总表名)，无法改写时返回 None
+        """
+        if not settings.rollup_enabled:
+            return None
+        try:
+            tokens = tokenize(sql)
+        except ValueError:
+            return None
+        while tokens and tokens[-1].value == ";":
+            tokens = tokens[:-1]
+        clauses = split_clauses(tokens)
+        if clauses is None or "FROM" not in clauses:
+            return None
+
+        parsed = single_table_source(clauses["FROM"])
+        if parsed is None:
+            return None  # JOIN、子查询等
+        source, names = parsed
+
+        candidates = [d for d in self.definitions if d.source.lower() == source.lower()]
+        if not candidates:
+            return None
+
+        best: Optional[Tuple[int, str, str]] = None
+        stale = False
+        for definition in candidates:
+            if not await self.is_fresh(definition):
+                stale = True
+                continue
+            try:
+                rewritten = await self._rewrite_for(sql, clauses, names, definition)
+            except _Unanswerable:
+                continue
+            rows = self._state[definition.name][1]
+            if best is None or rows < best[0]:
+                best = (rows, rewritten, definition.name)
+        if stale and await self._applicable(candidates[0]):
+            self._schedule_refresh(source)
+        if best is None:
+            return None
+        self.rewrites += 1
+        metrics.incr("rollup.rewritten")
+        return best[1], best[2]
+
+    async def _rewrite_for(
+        self,
+        sql: str,
+        clauses: Dict[str, List[Token]],
+        names: Set[str],
+        definition: RollupDefinition,
+    ) -> str:
+        columns, _ = await self._source_columns(definition.source)
+        measures = set(await self._measures(definition))
+        raw_dims = definition.raw_dimensions
+        derived = [(name, text, len(tokenize(text))) for name, text in definition.derived_dimensions]
+
+        select_aliases = set()
+        for item in split_top_level(clauses["SELECT"]):
+            alias = item_alias(item)
+            if alias is not None:
+                if alias.lower() in columns and not (len(item) <= 3 and item[0].name.lower() == alias.lower()):
+                    raise _Unanswerable()  # 别名与源表列同名，解析优先级不明确
+                select_aliases.add(alias.lower())
+
+        state = {"aggregates": 0, "bare_dims": 0}
+
+        def rewrite_part(part: List[Token], in_select: bool = False) -> str:
+            part = strip_qualifiers(part, names)
+            out: List[str] = []
+            i = 0
+            while i < len(part):
+                token = part[i]
+                if token.value in ("?", ";") or is_keyword(token, "SELECT", "DISTINCT", "OVER", "JOIN", "WINDOW"):
+                    raise _Unanswerable()
+                # 派生维度（如按月）
+                matched = False
+                for name, text, length in derived:
+                    if render_tokens(part[i:i + length]) == text:
+                        out.append(_quote(name))
+                        i += length
+                        matched = True
+                        break
+                if matched:
+                    continue
+                if token.kind == "ident" and token.upper in _AGGREGATES and i + 1 < len(part) and part[i + 1].value == "(":
+                    end = matching_paren(part, i + 1)
+                    if end < 0:
+                        raise _Unanswerable()
+                    out.append(self._rewrite_aggregate(token.upper, part[i + 2:end], measures, raw_dims))
+                    state["aggregates"] += 1
+                    i = end + 1
+                    continue
+                if token.value == "*":
+                    raise _Unanswerable()
+                if token.kind in ("ident", "qident") and not (i + 1 < len(part) and part[i + 1].value == "("):
+                    name = token.name.lower()
+                    if i > 0 and is_keyword(part[i - 1], "AS"):
+                        pass  # 别名定义
+                    elif name in select_aliases and not in_select:
+                        pass
+                    elif name in columns or token.kind == "qident":
+                        if name not in raw_dims:
+                            raise _Unanswerable()
+                        if in_select:
+                            state["bare_dims"] += 1
+                out.append(token.value)
+                i += 1
+            return " ".join(out)
+
+        select_parts = []
+        for item in split_top_level(clauses["SELECT"]):
+            if not item:
+                raise _Unanswerable()
+            text = rewrite_part(item, in_select=True)
+            raw = source_span(sql, item)
+            bare = strip_qualifiers(item, names)
+            if item_alias(item) is None and not (len(bare) == 1 and bare[0].kind in ("ident", "qident")):
+                # 未命名表达式的结果列名取自原文，改写后保持一致
+                text = f"{text} AS {_quote(raw)}"
+            select_parts.append(text)
+
+        parts = [f"SELECT {', '.join(select_parts)}", f"FROM {_quote(definition.name)}"]
+        for clause in ("WHERE", "GROUP BY", "HAVING", "ORDER BY"):
+            if clause in clauses:
+                parts.append(f"{clause} {rewrite_part(clauses[clause])}")
+        for clause in ("LIMIT", "OFFSET"):
+            if clause in clauses:
+                parts.append(f"{clause} {' '.join(t.value for t in clauses[clause])}")
+
+        # 无 GROUP BY 时必须是纯聚合查询，否则汇总表的行数与源表不同
+        if "GROUP BY" not in clauses and (state["aggregates"] == 0 or state["bare_dims"]):
+            raise _Unanswerable()
+        return " ".join(parts)
+
+    @staticmethod
+    def _rewrite_aggregate(func: str, args: List[Token], measures: Set[str], raw_dims: Set[str]) -> str:
+        if func == "COUNT" and len(args) == 1 and args[0].value == "*":
+            return 'COALESCE(SUM("row_count"), 0)'
+        if len(args) != 1 or args[0].kind not in ("ident", "qident"):
+            raise _Unanswerable()
+        column = args[0].name.lower()
+        if column in measures:
+            if func in ("SUM", "TOTAL"):
+                return f"{func}({_quote('sum_' + column)})"
+            if func == "COUNT":
+                return f"COALESCE(SUM({_quote('count_' + column)}), 0)"
+            if func == "AVG":
+                return f"(CAST(SUM({_quote('sum_' + column)}) AS REAL) / SUM({_quote('count_' + column)}))"
+            return f"{func}({_quote(func.lower() + '_' + column)})"
+        if column in raw_dims and func in ("MIN", "MAX"):
+            return f"{func}({_quote(column)})"
+        raise _Unanswerable()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rollups": {name: {"rows": rows} for name, (_, rows) in self._state.items()},
+            "rewrites": self.rewrites,
+        }
@@ -6,10 +6,11 @@
 import json
 import uuid
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 from dataclasses import dataclass, asdict
 
-from app.db.sqlite_manager import SQLiteManager
+from app.db.result import Columnar, decode_data, encode_data
+from app.db.sqlite_manager import SQLiteManager, db as shared_db
 
 
 @dataclass
@@ -38,7 +39,8 @@ class SessionStore:
     """会话存储"""
     
     def __init__(self, db: Optional[SQLiteManager] = None):
-        self.db = db or SQLiteManager()
+        # 默认与全局实例共享连接池
+        self.db = db or shared_db
     
     async def initialize(self):
         """初始化表结构"""
@@ -141,10 +143,14 @@ class SessionStore:
         role: str,
         content: str,
         sql: Optional[str] = None,
-        data: Optional[List[Dict]] = None,
+        data: Optional[Union[List[Dict], Dict[str, Any], Columnar]] = None,
         chart: Optional[Dict] = None,
     ) -> Message:
-        """添加消息"""
+        """
+        添加消息
+        
+        data 以列式 JSON 存储，同时接受旧的行字典列表
+        """
         now = datetime.now().isoformat()
         message = Message(
             id=str(uuid.uuid4()),
@@ -152,7 +158,7 @@ class SessionStore:
             role=role,
             content=content,
             sql=sql,
-            data=data,
+            data=decode_data(data),
             chart=chart,
             created_at=now
         )
@@ -166,7 +172,7 @@ class SessionStore:
                 message.role,
                 message.content,
                 message.sql,
-                json.dumps(data) if data else None,
+                json.dumps(encode_data(data), ensure_ascii=False) if data else None,
                 json.dumps(chart) if chart else None,
                 message.created_at
             )
@@ -195,7 +201,8 @@ class SessionStore:
                     role=row["role"],
                     content=row["content"],
                     sql=row["sql"],
-                    data=json.loads(row["data"]) if row["data"] else None,
+                    # 兼容旧格式：历史消息的 data 可能是行字典列表
+                    data=decode_data(json.loads(row["data"])) if row["data"] else None,
                     chart=json.loads(row["chart"]) if row["chart"] else None,
                     created_at=row["created_at"]
                 )
@@ -1,16 +1,56 @@
 """
 SQLite 数据库管理模块
-支持连接管理、查询执行、Schema 获取
+支持连接池管理、查询执行、Schema 获取
 """
 
+import re
 import sqlite3
+import hashlib
+import time
 import aiosqlite
 import json
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Sequence, Set, Tuple, AsyncIterator, Callable, Awaitable
 from pathlib import Path
 from contextlib import asynccontextmanager
 
 from app.config import settings
+from app.db.pool import ConnectionPool
+from app.db.result import Columnar, ResultSet, estimate_values_bytes
+from app.db.result_cache import ResultCache
+from app.db.rollup import RollupManager
+from app.db.vector_engine import VectorEngine
+from app.db.profiler import ProfileStore
+from app.utils.metrics import metrics
+from app.utils.sql import normalize_sql, is_cacheable_query, referenced_tables
+
+# 会话存储的表（与业务数据同库，不接受导入、不做列画像）
+SESSION_TABLES = frozenset({"sessions", "messages"})
+
+# 匹配写语句的目标表
+_WRITE_TARGET_RE = re.compile(
+    r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)"
+    r"\s+[\"`\[]?(\w+)",
+    re.IGNORECASE,
+)
+
+
+class QueryCancelledError(Exception):
+    """查询因超时或超出 VM 步数预算被中断"""
+    
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason  # timeout / step_budget
+
+
+def _quote(name: str) -> str:
+    """引用标识符（表名可能是关键字或含空格）"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _written_tables(sql: str) -> List[str]:
+    """解析写语句影响的表，无法识别时返回空列表"""
+    match = _WRITE_TARGET_RE.match(sql)
+    return [match.group(1)] if match else []
 
 
 class SQLiteManager:
@@ -20,16 +60,67 @@ class SQLiteManager:
         self.db_path = db_path or settings.database_url.replace("sqlite+aiosqlite:///", "")
         # 确保数据目录存在
         Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.pool = ConnectionPool(
+            self.db_path,
+            readers=settings.db_pool_readers,
+            writers=settings.db_pool_writers,
+            timeout=settings.db_pool_timeout,
+            journal_mode=settings.db_journal_mode,
+            pragmas={
+                "synchronous": settings.db_synchronous,
+                "mmap_size": settings.db_mmap_size,
+                "cache_size": settings.db_cache_size,
+                "busy_timeout": settings.db_busy_timeout,
+            },
+        )
+        # 缓存失效所依赖的版本信息
+        self._table_versions: Dict[str, int] = {}
+        self._data_version: Optional[int] = None
+        self._external_generation = 0
+        # Schema 缓存：{表名: (版本键, 渲染文本)}
+        self._schema_cache: Dict[str, Tuple[Tuple, str]] = {}
+        self._schema_tables: Optional[Tuple[int, List[str]]] = None
+        self._schema_hits = 0
+        self._schema_misses = 0
+        self._fingerprint: Optional[Tuple[int, str]] = None
+        # 内部使用的表（缓存等），不向模型展示
+        self.internal_tables: Set[str] = set()
+        # 查询结果缓存
+        self.result_cache = ResultCache()
+        # 预聚合表
+        self.rollups = RollupManager(self)
+        # 向量化聚合引擎（可选）
+        self.vector = VectorEngine(self)
+        # 列画像
+        self.profiles = ProfileStore(self)
+    
+    async def open(self):
+        """建立连接池（应用启动时调用）"""
+        await self.pool.open()
+    
+    async def close(self):
+        """关闭连接池（应用关闭时调用）；先等待后台的汇总表重建与快照加载，避免其在关闭后重新建立连接"""
+        await self.rollups.drain()
+        await self.vector.drain()
+        await self.pool.close()
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """连接池统计"""
+        return self.pool.stats()
     
     @asynccontextmanager
-    async def get_connection(self):
-        """获取数据库连接"""
-        conn = await aiosqlite.connect(self.db_path)
-        conn.row_factory = aiosqlite.Row
-        try:
+    async def get_connection(self, write: bool = False):
+        """
+        从连接池借出连接
+        
+        WAL 模式下读连接为只读，写入请使用 execute_update 等方法，
+        由单写任务串行执行。
+        
+        Args:
+            write: 是否需要写连接
+        """
+        async with self.pool.acquire(write=write) as conn:
             yield conn
-        finally:
-            await conn.close()
     
     async def execute_query(self, sql: str) -> List[Dict[str, Any]]:
         """
@@ -41,11 +132,235 @@ class SQLiteManager:
         Returns:
             查询结果列表
         """
+        key, version, tables, cached = await self._cache_lookup(sql)
+        if cached is not None:
+            return cached.data.to_rows()
+        
+        data = await self.vector.try_execute(sql)
+        if data is not None:
+            result = self._bound(data, None, None)
+            if key is not None:
+                self.result_cache.put(key, version, tables, result)
+            return data.to_rows()
+        
         async with self.get_connection() as conn:
             cursor = await conn.execute(sql)
             rows = await cursor.fetchall()
+            if key is not None:
+                data = Columnar([d[0] for d in cursor.description or ()])
+                approx_bytes = 0
+                for row in rows:
+                    data.append(tuple(row))
+                    approx_bytes += estimate_values_bytes(row)
+                self.result_cache.put(key, version, tables, ResultSet(data=data, approx_bytes=approx_bytes))
             return [dict(row) for row in rows]
     
+    async def _cache_lookup(
+        self, sql: str, *limits: Any
+    ) -> Tuple[Optional[Tuple], Optional[Tuple], List[str], Optional[ResultSet]]:
+        """
+        查询结果缓存
+        
+        Args:
+            sql: SQL 查询语句
+            limits: 影响结果的附加参数（如行数、字节上限），作为键的一部分
+        
+        Returns:
+            (缓存键, 版本键, 引用的表, 命中的结果)；不可缓存时缓存键为 None
+        """
+        if not settings.result_cache_enabled or not is_cacheable_query(sql):
+            return None, None, [], None
+        normalized = normalize_sql(sql)
+        tables = referenced_tables(sql)
+        if normalized is None or not tables:
+            return None, None, [], None
+        key = (normalized,) + limits
+        version = await self.version_key(tables)
+        return key, version, tables, self.result_cache.get(key, version)
+    
+    @asynccontextmanager
+    async def _watchdog(
+        self,
+        conn,
+        timeout: Optional[float] = None,
+        max_steps: Optional[int] = None,
+    ):
+        """
+        查询看门狗：通过 SQLite progress handler 强制执行时限与 VM 步数预算
+        
+        超限时 SQLite 中断当前语句，转换为 QueryCancelledError 并计入指标。
+        
+        Args:
+            conn: 执行查询的连接
+            timeout: 时限（秒），默认取配置，0 表示不限
+            max_steps: VM 指令数预算，默认取配置，0 表示不限
+        """
+        timeout = settings.query_timeout_seconds if timeout is None else timeout
+        max_steps = settings.query_max_vm_steps if max_steps is None else max_steps
+        interval = settings.query_progress_interval
+        if not timeout and not max_steps:
+            yield
+            return
+        
+        deadline = time.monotonic() + timeout if timeout else None
+        state = {"steps": 0, "reason": None}
+        
+        def progress_handler() -> int:
+            # 在 aiosqlite 工作线程中每执行 interval 条 VM 指令调用一次
+            state["steps"] += interval
+            if deadline is not None and time.monotonic() > deadline:
+                state["reason"] = "timeout"
+                return 1
+            if max_steps and state["steps"] > max_steps:
+                state["reason"] = "step_budget"
+                return 1
+            return 0
+        
+        await conn.set_progress_handler(progress_handler, interval)
+        try:
+            yield
+        except sqlite3.OperationalError as e:
+            if state["reason"] is None:
+                raise
+            metrics.incr("query_cancelled")
+            metrics.incr(f"query_cancelled.{state['reason']}")
+            if state["reason"] == "timeout":
+                message = f"查询已取消：执行超过 {timeout:g} 秒"
+            else:
+                message = f"查询已取消：超出执行步数预算（{max_steps}）"
+            raise QueryCancelledError(state["reason"], message) from e
+        finally:
+            await conn.set_progress_handler(None, 0)
+    
+    async def iter_query(
+        self,
+        sql: str,
+        batch_size: Optional[int] = None,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        分批迭代查询结果（fetchmany）
+        
+        迭代期间占用一个读连接，提前结束时请使用 aclosing 或 aclose() 释放。
+        查询受看门狗时限约束，超限抛出 QueryCancelledError。
+        
+        Args:
+            sql: SQL 查询语句
+            batch_size: 每批行数
+        
+        Yields:
+            每批结果行
+        """
+        batch_size = batch_size or settings.query_batch_size
+        async with self.get_connection() as conn, self._watchdog(conn):
+            cursor = await conn.execute(sql)
+            try:
+                while True:
+                    rows = await cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield [dict(row) for row in rows]
+            finally:
+                await cursor.close()
+    
+    async def execute_query_bounded(
+        self,
+        sql: str,
+        max_rows: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        on_batch: Optional[Callable[[Columnar], Awaitable[None]]] = None,
+        timeout: Optional[float] = None,
+        max_steps: Optional[int] = None,
+    ) -> ResultSet:
+        """
+        执行 SQL 查询，结果超过行数或字节上限时截断
+        
+        结果按批读取并直接写入列式存储，达到上限即停止，
+        内存占用与结果集总大小无关。
+        
+        Args:
+            sql: SQL 查询语句
+            max_rows: 最大行数，默认取配置
+            max_bytes: 最大字节数（估算），默认取配置
+            on_batch: 每读完一批后以本批保留的行（列式）回调
+            timeout: 查询时限（秒），默认取配置
+            max_steps: VM 指令数预算，默认取配置
+        
+        Returns:
+            结果集（含截断元数据）
+        
+        Raises:
+            QueryCancelledError: 超时或超出步数预算
+        """
+        max_rows = max_rows or settings.query_max_rows
+        max_bytes = max_bytes or settings.query_max_bytes
+        
+        key, version, tables, cached = await self._cache_lookup(sql, max_rows, max_bytes)
+        if cached is not None:
+            if on_batch is not None and len(cached):
+                await on_batch(cached.data)
+            return ResultSet(
+                data=cached.data,
+                truncated=cached.truncated,
+                truncate_reason=cached.truncate_reason,
+                approx_bytes=cached.approx_bytes,
+            )
+        
+        # 常见聚合形态优先由向量化引擎计算
+        data = await self.vector.try_execute(sql)
+        if data is not None:
+            result = self._bound(data, max_rows, max_bytes)
+            if on_batch is not None and len(result):
+                await on_batch(result.data)
+            if key is not None:
+                self.result_cache.put(key, version, tables, result)
+            return result
+        
+        batch_size = min(settings.query_batch_size, max_rows + 1)
+        async with self.get_connection() as conn, self._watchdog(conn, timeout, max_steps):
+            cursor = await conn.execute(sql)
+            try:
+                result = ResultSet(data=Columnar([d[0] for d in cursor.description or ()]))
+                data = result.data
+                while not result.truncated:
+                    rows = await cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    start = len(data)
+                    for row in rows:
+                        if len(data) >= max_rows:
+                            result.truncated, result.truncate_reason = True, "max_rows"
+                            break
+                        size = estimate_values_bytes(row)
+                        if result.approx_bytes + size > max_bytes:
+                            result.truncated, result.truncate_reason = True, "max_bytes"
+                            break
+                        data.append(tuple(row))
+                        result.approx_bytes += size
+                    if on_batch is not None and len(data) > start:
+                        await on_batch(data.slice(start))
+            finally:
+                await cursor.close()
+        if key is not None:
+            self.result_cache.put(key, version, tables, result)
+        return result
+    
+    @staticmethod
+    def _bound(data: Columnar, max_rows: Optional[int], max_bytes: Optional[int]) -> ResultSet:
+        """对已在内存中的结果应用行数与字节上限"""
+        result = ResultSet(data=data)
+        for i, row in enumerate(data.iter_rows()):
+            if max_rows is not None and i >= max_rows:
+                result.truncated, result.truncate_reason = True, "max_rows"
+            else:
+                size = estimate_values_bytes(row)
+                if max_bytes is not None and result.approx_bytes + size > max_bytes:
+                    result.truncated, result.truncate_reason = True, "max_bytes"
+            if result.truncated:
+                result.data = data.slice(0, i)
+                break
+            result.approx_bytes += size
+        return result
+    
     async def execute_update(self, sql: str, params: tuple = ()) -> int:
         """
         执行更新操作
@@ -57,53 +372,209 @@ class SQLiteManager:
         Returns:
             影响的行数
         """
-        async with self.get_connection() as conn:
+        async def job(conn):
             cursor = await conn.execute(sql, params)
             await conn.commit()
+            await self._mark_written(_written_tables(sql))
             return cursor.rowcount
+        
+        return await self.pool.write(job)
+    
+    async def version_key(self, tables: Optional[Iterable[str]] = None) -> Tuple:
+        """
+        获取数据版本键，用于缓存失效判断
+        
+        由 schema_version、外部写入代数和各表的写入计数组成：
+        经本实例写入的表只让自身计数递增，其他进程的写入
+        （没有本实例写操作进行时 data_version 出现变化）会使所有表失效。
+        
+        Args:
+            tables: 关心的表名，None 表示只取全局部分
+        
+        Returns:
+            可哈希的版本键
+        """
+        idle, started = self.pool.write_idle, self.pool.writes_started
+        schema_version, data_version = await self.pool.versions()
+        # 读取前后都没有本实例的写操作时，data_version 的变化只能来自其他连接；
+        # 否则由写操作在提交后的 _mark_written 中记录新的 data_version
+        quiet = idle and self.pool.writes_started == started
+        if quiet and data_version != self._data_version:
+            if self._data_version is not None:
+                self._external_generation += 1
+            self._data_version = data_version
+        # SQLite 表名不区分大小写
+        table_part = tuple(
+            (t, self._table_versions.get(t, 0)) for t in sorted({t.lower() for t in tables or ()})
+        )
+        return (schema_version, self._external_generation, table_part)
+    
+    async def _mark_written(self, tables: Iterable[str]):
+        """记录本实例的写入（需在写连接提交后调用）"""
+        tables = list(tables)
+        if not tables:
+            # 无法确定写入的表，按外部写入处理
+            self._external_generation += 1
+        tables = [t.lower() for t in tables]
+        for table in tables:
+            self._table_versions[table] = self._table_versions.get(table, 0) + 1
+        self.result_cache.invalidate(tables or None)
+        # 在写操作窗口内读取提交后的 data_version，期间并发的 version_key 不会把它当作外部写入
+        async with self.pool.writing():
+            _, self._data_version = await self.pool.versions()
+    
+    def invalidate_schema(self, table_name: Optional[str] = None):
+        """
+        使 Schema 缓存失效
+        
+        Args:
+            table_name: 只失效指定表，None 表示全部失效
+        """
+        if table_name is None:
+            self._schema_cache.clear()
+            self._schema_tables = None
+        else:
+            self._schema_cache.pop(table_name, None)
+            self._schema_tables = None
+    
+    def schema_cache_stats(self) -> Dict[str, Any]:
+        """Schema 缓存统计"""
+        return {
+            "tables": len(self._schema_cache),
+            "hits": self._schema_hits,
+            "misses": self._schema_misses,
+        }
+    
+    async def _render_table_schema(self, conn, table_name: str, key: Tuple = ()) -> str:
+        """渲染单张表的 Schema 描述（列信息与列画像 + 示例数据）"""
+        # 获取表结构
+        cursor = await conn.execute(f"PRAGMA table_info({_quote(table_name)})")
+        columns = await cursor.fetchall()
+        profile = await self.profiles.get(conn, table_name, key)
+        
+        col_info = []
+        for col in columns:
+            col_name = col[1]
+            col_type = col[2]
+            line = f"  - {col_name} ({col_type})"
+            detail = profile.columns[col_name].describe() if profile and col_name in profile.columns else ""
+            if detail:
+                line += f": {detail}"
+            col_info.append(line)
+        
+        header = f"表: {table_name}"
+        if profile:
+            header += f"（{'' if profile.exact else '约 '}{profile.rows} 行）"
+        table_schema = header + "\n" + "\n".join(col_info)
+        
+        # 获取示例数据
+        try:
+            cursor = await conn.execute(f"SELECT * FROM {_quote(table_name)} LIMIT 2")
+            rows = await cursor.fetchall()
+            if rows:
+                sample_data = [dict(row) for row in rows]
+                table_schema += f"\n示例数据:\n  {json.dumps(sample_data, ensure_ascii=False)}"
+        except:
+            pass
+        
+        return table_schema
     
-    async def get_schema(self) -> str:
+    async def get_schema(self, tables: Optional[Iterable[str]] = None) -> str:
         """
         获取数据库 Schema 信息
         
+        按表缓存渲染结果，仅在 DDL 或该表数据发生变化时重新查询。
+        
+        Args:
+            tables: 只渲染指定的表（按表清单顺序输出），None 表示全部
+        
         Returns:
             Schema 描述字符串
         """
+        schema_version, generation, _ = await self.version_key()
+        
+        def table_key(table_name: str) -> Tuple:
+            return (schema_version, generation, self._table_versions.get(table_name.lower(), 0))
+        
+        # 表版本键不含 schema_version 时仍一致的表沿用缓存文本：
+        # 建表、导入等经本实例的 DDL 会递增对应表的计数，其他 DDL 使外部写入代数递增
+        def is_stale(table_name: str) -> bool:
+            cached = self._schema_cache.get(table_name)
+            return cached is None or cached[0][1:] != table_key(table_name)[1:]
+        
+        all_tables = await self.schema_tables()
+        if tables is None:
+            selected = all_tables
+        else:
+            wanted = {t.lower() for t in tables}
+            selected = [t for t in all_tables if t.lower() in wanted]
+        stale = [t for t in selected if is_stale(t)]
+        
+        if not stale:
+            self._schema_hits += 1
+            return "\n\n".join(self._schema_cache[t][1] for t in selected)
+        
+        self._schema_misses += 1
+        async with self.get_connection() as conn:
+            for table_name in stale:
+                text = await self._render_table_schema(conn, table_name, table_key(table_name)[1:])
+                self._schema_cache[table_name] = (table_key(table_name), text)
+        
+        return "\n\n".join(self._schema_cache[t][1] for t in selected)
+    
+    async def schema_tables(self) -> List[str]:
+        """对模型可见的表清单（按 schema_version 缓存，不含汇总表）"""
+        schema_version, _, _ = await self.version_key()
+        if self._schema_tables is not None and self._schema_tables[0] == schema_version:
+            return self._schema_tables[1]
         async with self.get_connection() as conn:
-            # 获取所有表
             cursor = await conn.execute(
                 "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
             )
-            tables = await cursor.fetchall()
-            
-            schema_parts = []
-            
-            for (table_name,) in tables:
-                # 获取表结构
-                cursor = await conn.execute(f"PRAGMA table_info({table_name})")
-                columns = await cursor.fetchall()
-                
-                col_info = []
-                for col in columns:
-                    col_name = col[1]
-                    col_type = col[2]
-                    col_info.append(f"  - {col_name} ({col_type})")
-                
-                table_schema = f"表: {table_name}\n" + "\n".join(col_info)
-                
-                # 获取示例数据
-                try:
-                    cursor = await conn.execute(f"SELECT * FROM {table_name} LIMIT 2")
-                    rows = await cursor.fetchall()
-                    if rows:
-                        sample_data = [dict(row) for row in rows]
-                        table_schema += f"\n示例数据:\n  {json.dumps(sample_data, ensure_ascii=False)}"
-                except:
-                    pass
-                
-                schema_parts.append(table_schema)
-            
-            return "\n\n".join(schema_parts)
+            # 汇总表对模型不可见，查询改写时透明使用；内部表同样隐藏
+            tables = [
+                row[0] for row in await cursor.fetchall()
+                if not self.rollups.is_rollup(row[0]) and row[0].lower() not in self.internal_tables
+            ]
+        self._schema_tables = (schema_version, tables)
+        for name in list(self._schema_cache):
+            if name not in tables:
+                del self._schema_cache[name]
+        return tables
+    
+    def hide_table(self, table_name: str):
+        """将表标记为内部表，不出现在提供给模型的 Schema 中"""
+        self.internal_tables.add(table_name.lower())
+        self._schema_tables = None
+        self._fingerprint = None
+    
+    def is_reserved_table(self, table_name: str) -> bool:
+        """内部表、会话表与 SQLite 系统表：只能由所属模块写入"""
+        name = table_name.lower()
+        return name.startswith("sqlite_") or name in self.internal_tables or name in SESSION_TABLES
+    
+    async def schema_fingerprint(self) -> str:
+        """
+        对模型可见的表结构指纹（建表语句的哈希，按 schema_version 缓存）
+        
+        只包含表与视图的定义：数据写入、新建索引不改变指纹。
+        """
+        schema_version, _, _ = await self.version_key()
+        if self._fingerprint is not None and self._fingerprint[0] == schema_version:
+            return self._fingerprint[1]
+        visible = {t.lower() for t in await self.schema_tables()}
+        async with self.get_connection() as conn:
+            cursor = await conn.execute(
+                "SELECT type, name, sql FROM sqlite_master WHERE type IN ('table', 'view') ORDER BY name"
+            )
+            rows = await cursor.fetchall()
+        digest = hashlib.sha1()
+        for row in rows:
+            if row[1].lower() in visible or row[0] == "view":
+                digest.update(f"{row[0]}\0{row[1]}\0{row[2]}\0".encode("utf-8"))
+        fingerprint = digest.hexdigest()[:16]
+        self._fingerprint = (schema_version, fingerprint)
+        return fingerprint
     
     async def get_tables(self) -> List[str]:
         """获取所有表名"""
@@ -126,7 +597,7 @@ class SQLiteManager:
         """
         async with self.get_connection() as conn:
             # 获取列信息
-            cursor = await conn.execute(f"PRAGMA table_info({table_name})")
+            cursor = await conn.execute(f"PRAGMA table_info({_quote(table_name)})")
             columns = await cursor.fetchall()
             
             cols = []
@@ -140,7 +611,7 @@ class SQLiteManager:
                 })
             
             # 获取索引信息
-            cursor = await conn.execute(f"PRAGMA index_list({table_name})")
+            cursor = await conn.execute(f"PRAGMA index_list({_quote(table_name)})")
             indexes = await cursor.fetchall()
             
             return {
@@ -161,12 +632,17 @@ class SQLiteManager:
             是否成功
         """
         col_defs = ", ".join([f"{name} {typ}" for name, typ in columns.items()])
-        sql = f"CREATE TABLE IF NOT EXISTS {table_name} ({col_defs})"
+        sql = f"CREATE TABLE IF NOT EXISTS {_quote(table_name)} ({col_defs})"
         
-        async with self.get_connection() as conn:
+        async def job(conn):
             await conn.execute(sql)
             await conn.commit()
+            await self._mark_written([table_name])
             return True
+        
+        created = await self.pool.write(job)
+        self.invalidate_schema(table_name)
+        return created
     
     async def insert_data(self, table_name: str, data: List[Dict[str, Any]]) -> int:
         """
@@ -183,17 +659,47 @@ class SQLiteManager:
             return 0
         
         columns = list(data[0].keys())
+        rows = [tuple(row[col] for col in columns) for row in data]
+        return await self.insert_rows(table_name, columns, rows)
+    
+    async def insert_rows(self, table_name: str, columns: List[str], rows: Sequence[Sequence[Any]]) -> int:
+        """
+        在一个写事务中批量插入行（按 ingest_chunk_rows 分块 executemany）
+        
+        Args:
+            table_name: 表名
+            columns: 列名
+            rows: 与列名顺序一致的行
+        
+        Returns:
+            插入的行数
+        """
+        if not rows:
+            return 0
+        
         placeholders = ", ".join(["?" for _ in columns])
-        col_names = ", ".join(columns)
-        sql = f"INSERT INTO {table_name} ({col_names}) VALUES ({placeholders})"
+        col_names = ", ".join('"' + col.replace('"', '""') + '"' for col in columns)
+        sql = f'INSERT INTO "{table_name}" ({col_names}) VALUES ({placeholders})'
+        chunk = max(1, settings.ingest_chunk_rows)
         
-        async with self.get_connection() as conn:
-            for row in data:
-                values = tuple(row[col] for col in columns)
-                await conn.execute(sql, values)
+        async def job(conn):
+            # 写入前新鲜的汇总表在同一事务中增量更新，其余的等待后台重建
+            rollups = await self.rollups.fresh_for(table_name)
+            if rollups and not await self.rollups.can_append(table_name, columns):
+                rollups = []
+            if rollups:
+                cursor = await conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM "{table_name}"')
+                after_rowid = (await cursor.fetchone())[0]
+            for start in range(0, len(rows), chunk):
+                await conn.executemany(sql, rows[start:start + chunk])
+            updated = await self.rollups.apply_insert(conn, rollups, after_rowid) if rollups else []
             await conn.commit()
+            await self._mark_written([table_name] + updated)
+            if updated:
+                await self.rollups.mark_fresh(updated)
         
-        return len(data)
+        await self.pool.write(job)
+        return len(rows)
     
     async def table_exists(self, table_name: str) -> bool:
         """检查表是否存在"""
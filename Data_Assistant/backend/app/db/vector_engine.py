@@ -0,0 +1,773 @@
+"""
+向量化聚合引擎模块
+将热点表加载为 NumPy 列数组（文本列字典编码），对常见的单表
+SELECT 维度, SUM/AVG/COUNT/MIN/MAX(度量) ... WHERE ... GROUP BY ... ORDER BY ... LIMIT
+查询做向量化分组聚合；无法识别的查询返回 None，由调用方回退到 SQLite
+
+NumPy 为可选依赖，未安装时引擎不启用
+"""
+
+import asyncio
+import bisect
+import logging
+import sqlite3
+import time
+from typing import List, Dict, Any, Optional, Tuple, TYPE_CHECKING
+from dataclasses import dataclass, field
+
+from app.config import settings
+from app.db.result import Columnar
+from app.utils.metrics import metrics
+from app.utils.sql import (
+    Token, tokenize, split_clauses, is_keyword, render_tokens, matching_paren,
+    split_top_level, item_alias, strip_qualifiers, source_span, single_table_source,
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - 可选依赖
+    np = None
+
+if TYPE_CHECKING:
+    from app.db.sqlite_manager import SQLiteManager
+
+logger = logging.getLogger(__name__)
+
+_AGGREGATES = {"SUM", "TOTAL", "AVG", "COUNT", "MIN", "MAX"}
+_COMPARISONS = {"=": "eq", "==": "eq", "!=": "ne", "<>": "ne", "<": "lt", "<=": "le", ">": "gt", ">=": "ge"}
+# 整数求和超过该量级时交给 SQLite（其整数溢出会报错，NumPy 会静默回绕）
+_INT_SUM_LIMIT = 2 ** 62
+
+
+class _Unsupported(Exception):
+    """查询形态不在引擎支持范围内"""
+
+
+@dataclass
+class _Column:
+    """一列数据：文本列为字典编码（-1 表示 NULL，字典按 BINARY 排序），数值列附空值掩码"""
+    name: str
+    kind: str  # text / integer / real
+    values: Any
+    nulls: Any = None
+    dictionary: List[str] = field(default_factory=list)
+
+
+@dataclass
+class TableSnapshot:
+    """表的列式快照"""
+    table: str
+    version: Tuple
+    rows: int
+    columns: Dict[str, _Column]
+    load_seconds: float = 0.0
+
+    @property
+    def nbytes(self) -> int:
+        total = 0
+        for column in self.columns.values():
+            total += column.values.nbytes
+            if column.nulls is not None:
+                total += column.nulls.nbytes
+        return total
+
+
+@dataclass
+class _Aggregate:
+    func: str
+    column: Optional[str]  # None 表示 COUNT(*)
+    round_digits: Optional[int] = None
+    rounded: bool = False
+
+
+@dataclass
+class _Plan:
+    table: str
+    names: List[str]
+    # ("dim", 列名) 或 ("agg", _Aggregate)
+    items: List[Tuple[str, Any]]
+    filters: List[Tuple[str, str, Any]]
+    group: List[str]
+    order: List[Tuple[int, bool]]
+    limit: Optional[int] = None
+    offset: int = 0
+
+
+def _value_kind(values: List[Any]) -> Optional[str]:
+    """判断一批值的类型：text / integer / real / null，混合类型返回 None"""
+    kinds = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, str):
+            kinds.add("text")
+        elif isinstance(value, int) and not isinstance(value, bool):
+            kinds.add("integer")
+        elif isinstance(value, float):
+            kinds.add("real")
+        else:
+            return None
+        if len(kinds) > 1:
+            return None
+    return kinds.pop() if kinds else "null"
+
+
+class _ColumnBuilder:
+    """
+    逐批写入一列的类型化数组（按预期行数预分配，实际行数更多时倍增扩容）
+
+    文本列写入插入顺序的字典编码，结束时重映射为按取值排序的编码；
+    出现混合类型的列被丢弃
+    """
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.kind = "null"
+        self.values = None
+        self.nulls = np.zeros(capacity, dtype=bool)
+        self.codes_of: Dict[str, int] = {}
+        self.dropped = False
+
+    def _reserve(self, size: int):
+        capacity = len(self.nulls)
+        if size <= capacity:
+            return
+        extra = max(size, capacity * 2) - capacity
+        self.nulls = np.concatenate([self.nulls, np.zeros(extra, dtype=bool)])
+        if self.values is not None:
+            self.values = np.concatenate([self.values, np.zeros(extra, dtype=self.values.dtype)])
+
+    def extend(self, values: Tuple[Any, ...], offset: int):
+        if self.dropped:
+            return
+        kind = _value_kind(values)
+        if kind is None or (kind != "null" and self.kind not in ("null", kind)):
+            # 混合类型：释放已写入的数据
+            self.dropped = True
+            self.values = self.nulls = None
+            return
+        end = offset + len(values)
+        self._reserve(end)
+        if kind == "null":
+            self.nulls[offset:end] = True
+            if self.kind == "text":
+                self.values[offset:end] = -1
+            return
+        if self.values is None:
+            self.kind = kind
+            if kind == "text":
+                # 之前的批次都是 NULL
+                self.values = np.full(len(self.nulls), -1, dtype=np.int32)
+            else:
+                self.values = np.zeros(len(self.nulls), dtype=np.int64 if kind == "integer" else np.float64)
+        if kind == "text":
+            codes_of = self.codes_of
+            self.values[offset:end] = np.fromiter(
+                (-1 if v is None else codes_of.setdefault(v, len(codes_of)) for v in values),
+                dtype=np.int32, count=len(values),
+            )
+        else:
+            self.nulls[offset:end] = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+            self.values[offset:end] = np.fromiter(
+                (0 if v is None else v for v in values), dtype=self.values.dtype, count=len(values),
+            )
+
+    def finish(self, rows: int) -> Optional[_Column]:
+        if self.dropped or self.values is None:
+            return None  # 混合类型或全空的列不参与向量化
+        values = _trim(self.values, rows)
+        if self.kind == "text":
+            # 字典按 BINARY 排序（UTF-8 字节序与码点序一致），使编码顺序即取值顺序
+            dictionary = sorted(self.codes_of)
+            remap = np.empty(len(dictionary) + 1, dtype=np.int32)
+            remap[-1] = -1
+            for new_code, value in enumerate(dictionary):
+                remap[self.codes_of[value]] = new_code
+            return _Column(self.name, self.kind, remap[values], None, dictionary)
+        nulls = self.nulls[:rows]
+        return _Column(self.name, self.kind, values, _trim(nulls, rows) if nulls.any() else None)
+
+
+def _trim(array, rows: int):
+    """截取前 rows 行；预分配有富余时复制，释放多余的空间"""
+    return array if len(array) == rows else array[:rows].copy()
+
+
+def _fill_batch(builders: List[_ColumnBuilder], batch: List[Any], offset: int):
+    for builder, values in zip(builders, zip(*batch)):
+        builder.extend(values, offset)
+
+
+def _finish_columns(builders: List[_ColumnBuilder], rows: int) -> Dict[str, _Column]:
+    columns: Dict[str, _Column] = {}
+    for builder in builders:
+        column = builder.finish(rows)
+        if column is not None:
+            columns[builder.name.lower()] = column
+    return columns
+
+
+class VectorEngine:
+    """向量化分组聚合引擎"""
+
+    def __init__(self, db: "SQLiteManager"):
+        self.db = db
+        self._snapshots: Dict[str, TableSnapshot] = {}
+        self._loading: Dict[str, asyncio.Task] = {}
+        # 超出加载上限的表：{表名: 检查时的版本}
+        self._skipped: Dict[str, Tuple] = {}
+        self.executed = 0
+        self.fallbacks = 0
+
+    @property
+    def available(self) -> bool:
+        return np is not None
+
+    @property
+    def enabled(self) -> bool:
+        return self.available and settings.vector_engine_enabled
+
+    @property
+    def tables(self) -> List[str]:
+        return [t.strip().lower() for t in settings.vector_engine_tables.split(",") if t.strip()]
+
+    # ------------------------------------------------------------------
+    # 快照加载
+    # ------------------------------------------------------------------
+
+    async def _version(self, table: str) -> Tuple:
+        # 去掉 schema_version：其他表的 DDL 不应使快照过期（本表 DDL 会递增其写入计数）
+        return (await self.db.version_key([table]))[1:]
+
+    async def load(self, table: str) -> Optional[TableSnapshot]:
+        """
+        从 SQLite 全量加载表快照
+
+        先按 COUNT(*) 检查行数与估算内存上限，超限时不加载（表版本变化前不再尝试）；
+        之后每读取一批就写入按行数预分配的类型化数组，不保留 Python 对象的中间副本
+        """
+        start = time.monotonic()
+        version = await self._version(table)
+        batch_size = max(settings.query_batch_size, 10000)
+        async with self.db.get_connection() as conn:
+            cursor = await conn.execute(f'SELECT COUNT(*) FROM "{table}"')
+            expected = (await cursor.fetchone())[0]
+            cursor = await conn.execute(f'SELECT * FROM "{table}"')
+            try:
+                names = [d[0] for d in cursor.description]
+                # 每列按 8 字节数值加 1 字节空值掩码估算
+                estimated = expected * len(names) * 9
+                if expected > settings.vector_engine_max_rows or estimated > settings.vector_engine_max_bytes:
+                    self._skipped[table] = version
+                    metrics.incr("vector_engine.skipped")
+                    logger.warning(
+                        "vector snapshot of %s skipped: %d rows, ~%d bytes exceeds the limit",
+                        table, expected, estimated,
+                    )
+                    return None
+                builders = [_ColumnBuilder(name, expected) for name in names]
+                rows = 0
+                while True:
+                    batch = await cursor.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    await asyncio.to_thread(_fill_batch, builders, batch, rows)
+                    rows += len(batch)
+            finally:
+                await cursor.close()
+
+        columns = await asyncio.to_thread(_finish_columns, builders, rows)
+        self._skipped.pop(table, None)
+        snapshot = TableSnapshot(table, version, rows, columns, time.monotonic() - start)
+        self._snapshots[table] = snapshot
+        metrics.incr("vector_engine.loads")
+        logger.info("vector snapshot of %s loaded: %d rows, %d bytes", table, rows, snapshot.nbytes)
+        return snapshot
+
+    def _schedule_load(self, table: str):
+        task = self._loading.get(table)
+        if task is not None and not task.done():
+            return
+        self._loading[table] = asyncio.create_task(self._load_quietly(table))
+
+    async def drain(self):
+        """等待进行中的后台加载结束（关闭连接池前调用）"""
+        if self._loading:
+            await asyncio.gather(*self._loading.values(), return_exceptions=True)
+            self._loading.clear()
+
+    async def _load_quietly(self, table: str):
+        try:
+            await self.load(table)
+        except Exception as e:
+            logger.warning("vector snapshot of %s failed: %s", table, e)
+
+    async def warm(self):
+        """加载所有配置的表（启动时调用）"""
+        if not self.enabled:
+            return
+        for table in self.tables:
+            if await self.db.table_exists(table):
+                await self._load_quietly(table)
+
+    # ------------------------------------------------------------------
+    # 执行
+    # ------------------------------------------------------------------
+
+    async def try_execute(self, sql: str) -> Optional[Columnar]:
+        """
+        尝试以向量化方式执行查询
+
+        Args:
+            sql: SQL 查询语句
+
+        Returns:
+            列式结果；引擎未启用、快照未就绪或查询形态不支持时返回 None
+        """
+        if not self.enabled:
+            return None
+        try:
+            tokens = tokenize(sql)
+        except ValueError:
+            return None
+        while tokens and tokens[-1].value == ";":
+            tokens = tokens[:-1]
+        clauses = split_clauses(tokens)
+        if clauses is None or "FROM" not in clauses:
+            return None
+        source = single_table_source(clauses["FROM"])
+        if source is None or source[0].lower() not in self.tables:
+            return None
+        table = source[0].lower()
+
+        snapshot = self._snapshots.get(table)
+        version = await self._version(table)
+        if snapshot is None or snapshot.version != version:
+            # 快照缺失或过期：本次回退，后台重新加载（超出加载上限的表在版本变化前不再尝试）
+            if self._skipped.get(table) != version:
+                self._schedule_load(table)
+            return None
+        if snapshot.rows < settings.vector_engine_min_rows:
+            return None
+        try:
+            plan = self._parse(sql, clauses, source[1], snapshot)
+            data = await asyncio.to_thread(self._run, plan, snapshot)
+        except _Unsupported:
+            self.fallbacks += 1
+            metrics.incr("vector_engine.fallback")
+            return None
+        self.executed += 1
+        metrics.incr("vector_engine.executed")
+        return data
+
+    # ------------------------------------------------------------------
+    # 解析
+    # ------------------------------------------------------------------
+
+    def _parse(self, sql: str, clauses: Dict[str, List[Token]], names: set, snapshot: TableSnapshot) -> _Plan:
+        for clause in clauses:
+            if clause not in ("SELECT", "FROM", "WHERE", "GROUP BY", "ORDER BY", "LIMIT", "OFFSET"):
+                raise _Unsupported()
+        for clause_tokens in clauses.values():
+            for token in clause_tokens:
+                if token.value == "?" or is_keyword(token, "SELECT", "DISTINCT", "OVER", "CASE", "OR", "NOT", "COLLATE"):
+                    raise _Unsupported()
+
+        def column(token: Token) -> str:
+            if token.kind not in ("ident", "qident") or token.name.lower() not in snapshot.columns:
+                raise _Unsupported()
+            return token.name.lower()
+
+        # 选择列表
+        items: List[Tuple[str, Any]] = []
+        out_names: List[str] = []
+        aliases: Dict[str, int] = {}
+        renders: List[str] = []
+        for item in split_top_level(clauses["SELECT"]):
+            if not item:
+                raise _Unsupported()
+            alias = item_alias(item)
+            body = item[:-2] if alias is not None and is_keyword(item[-2], "AS") else item[:-1] if alias else item
+            body = strip_qualifiers(body, names)
+            items.append(self._parse_expression(body, column, snapshot))
+            renders.append(render_tokens(body))
+            if alias is not None:
+                out_names.append(alias)
+                aliases.setdefault(alias.lower(), len(items) - 1)
+            elif items[-1][0] == "dim":
+                out_names.append(snapshot.columns[items[-1][1]].name)
+            else:
+                out_names.append(source_span(sql, item))
+
+        filters = self._parse_where(strip_qualifiers(clauses.get("WHERE", []), names), column, snapshot)
+
+        # GROUP BY：列、维度列的别名或位置
+        group: List[str] = []
+        for term in split_top_level(strip_qualifiers(clauses.get("GROUP BY", []), names)) if "GROUP BY" in clauses else []:
+            if len(term) != 1:
+                raise _Unsupported()
+            token = term[0]
+            if token.kind == "number":
+                index = int(token.value) - 1
+                if not 0 <= index < len(items) or items[index][0] != "dim":
+                    raise _Unsupported()
+                group.append(items[index][1])
+            elif token.name.lower() in snapshot.columns:
+                group.append(column(token))
+            elif token.name.lower() in aliases and items[aliases[token.name.lower()]][0] == "dim":
+                group.append(items[aliases[token.name.lower()]][1])
+            else:
+                raise _Unsupported()
+
+        has_aggregate = any(kind == "agg" for kind, _ in items)
+        if not group and not has_aggregate:
+            raise _Unsupported()
+        for kind, value in items:
+            if kind == "dim" and value not in group:
+                raise _Unsupported()  # 非分组列的取值由 SQLite 任选一行，无法对齐
+
+        # ORDER BY：别名、选择列表中的列、位置或与选择项相同的表达式
+        order: List[Tuple[int, bool]] = []
+        if "ORDER BY" in clauses:
+            for term in split_top_level(strip_qualifiers(clauses["ORDER BY"], names)):
+                descending = False
+                if term and is_keyword(term[-1], "ASC", "DESC"):
+                    descending = term[-1].upper == "DESC"
+                    term = term[:-1]
+                if not term:
+                    raise _Unsupported()
+                index = None
+                if len(term) == 1 and term[0].kind == "number":
+                    index = int(term[0].value) - 1
+                elif len(term) == 1 and term[0].kind in ("ident", "qident") and term[0].name.lower() in aliases:
+                    index = aliases[term[0].name.lower()]
+                elif len(term) == 1 and term[0].kind in ("ident", "qident"):
+                    name = column(term[0])
+                    index = next((i for i, (k, v) in enumerate(items) if k == "dim" and v == name), None)
+                else:
+                    text = render_tokens(term)
+                    index = renders.index(text) if text in renders else None
+                if index is None or not 0 <= index < len(items):
+                    raise _Unsupported()
+                order.append((index, descending))
+
+        limit, offset = None, 0
+        if "LIMIT" in clauses:
+            parts = split_top_level(clauses["LIMIT"])
+            numbers = [self._integer(part) for part in parts]
+            if len(numbers) == 2:  # LIMIT offset, count
+                offset, limit = numbers
+            elif len(numbers) == 1:
+                limit = numbers[0]
+            else:
+                raise _Unsupported()
+        if "OFFSET" in clauses:
+            offset = self._integer(clauses["OFFSET"])
+        if limit is not None and limit < 0:
+            limit = None
+
+        return _Plan(snapshot.table, out_names, items, filters, group, order, limit, max(offset, 0))
+
+    @staticmethod
+    def _integer(tokens: List[Token]) -> int:
+        if len(tokens) == 2 and tokens[0].value == "-" and tokens[1].kind == "number":
+            tokens = [Token("number", "-" + tokens[1].value)]
+        if len(tokens) != 1 or tokens[0].kind != "number" or not tokens[0].value.lstrip("-").isdigit():
+            raise _Unsupported()
+        return int(tokens[0].value)
+
+    def _parse_expression(self, body: List[Token], column, snapshot: TableSnapshot) -> Tuple[str, Any]:
+        if len(body) == 1:
+            return "dim", column(body[0])
+        # ROUND(聚合[, 位数])
+        if is_keyword(body[0], "ROUND") and len(body) >= 4 and body[1].value == "(" and matching_paren(body, 1) == len(body) - 1:
+            args = split_top_level(body[2:-1])
+            if len(args) not in (1, 2):
+                raise _Unsupported()
+            kind, aggregate = self._parse_expression(args[0], column, snapshot)
+            if kind != "agg" or aggregate.rounded:
+                raise _Unsupported()
+            aggregate.rounded = True
+            aggregate.round_digits = self._integer(args[1]) if len(args) == 2 else 0
+            return "agg", aggregate
+        if (
+            body[0].kind == "ident" and body[0].upper in _AGGREGATES and len(body) >= 4
+            and body[1].value == "(" and matching_paren(body, 1) == len(body) - 1
+        ):
+            func = body[0].upper
+            args = body[2:-1]
+            if func == "COUNT" and len(args) == 1 and args[0].value == "*":
+                return "agg", _Aggregate("COUNT", None)
+            if len(args) != 1:
+                raise _Unsupported()
+            name = column(args[0])
+            kind = snapshot.columns[name].kind
+            if kind == "text" and func not in ("COUNT", "MIN", "MAX"):
+                raise _Unsupported()  # 文本求和涉及类型转换
+            return "agg", _Aggregate(func, name)
+        raise _Unsupported()
+
+    def _literal(self, tokens: List[Token], kind: str) -> Any:
+        """解析与列类型一致的常量（类型不一致时 SQLite 会做亲和性转换，交给 SQLite）"""
+        if len(tokens) == 2 and tokens[0].value == "-" and tokens[1].kind == "number":
+            tokens = [Token("number", "-" + tokens[1].value)]
+        if len(tokens) != 1:
+            raise _Unsupported()
+        token = tokens[0]
+        if kind == "text":
+            if token.kind != "string":
+                raise _Unsupported()
+            return token.value[1:-1].replace("''", "'")
+        if token.kind != "number":
+            raise _Unsupported()
+        text = token.value
+        if any(c in text for c in ".eE"):
+            return float(text)
+        return int(text)
+
+    def _parse_where(self, tokens: List[Token], column, snapshot: TableSnapshot) -> List[Tuple[str, str, Any]]:
+        """只支持以 AND 连接的 列 比较 常量 谓词"""
+        filters: List[Tuple[str, str, Any]] = []
+        i = 0
+        while i < len(tokens):
+            name = column(tokens[i])
+            kind = snapshot.columns[name].kind
+            i += 1
+            if i >= len(tokens):
+                raise _Unsupported()
+            op = tokens[i]
+
+            def literal_until_and(start: int) -> Tuple[Any, int]:
+                end = start
+                while end < len(tokens) and not is_keyword(tokens[end], "AND"):
+                    end += 1
+                return self._literal(tokens[start:end], kind), end
+
+            if op.value in _COMPARISONS:
+                value, i = literal_until_and(i + 1)
+                filters.append((name, _COMPARISONS[op.value], value))
+            elif is_keyword(op, "IN"):
+                if i + 1 >= len(tokens) or tokens[i + 1].value != "(":
+                    raise _Unsupported()
+                end = matching_paren(tokens, i + 1)
+                if end < 0:
+                    raise _Unsupported()
+                values = [self._literal(part, kind) for part in split_top_level(tokens[i + 2:end])]
+                filters.append((name, "in", values))
+                i = end + 1
+            elif is_keyword(op, "BETWEEN"):
+                low, i = literal_until_and(i + 1)
+                high, i = literal_until_and(i + 1)
+                filters.append((name, "ge", low))
+                filters.append((name, "le", high))
+            elif is_keyword(op, "IS"):
+                if i + 1 < len(tokens) and is_keyword(tokens[i + 1], "NULL"):
+                    filters.append((name, "null", None))
+                    i += 2
+                else:
+                    raise _Unsupported()
+            else:
+                raise _Unsupported()
+            if i < len(tokens):
+                if not is_keyword(tokens[i], "AND"):
+                    raise _Unsupported()
+                i += 1
+                if i >= len(tokens):
+                    raise _Unsupported()
+        return filters
+
+    # ------------------------------------------------------------------
+    # 向量化计算
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _filter_mask(snapshot: TableSnapshot, filters: List[Tuple[str, str, Any]]):
+        mask = np.ones(snapshot.rows, dtype=bool)
+        for name, op, value in filters:
+            col = snapshot.columns[name]
+            if col.kind == "text":
+                codes = col.values
+                if op == "null":
+                    mask &= codes < 0
+                    continue
+                dictionary = col.dictionary
+                if op == "in":
+                    wanted = [bisect.bisect_left(dictionary, v) for v in value]
+                    wanted = [c for c, v in zip(wanted, value) if c < len(dictionary) and dictionary[c] == v]
+                    mask &= np.isin(codes, np.array(wanted, dtype=np.int32))
+                    continue
+                left = bisect.bisect_left(dictionary, value)
+                right = bisect.bisect_right(dictionary, value)
+                present = codes >= 0
+                if op == "eq":
+                    mask &= (codes == left) if left < right else np.zeros_like(mask)
+                elif op == "ne":
+                    mask &= present & ((codes != left) if left < right else True)
+                elif op == "lt":
+                    mask &= present & (codes < left)
+                elif op == "le":
+                    mask &= present & (codes < right)
+                elif op == "gt":
+                    mask &= codes >= right
+                elif op == "ge":
+                    mask &= codes >= left
+                continue
+            values = col.values
+            present = ~col.nulls if col.nulls is not None else True
+            if op == "null":
+                mask &= col.nulls if col.nulls is not None else np.zeros_like(mask)
+            elif op == "in":
+                mask &= present & np.isin(values, np.array(value))
+            else:
+                compare = {"eq": np.equal, "ne": np.not_equal, "lt": np.less, "le": np.less_equal,
+                           "gt": np.greater, "ge": np.greater_equal}[op]
+                mask &= present & compare(values, value)
+        return mask
+
+    @staticmethod
+    def _group_ids(snapshot: TableSnapshot, group: List[str], mask) -> Tuple[Any, int, List[List[Any]]]:
+        """
+        计算过滤后各行的分组编号
+
+        Returns:
+            (分组编号数组, 分组数, 各分组列按分组顺序的取值)；分组按键升序、NULL 在前（与 SQLite 一致）
+        """
+        ranks = []
+        decoders = []
+        for name in group:
+            col = snapshot.columns[name]
+            if col.kind == "text":
+                ranks.append(col.values[mask].astype(np.int64) + 1)
+                decoders.append([None] + col.dictionary)
+            else:
+                values = col.values[mask]
+                rank = np.zeros(len(values), dtype=np.int64)
+                present = ~col.nulls[mask] if col.nulls is not None else np.ones(len(values), dtype=bool)
+                uniq, inverse = np.unique(values[present], return_inverse=True)
+                rank[present] = inverse.reshape(-1) + 1
+                ranks.append(rank)
+                decoders.append([None] + uniq.tolist())
+
+        cards = [len(d) for d in decoders]
+        total = 1
+        for card in cards:
+            total *= card
+        if total >= 2 ** 62:
+            raise _Unsupported()
+        key = np.zeros(int(mask.sum()), dtype=np.int64)
+        for rank, card in zip(ranks, cards):
+            key = key * card + rank
+        if total <= max(4 * len(key), 1 << 20):
+            counts = np.bincount(key, minlength=total)
+            present_keys = np.flatnonzero(counts)
+            lookup = np.full(total, -1, dtype=np.int64)
+            lookup[present_keys] = np.arange(len(present_keys))
+            ids = lookup[key]
+        else:
+            present_keys, ids = np.unique(key, return_inverse=True)
+            ids = ids.reshape(-1)
+        digits = np.unravel_index(present_keys, cards) if len(cards) > 1 else (present_keys,)
+        values = [[decoder[d] for d in digit.tolist()] for decoder, digit in zip(decoders, digits)]
+        return ids, len(present_keys), values
+
+    @staticmethod
+    def _reduce(ufunc, values, ids, groups: int) -> List[Any]:
+        """按分组归约，无值的分组为 None"""
+        result: List[Any] = [None] * groups
+        if len(values) == 0:
+            return result
+        order = np.argsort(ids, kind="stable")
+        sorted_ids = ids[order]
+        starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+        reduced = ufunc.reduceat(values[order], starts)
+        for group, value in zip(sorted_ids[starts].tolist(), reduced.tolist()):
+            result[group] = value
+        return result
+
+    def _aggregate(self, snapshot: TableSnapshot, agg: _Aggregate, mask, ids, groups: int) -> List[Any]:
+        if agg.column is None:
+            return np.bincount(ids, minlength=groups).tolist()
+        col = snapshot.columns[agg.column]
+        values = col.values[mask]
+        if col.kind == "text":
+            present = values >= 0
+        elif col.nulls is not None:
+            present = ~col.nulls[mask]
+        else:
+            present = np.ones(len(values), dtype=bool)
+        values, group_ids = values[present], ids[present]
+
+        if agg.func == "COUNT":
+            return np.bincount(group_ids, minlength=groups).tolist()
+        if agg.func in ("MIN", "MAX"):
+            reduced = self._reduce(np.minimum if agg.func == "MIN" else np.maximum, values, group_ids, groups)
+            if col.kind == "text":
+                return [None if v is None else col.dictionary[v] for v in reduced]
+            return reduced
+        if col.kind == "integer" and agg.func == "SUM":
+            magnitude = self._reduce(np.add, np.abs(values.astype(np.float64)), group_ids, groups)
+            if any(m is not None and m >= _INT_SUM_LIMIT for m in magnitude):
+                raise _Unsupported()
+        sums = self._reduce(np.add, values, group_ids, groups)
+        if agg.func == "SUM":
+            return sums
+        if agg.func == "TOTAL":
+            return [0.0 if s is None else float(s) for s in sums]
+        counts = np.bincount(group_ids, minlength=groups).tolist()
+        float_sums = self._reduce(np.add, values.astype(np.float64), group_ids, groups)
+        return [None if c == 0 else s / c for s, c in zip(float_sums, counts)]
+
+    def _run(self, plan: _Plan, snapshot: TableSnapshot) -> Columnar:
+        mask = self._filter_mask(snapshot, plan.filters)
+        if plan.group:
+            ids, groups, keys = self._group_ids(snapshot, plan.group, mask)
+        else:
+            # 无 GROUP BY 的聚合查询总是返回一行
+            ids, groups, keys = np.zeros(int(mask.sum()), dtype=np.int64), 1, []
+
+        columns: List[List[Any]] = []
+        for kind, value in plan.items:
+            if kind == "dim":
+                columns.append(keys[plan.group.index(value)])
+                continue
+            results = self._aggregate(snapshot, value, mask, ids, groups)
+            if value.rounded:
+                results = self._round(results, value.round_digits)
+            columns.append(results)
+
+        rows = list(zip(*columns)) if columns else []
+        # 多列排序：从最后一个排序键开始做稳定排序；SQLite 中 NULL 最小
+        for index, descending in reversed(plan.order):
+            rows.sort(key=lambda row: (row[index] is not None, row[index] if row[index] is not None else 0),
+                      reverse=descending)
+        end = None if plan.limit is None else plan.offset + plan.limit
+        rows = rows[plan.offset:end]
+
+        data = Columnar(plan.names)
+        data.extend(rows)
+        return data
+
+    @staticmethod
+    def _round(values: List[Any], digits: int) -> List[Any]:
+        """ROUND 交给 SQLite 计算（其舍入规则与 Python round 不同）"""
+        conn = sqlite3.connect(":memory:")
+        try:
+            return [
+                None if v is None else conn.execute("SELECT round(?, ?)", (v, digits)).fetchone()[0]
+                for v in values
+            ]
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "available": self.available,
+            "enabled": self.enabled,
+            "executed": self.executed,
+            "fallbacks": self.fallbacks,
+            "snapshots": {
+                name: {"rows": s.rows, "bytes": s.nbytes, "load_seconds": round(s.load_seconds, 3)}
+                for name, s in self._snapshots.items()
+            },
+            "skipped": sorted(self._skipped),
+        }
@@ -4,8 +4,17 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 from app.config import settings
-from app.api import session, chat
+from app.api import session, chat, datasets
 from app.db.sqlite_manager import db
+from app.db.result_store import result_store
+from app.db.query_plan import index_advisor
+from app.core.schema_linker import schema_linker
+from app.core.http_client import llm_http
+from app.core.resilience import llm_resilience
+from app.core.singleflight import singleflight
+from app.memory.question_index import question_index
+from app.memory.sql_cache import sql_cache
+from app.utils.metrics import metrics as counters
 from app.db.session_store import session_store
 
 # 允许的前端来源（与 CORS 一致）
@@ -65,14 +74,28 @@ async def global_exception_handler(request: Request, exc: Exception):
 # 注册路由
 app.include_router(session.router)
 app.include_router(chat.router)
+app.include_router(datasets.router)
 
 
 @app.on_event("startup")
 async def startup_event():
     """应用启动时初始化"""
-    # 先初始化会话表（chat 依赖），再初始化示例数据
+    # 建立连接池，再初始化会话表（chat 依赖）与 SQL 缓存表，然后初始化示例数据、构建汇总表并加载向量化快照
+    await db.open()
     await session_store.initialize()
+    await sql_cache.initialize()
     await db.initialize_sample_data()
+    await db.rollups.refresh()
+    await db.vector.warm()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时释放资源"""
+    await llm_http.close()
+    await index_advisor.drain()
+    await db.close()
+    await result_store.close()
 
 
 @app.get("/health", tags=["Health"])
@@ -85,6 +108,28 @@ async def health_check():
     }
 
 
+@app.get("/metrics", tags=["Health"])
+async def metrics():
+    """运行指标（连接池、缓存等）"""
+    return {
+        "db_pool": db.pool_stats(),
+        "llm_http": llm_http.stats(),
+        "llm_resilience": llm_resilience.stats(),
+        "schema_cache": db.schema_cache_stats(),
+        "result_cache": db.result_cache.stats(),
+        "sql_cache": sql_cache.stats(),
+        "question_index": question_index.stats(),
+        "singleflight": singleflight.stats(),
+        "rollups": db.rollups.stats(),
+        "vector_engine": db.vector.stats(),
+        "column_profiles": db.profiles.stats(),
+        "result_store": result_store.stats(),
+        "index_advisor": index_advisor.proposals(),
+        "schema_linker": schema_linker.stats(),
+        "counters": counters.snapshot(),
+    }
+
+
 @app.get("/", tags=["Root"])
 async def root():
     """根路径"""
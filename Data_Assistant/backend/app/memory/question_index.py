@@ -0,0 +1,431 @@
+"""
+相似问题检索模块
+以历史成功的（问题, SQL）对建立进程内字符 n-gram TF-IDF 索引：
+高置信度的近似问题直接复用 SQL（问题间仅取值不同时代入新取值），
+中等相似度的问题作为少样本示例注入 SQL 生成提示词
+"""
+
+import difflib
+import logging
+import math
+import re
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple
+
+from app.config import settings
+from app.db.sqlite_manager import SQLiteManager, db as shared_db
+from app.utils.metrics import metrics
+from app.utils.sql import tokenize as tokenize_sql, table_aliases, is_keyword
+from app.utils.text import normalize_question, char_ngrams
+
+logger = logging.getLogger(__name__)
+
+# 出现在超过该比例问题中的 n-gram 不参与候选召回（仍参与打分）
+_COMMON_GRAM_RATIO = 0.5
+# 日期 / 编号类取值：只允许替换为同样形态、同样长度的取值
+_PATTERNED_RE = re.compile(r"^[\d\s\-/:.]+$")
+# 不改变查询含义的措辞：原样复用时问题间只允许相差这些词（以及空白、引号括号等分隔标点）
+_FILLER_WORDS = (
+    "请问", "请", "帮我", "帮忙", "麻烦", "一下", "我想知道", "我想看", "告诉我", "查询", "查看", "看看",
+    "显示", "列出", "给出", "的", "了", "吗", "呢", "吧", "啊", "呀",
+)
+_FILLER_LATIN = ("please", "show", "me", "list", "give", "tell", "what", "is", "are", "the", "a", "an", "of")
+_FILLER_RE = re.compile(
+    r"\s+|\b(?:" + "|".join(_FILLER_LATIN) + r")\b|"
+    + "|".join(sorted(map(re.escape, _FILLER_WORDS), key=len, reverse=True))
+)
+
+# 历史问答对：助手消息带 SQL 且有结果数据，问题取同一会话中此前最近的用户消息
+_PAIRS_SQL = """
+SELECT a.rowid AS rid, a.sql AS sql, (
+    SELECT u.content FROM messages u
+    WHERE u.session_id = a.session_id AND u.role = 'user' AND u.created_at <= a.created_at
+    ORDER BY u.created_at DESC LIMIT 1
+) AS question
+FROM messages a
+WHERE a.role = 'assistant' AND a.sql IS NOT NULL AND a.sql != '' AND a.data IS NOT NULL AND a.rowid > ?
+ORDER BY a.rowid
+"""
+
+
+@dataclass
+class QuestionMatch:
+    """一条相似的历史问题"""
+    question: str
+    sql: str
+    score: float
+
+
+@dataclass
+class MatchResult:
+    """检索结果：可直接复用的 SQL，或用于提示词的示例"""
+    sql: Optional[str] = None
+    source: Optional[QuestionMatch] = None
+    substituted: Dict[str, str] = field(default_factory=dict)
+    examples: List[QuestionMatch] = field(default_factory=list)
+
+
+def sql_literals(sql: str) -> List[Tuple[str, str, int, int]]:
+    """
+    SQL 中的字符串与数值字面量
+
+    Returns:
+        [(种类, 取值, 原文起始, 原文结束)]，字符串取值已去引号
+    """
+    literals = []
+    for token in tokenize_sql(sql):
+        if token.kind == "string":
+            literals.append(("string", token.value[1:-1].replace("''", "'"), token.pos, token.pos + len(token.value)))
+        elif token.kind == "number":
+            literals.append(("number", token.value, token.pos, token.pos + len(token.value)))
+    return literals
+
+
+def _map_span(opcodes, start: int, end: int) -> Tuple[int, int]:
+    """把旧问题中的区间映射到新问题（落在改动块内的端点取改动块边界）"""
+    new_start = new_end = None
+    for tag, i1, i2, j1, j2 in opcodes:
+        if new_start is None and (i1 <= start < i2 or (i1 == i2 == start)):
+            new_start = j1 + (start - i1) if tag == "equal" else j1
+        if i1 < end <= i2:
+            new_end = j1 + (end - i1) if tag == "equal" else j2
+    return new_start if new_start is not None else 0, new_end if new_end is not None else 0
+
+
+def substitute_literals(old_question: str, new_question: str, sql: str) -> Optional[Tuple[str, Dict[str, str]]]:
+    """
+    问题之间的差异可完全由 SQL 字面量取值解释时，代入新取值
+
+    例如 "华东地区的销售额" → "华南地区的销售额"，SQL 中的 '华东' 替换为 '华南'。
+    差异块必须都落在某个出现于旧问题中的字面量内；数值字面量在 SQL 中须唯一。
+
+    Args:
+        old_question: 历史问题（规范化、保留大小写）
+        new_question: 新问题（同上）
+        sql: 历史 SQL
+
+    Returns:
+        (新 SQL, {旧取值: 新取值})，无法解释差异时返回 None
+    """
+    matcher = difflib.SequenceMatcher(None, old_question, new_question, autojunk=False)
+    opcodes = matcher.get_opcodes()
+    changed = [op for op in opcodes if op[0] != "equal"]
+    if not changed:
+        return sql, {}
+
+    literals = sql_literals(sql)
+    folded = old_question.casefold()
+    spans: Dict[str, Tuple[int, int]] = {}
+    for kind, value, _, _ in literals:
+        if not value or value in spans:
+            continue
+        if kind == "number":
+            # 数值按完整数字匹配（"1" 不匹配 "2021" 中的 1），且在 SQL 中须唯一
+            if sum(1 for lit in literals if lit[1] == value) > 1:
+                continue
+            found = re.search(r"(?<![\d.])" + re.escape(value) + r"(?![\d.])", folded)
+            position = found.start() if found else -1
+        else:
+            position = folded.find(value.casefold())
+        if position >= 0:
+            spans[value] = (position, position + len(value))
+    # 被更长字面量包含的区间不单独替换
+    spans = {
+        value: (s, e) for value, (s, e) in spans.items()
+        if not any(o != value and os <= s and e <= oe and (oe - os) > (e - s) for o, (os, oe) in spans.items())
+    }
+
+    # 每个差异块都要落在某个字面量区间内
+    for _, i1, i2, _, _ in changed:
+        if not any(s <= i1 and i2 <= e for s, e in spans.values()):
+            return None
+
+    replacements: Dict[str, str] = {}
+    for value, (start, end) in spans.items():
+        if not any(start <= i1 and i2 <= end for _, i1, i2, _, _ in changed):
+            continue
+        new_start, new_end = _map_span(opcodes, start, end)
+        new_value = new_question[new_start:new_end].strip()
+        if not new_value:
+            return None
+        kind = next(lit[0] for lit in literals if lit[1] == value)
+        if kind == "number" and not new_value.replace(".", "", 1).isdigit():
+            return None
+        replacements[value] = new_value
+
+    # 从后往前替换，保持原文位置有效
+    parts = []
+    last = len(sql)
+    for kind, value, start, end in sorted(literals, key=lambda lit: -lit[2]):
+        if value not in replacements:
+            continue
+        new_value = replacements[value]
+        text = "'" + new_value.replace("'", "''") + "'" if kind == "string" else new_value
+        parts.append(sql[end:last])
+        parts.append(text)
+        last = start
+    parts.append(sql[:last])
+    return "".join(reversed(parts)), replacements
+
+
+def literal_columns(sql: str) -> Dict[str, Tuple[str, str]]:
+    """
+    字符串字面量取值 → 与之比较的 (表, 列)
+
+    识别 col = 'v'、t.col != 'v' 与 col IN ('v', ...)；多表查询中未限定表名的列无法归属，不返回
+    """
+    tokens = tokenize_sql(sql)
+    aliases = table_aliases(sql)
+    tables = list(dict.fromkeys(aliases.values()))
+    columns: Dict[str, Tuple[str, str]] = {}
+    for i, token in enumerate(tokens):
+        if token.kind != "string":
+            continue
+        j = i - 1
+        while j >= 0 and (tokens[j].kind == "string" or tokens[j].value == ","):
+            j -= 1
+        if j >= 1 and tokens[j].value == "(" and is_keyword(tokens[j - 1], "IN"):
+            j -= 2
+        elif j >= 0 and tokens[j].value in ("=", "==", "!=", "<>"):
+            j -= 1
+        else:
+            continue
+        if j < 0 or tokens[j].kind not in ("ident", "qident"):
+            continue
+        if j >= 2 and tokens[j - 1].value == ".":
+            table = aliases.get(tokens[j - 2].name, tokens[j - 2].name)
+        elif len(tables) == 1:
+            table = tables[0]
+        else:
+            continue
+        columns[token.value[1:-1].replace("''", "'")] = (table, tokens[j].name)
+    return columns
+
+
+def _differs_only_in_wording(old_question: str, new_question: str) -> bool:
+    """
+    问题间只相差空白、标点与少量语气 / 请求用词（措辞不同而条件相同）
+
+    字符相似度高不代表含义相同："销售额最高的产品" 与 "销售额最低的产品"、
+    "销售额最高的产品" 与 "销售额最高的客户" 都只差两个字，只能作为少样本示例。
+    输入须来自 normalize_question（保留负号、小数点与百分号），
+    只差这些符号的问题条件不同，不算措辞差异
+    """
+    return _FILLER_RE.sub("", old_question.casefold()) == _FILLER_RE.sub("", new_question.casefold())
+
+
+class _Entry:
+    """索引中的一条问答对"""
+    __slots__ = ("question", "sql", "grams")
+
+    def __init__(self, question: str, sql: str, grams: Counter):
+        self.question = question
+        self.sql = sql
+        self.grams = grams
+
+
+class QuestionIndex:
+    """历史问答对的字符 n-gram TF-IDF 索引"""
+
+    def __init__(self, db: Optional[SQLiteManager] = None):
+        # 默认与全局实例共享连接池
+        self.db = db or shared_db
+        # 规范化问题 → 条目（按加入顺序，超出上限时淘汰最早的条目）
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._postings: Dict[str, set] = {}
+        self._last_rowid = 0
+        self._loaded_key: Optional[Tuple] = None
+        self.reused = 0
+        self.substituted = 0
+        self.few_shot = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, question: str, sql: str):
+        """加入一条成功执行的问答对（同一问题保留最新的 SQL）"""
+        key = normalize_question(question)
+        if not key or not sql:
+            return
+        if key in self._entries:
+            self._remove(key)
+        grams = char_ngrams(key)
+        self._entries[key] = _Entry(question, sql, grams)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(key)
+        while len(self._entries) > settings.question_index_max_pairs:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        for gram in entry.grams:
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    async def refresh(self):
+        """增量加载 messages 表中新增的问答对（表未变化时不查询）"""
+        key = await self.db.version_key(["messages"])
+        if key == self._loaded_key:
+            return
+        async with self.db.get_connection() as conn:
+            cursor = await conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='messages'")
+            if await cursor.fetchone() is None:
+                self._loaded_key = key
+                return
+            cursor = await conn.execute(_PAIRS_SQL, (self._last_rowid,))
+            rows = await cursor.fetchall()
+        for row in rows:
+            if row["question"]:
+                self.add(row["question"], row["sql"])
+            self._last_rowid = max(self._last_rowid, row["rid"])
+        self._loaded_key = key
+
+    def search(self, question: str, top_k: int) -> List[QuestionMatch]:
+        """按 TF-IDF 余弦相似度检索最相似的若干历史问题"""
+        key = normalize_question(question)
+        if not key or not self._entries:
+            return []
+        query = char_ngrams(key)
+        total = len(self._entries)
+
+        def idf(gram: str) -> float:
+            return math.log((1 + total) / (1 + len(self._postings.get(gram, ())))) + 1
+
+        candidates = set()
+        for gram in query:
+            keys = self._postings.get(gram)
+            if keys and len(keys) <= max(1, total * _COMMON_GRAM_RATIO):
+                candidates.update(keys)
+        if not candidates:
+            return []
+
+        weights = {gram: count * idf(gram) for gram, count in query.items()}
+        query_norm = math.sqrt(sum(w * w for w in weights.values()))
+        scored = []
+        for candidate in candidates:
+            entry = self._entries[candidate]
+            dot = 0.0
+            norm = 0.0
+            for gram, count in entry.grams.items():
+                weight = count * idf(gram)
+                norm += weight * weight
+                if gram in weights:
+                    dot += weight * weights[gram]
+            if dot > 0:
+                scored.append((dot / (query_norm * math.sqrt(norm)), candidate))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [
+            QuestionMatch(self._entries[k].question, self._entries[k].sql, round(score, 4))
+            for score, k in scored[:top_k]
+        ]
+
+    async def _compiles(self, sql: str) -> bool:
+        """SQL 在当前表结构上能否编译（EXPLAIN 只编译不执行）"""
+        try:
+            async with self.db.get_connection() as conn:
+                await conn.execute(f"EXPLAIN {sql}")
+            return True
+        except Exception:
+            return False
+
+    async def _values_exist(self, sql: str, replacements: Dict[str, str]) -> bool:
+        """
+        代入的字符串取值是否合理
+
+        数值与日期 / 编号形态的取值要求形态与长度一致；与列比较的取值须在该列中存在
+        （"各地区的利润" 与 "华东地区的利润" 的差异不能把 '华东' 替换为 '各'）
+        """
+        string_values = {value for kind, value, _, _ in sql_literals(sql) if kind == "string"}
+        columns = None
+        for old, new in replacements.items():
+            if old not in string_values:
+                continue
+            if _PATTERNED_RE.match(old):
+                if not _PATTERNED_RE.match(new) or len(new) != len(old):
+                    return False
+                continue
+            if columns is None:
+                columns = literal_columns(sql)
+            if old not in columns:
+                return False
+            table, column = columns[old]
+            quoted_table = '"' + table.replace('"', '""') + '"'
+            quoted_column = '"' + column.replace('"', '""') + '"'
+            try:
+                async with self.db.get_connection() as conn:
+                    cursor = await conn.execute(
+                        f"SELECT 1 FROM {quoted_table} WHERE {quoted_column} = ? LIMIT 1", (new,)
+                    )
+                    if await cursor.fetchone() is None:
+                        return False
+            except Exception:
+                return False
+        return True
+
+    async def match(self, question: str) -> MatchResult:
+        """
+        检索相似问题并决定复用方式（索引故障时返回空结果）
+
+        - 问题间差异可由 SQL 字面量解释且新取值在数据中存在：代入新取值后复用
+        - 相似度不低于复用阈值且只相差语气 / 请求用词：原样复用
+        - 相似度不低于示例阈值：作为少样本示例返回
+        """
+        if not settings.question_index_enabled:
+            return MatchResult()
+        try:
+            return await self._match(question)
+        except Exception as e:
+            logger.warning("question index lookup failed: %s", e)
+            return MatchResult()
+
+    async def _match(self, question: str) -> MatchResult:
+        await self.refresh()
+        matches = [
+            m for m in self.search(question, settings.question_match_examples)
+            if m.score >= settings.question_match_fewshot
+        ]
+        if not matches:
+            self.misses += 1
+            metrics.incr("question_index.miss")
+            return MatchResult()
+
+        text = normalize_question(question, casefold=False)
+        for candidate in matches:
+            old_text = normalize_question(candidate.question, casefold=False)
+            try:
+                substituted = substitute_literals(old_text, text, candidate.sql)
+            except ValueError:
+                substituted = None
+            if substituted and substituted[1]:
+                sql, replacements = substituted
+                if await self._values_exist(candidate.sql, replacements) and await self._compiles(sql):
+                    self.substituted += 1
+                    metrics.incr("question_index.substituted")
+                    return MatchResult(sql=sql, source=candidate, substituted=replacements)
+            elif candidate.score >= settings.question_match_reuse and \
+                    _differs_only_in_wording(old_text, text) and await self._compiles(candidate.sql):
+                self.reused += 1
+                metrics.incr("question_index.reused")
+                return MatchResult(sql=candidate.sql, source=candidate)
+
+        self.few_shot += 1
+        metrics.incr("question_index.few_shot")
+        return MatchResult(examples=matches)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pairs": len(self._entries),
+            "reused": self.reused,
+            "substituted": self.substituted,
+            "few_shot": self.few_shot,
+            "misses": self.misses,
+        }
+
+
+# 创建全局实例
+question_index = QuestionIndex()
@@ -0,0 +1,168 @@
+"""
+NL→SQL 缓存模块
+以规范化问题与表结构指纹为键，持久化函数调用参数（SQL 与原因）；
+带 TTL 与按最近使用时间的 LRU 淘汰，表结构变化后旧条目失效
+"""
+
+import hashlib
+import json
+import logging
+import time
+from typing import Dict, Any, Optional
+
+from app.config import settings
+from app.db.sqlite_manager import SQLiteManager, db as shared_db
+from app.utils.metrics import metrics
+from app.utils.text import normalize_question
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = "nl2sql_cache"
+
+
+class SQLCache:
+    """问题到 SQL 的持久缓存"""
+
+    def __init__(self, db: Optional[SQLiteManager] = None):
+        # 默认与全局实例共享连接池
+        self.db = db or shared_db
+        self.db.hide_table(TABLE_NAME)
+        self._initialized = False
+        self._purged_fingerprint: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def initialize(self):
+        """初始化表结构"""
+        if self._initialized:
+            return
+        await self.db.create_table(TABLE_NAME, {
+            "key": "TEXT PRIMARY KEY",
+            "question": "TEXT NOT NULL",
+            "fingerprint": "TEXT NOT NULL",
+            "arguments": "TEXT NOT NULL",
+            "created_at": "REAL NOT NULL",
+            "last_used": "REAL NOT NULL",
+            "hits": "INTEGER NOT NULL DEFAULT 0",
+        })
+
+        async def create_index(conn):
+            await conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_last_used ON {TABLE_NAME} (last_used)"
+            )
+            await conn.commit()
+            await self.db._mark_written([TABLE_NAME])
+
+        await self.db.pool.write(create_index)
+        self._initialized = True
+
+    @staticmethod
+    def make_key(normalized: str, fingerprint: str) -> str:
+        return hashlib.sha1(f"{fingerprint}\0{normalized}".encode("utf-8")).hexdigest()
+
+    async def _fingerprint(self) -> str:
+        """当前表结构指纹；指纹变化后删除旧指纹下的全部条目"""
+        fingerprint = await self.db.schema_fingerprint()
+        if fingerprint != self._purged_fingerprint:
+            removed = await self.db.execute_update(
+                f"DELETE FROM {TABLE_NAME} WHERE fingerprint != ?", (fingerprint,)
+            )
+            if removed:
+                logger.info("nl2sql cache: dropped %d entries after schema change", removed)
+                metrics.incr("sql_cache.invalidated", removed)
+            self._purged_fingerprint = fingerprint
+        return fingerprint
+
+    async def get(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        查找缓存的函数调用参数（缓存故障时按未命中处理）
+
+        Args:
+            question: 用户问题（原文）
+
+        Returns:
+            参数字典（含 sql），未命中或已过期返回 None
+        """
+        if not settings.sql_cache_enabled:
+            return None
+        try:
+            return await self._get(question)
+        except Exception as e:
+            logger.warning("nl2sql cache lookup failed: %s", e)
+            return None
+
+    async def _get(self, question: str) -> Optional[Dict[str, Any]]:
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        await self.initialize()
+        key = self.make_key(normalized, await self._fingerprint())
+        async with self.db.get_connection() as conn:
+            cursor = await conn.execute(
+                f"SELECT arguments, created_at FROM {TABLE_NAME} WHERE key = ?", (key,)
+            )
+            row = await cursor.fetchone()
+        now = time.time()
+        if row is None or now - row["created_at"] > settings.sql_cache_ttl_seconds:
+            if row is not None:
+                await self.db.execute_update(f"DELETE FROM {TABLE_NAME} WHERE key = ?", (key,))
+            self.misses += 1
+            metrics.incr("sql_cache.miss")
+            return None
+
+        await self.db.execute_update(
+            f"UPDATE {TABLE_NAME} SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key)
+        )
+        self.hits += 1
+        metrics.incr("sql_cache.hit")
+        return json.loads(row["arguments"])
+
+    async def put(self, question: str, arguments: Dict[str, Any]):
+        """写入缓存（应在 SQL 执行成功后调用），超出条目上限时淘汰最久未使用的条目"""
+        if not settings.sql_cache_enabled or not arguments.get("sql"):
+            return
+        try:
+            await self._put(question, arguments)
+        except Exception as e:
+            logger.warning("nl2sql cache write failed: %s", e)
+
+    async def _put(self, question: str, arguments: Dict[str, Any]):
+        normalized = normalize_question(question)
+        if not normalized:
+            return
+        await self.initialize()
+        fingerprint = await self._fingerprint()
+        key = self.make_key(normalized, fingerprint)
+        now = time.time()
+        await self.db.execute_update(
+            f"INSERT OR REPLACE INTO {TABLE_NAME} "
+            "(key, question, fingerprint, arguments, created_at, last_used, hits) VALUES (?, ?, ?, ?, ?, ?, 0)",
+            (key, normalized, fingerprint, json.dumps(arguments, ensure_ascii=False), now, now),
+        )
+        evicted = await self.db.execute_update(
+            f"DELETE FROM {TABLE_NAME} WHERE key IN ("
+            f"SELECT key FROM {TABLE_NAME} ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (settings.sql_cache_max_entries,),
+        )
+        if evicted:
+            self.evictions += evicted
+            metrics.incr("sql_cache.evicted", evicted)
+
+    async def clear(self):
+        """清空缓存"""
+        await self.initialize()
+        await self.db.execute_update(f"DELETE FROM {TABLE_NAME}")
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+# 创建全局实例
+sql_cache = SQLCache()
@@ -0,0 +1,29 @@
+"""
+运行指标模块
+进程内计数器，通过 /metrics 暴露
+"""
+
+from collections import defaultdict
+from typing import Dict
+
+
+class Metrics:
+    """简单计数器集合"""
+
+    def __init__(self):
+        self._counters: Dict[str, int] = defaultdict(int)
+
+    def incr(self, name: str, value: int = 1):
+        """计数器累加"""
+        self._counters[name] += value
+
+    def get(self, name: str) -> int:
+        return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        """所有计数器的当前值"""
+        return dict(sorted(self._counters.items()))
+
+
+# 创建全局实例
+metrics = Metrics()
@@ -0,0 +1,427 @@
+"""
+SQL 轻量解析工具
+词法切分、顶层子句拆分、表名/别名与过滤列提取（面向 SQLite 方言的 SELECT 语句）
+"""
+
+import re
+from typing import List, Dict, Optional, NamedTuple, Iterable, Tuple
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<qident>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|\.\d+)
+  | (?P<ident>[A-Za-z_一-鿿][\w一-鿿$]*)
+  | (?P<op><>|!=|<=|>=|==|\|\||[(),.;*=<>+\-/%?])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# 顶层子句关键字（多词关键字按首词识别）
+CLAUSE_KEYWORDS = ("SELECT", "FROM", "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT", "OFFSET")
+
+_JOIN_STOP = {
+    "ON", "USING", "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT", "JOIN", "INNER", "LEFT",
+    "RIGHT", "FULL", "CROSS", "NATURAL", "OUTER", "UNION", "EXCEPT", "INTERSECT", "WINDOW",
+}
+
+
+class Token(NamedTuple):
+    """词法单元"""
+    kind: str  # string / qident / number / ident / op
+    value: str
+    pos: int = -1  # 在原文中的起始位置
+
+    @property
+    def upper(self) -> str:
+        return self.value.upper()
+
+    @property
+    def name(self) -> str:
+        """标识符名（去掉引号）"""
+        if self.kind == "qident":
+            return self.value[1:-1]
+        return self.value
+
+
+def tokenize(sql: str) -> List[Token]:
+    """
+    词法切分（忽略空白与注释）
+
+    Raises:
+        ValueError: 含无法识别的字符
+    """
+    tokens = []
+    pos = 0
+    while pos < len(sql):
+        match = _TOKEN_RE.match(sql, pos)
+        if not match:
+            raise ValueError(f"无法解析的 SQL 片段: {sql[pos:pos + 20]!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        if kind in ("space", "comment"):
+            continue
+        tokens.append(Token(kind, match.group(), match.start()))
+    return tokens
+
+
+def is_keyword(token: Token, *words: str) -> bool:
+    return token.kind == "ident" and token.upper in words
+
+
+def split_clauses(tokens: List[Token]) -> Optional[Dict[str, List[Token]]]:
+    """
+    按顶层（括号深度为 0）关键字拆分单条 SELECT 语句
+
+    Returns:
+        {子句名: 子句内容}，如 {"SELECT": [...], "FROM": [...], "GROUP BY": [...]}；
+        非单条 SELECT（CTE、UNION、多语句等）返回 None
+    """
+    while tokens and tokens[-1].value == ";":
+        tokens = tokens[:-1]
+    if not tokens or not is_keyword(tokens[0], "SELECT"):
+        return None
+
+    clauses: Dict[str, List[Token]] = {}
+    current = None
+    depth = 0
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        elif token.value == ";":
+            return None
+        elif depth == 0 and token.kind == "ident":
+            word = token.upper
+            if word in ("UNION", "EXCEPT", "INTERSECT", "WITH"):
+                return None
+            if word in ("GROUP", "ORDER") and i + 1 < len(tokens) and is_keyword(tokens[i + 1], "BY"):
+                current = f"{word} BY"
+                if current in clauses:
+                    return None
+                clauses[current] = []
+                i += 2
+                continue
+            if word in CLAUSE_KEYWORDS and word not in ("GROUP", "ORDER"):
+                current = word
+                if current in clauses:
+                    return None
+                clauses[current] = []
+                i += 1
+                continue
+        if current is not None:
+            clauses[current].append(token)
+        i += 1
+    return clauses if depth == 0 else None
+
+
+def matching_paren(tokens: List[Token], start: int) -> int:
+    """tokens[start] 为 "(" 时返回与之匹配的 ")" 下标，不匹配返回 -1"""
+    depth = 0
+    for i in range(start, len(tokens)):
+        if tokens[i].value == "(":
+            depth += 1
+        elif tokens[i].value == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def split_top_level(tokens: List[Token], separator: str = ",") -> List[List[Token]]:
+    """按顶层（括号外）分隔符拆分，如选择列表、ORDER BY 列表"""
+    items: List[List[Token]] = [[]]
+    depth = 0
+    for token in tokens:
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        elif token.value == separator and depth == 0:
+            items.append([])
+            continue
+        items[-1].append(token)
+    return items
+
+
+def item_alias(item: List[Token]) -> Optional[str]:
+    """选择项的别名（AS 别名或紧跟表达式的裸别名）"""
+    if len(item) >= 2 and item[-1].kind in ("ident", "qident"):
+        prev = item[-2]
+        if is_keyword(prev, "AS"):
+            return item[-1].name
+        if item[-1].upper != "END" and (prev.kind in ("ident", "qident", "number", "string") or prev.value == ")"):
+            return item[-1].name
+    return None
+
+
+def strip_qualifiers(tokens: List[Token], names: Iterable[str]) -> List[Token]:
+    """去掉 "表名." / "别名." 限定前缀（names 为小写的表名与别名）"""
+    names = set(names)
+    out = []
+    i = 0
+    while i < len(tokens):
+        if (
+            tokens[i].kind in ("ident", "qident") and tokens[i].name.lower() in names
+            and i + 1 < len(tokens) and tokens[i + 1].value == "."
+        ):
+            i += 2
+            continue
+        out.append(tokens[i])
+        i += 1
+    return out
+
+
+def source_span(sql: str, tokens: List[Token]) -> str:
+    """词法单元序列在原文中对应的文本（SQLite 以此作为未命名表达式的结果列名）"""
+    return sql[tokens[0].pos:tokens[-1].pos + len(tokens[-1].value)]
+
+
+def single_table_source(from_tokens: List[Token]) -> Optional[Tuple[str, set]]:
+    """
+    解析只含一张表的 FROM 子句
+
+    Returns:
+        (表名, {小写的表名与别名})，含 JOIN、子查询等时返回 None
+    """
+    if not from_tokens or from_tokens[0].kind not in ("ident", "qident"):
+        return None
+    table = from_tokens[0].name
+    names = {table.lower()}
+    rest = from_tokens[1:]
+    if rest and is_keyword(rest[0], "AS"):
+        rest = rest[1:]
+    if len(rest) == 1 and rest[0].kind in ("ident", "qident"):
+        names.add(rest[0].name.lower())
+    elif rest:
+        return None
+    return table, names
+
+
+def table_aliases(sql: str) -> Dict[str, str]:
+    """
+    提取 FROM / JOIN 中的表名及别名
+
+    Returns:
+        {别名或表名: 表名}，子查询与 CTE 名不会被解析为真实表
+    """
+    try:
+        tokens = tokenize(sql)
+    except ValueError:
+        return {}
+    aliases: Dict[str, str] = {}
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if is_keyword(token, "FROM", "JOIN") or (token.value == "," and _in_from_list(tokens, i)):
+            j = i + 1
+            if j < len(tokens) and tokens[j].kind in ("ident", "qident") and not is_keyword(tokens[j], "SELECT"):
+                table = tokens[j].name
+                j += 1
+                # schema.table
+                if j + 1 < len(tokens) and tokens[j].value == "." and tokens[j + 1].kind in ("ident", "qident"):
+                    table = tokens[j + 1].name
+                    j += 2
+                aliases[table] = table
+                if j < len(tokens) and is_keyword(tokens[j], "AS"):
+                    j += 1
+                if (
+                    j < len(tokens)
+                    and tokens[j].kind in ("ident", "qident")
+                    and tokens[j].upper not in _JOIN_STOP
+                ):
+                    aliases[tokens[j].name] = table
+        i += 1
+    return aliases
+
+
+def _in_from_list(tokens: List[Token], index: int) -> bool:
+    """逗号是否位于 FROM 子句的表列表中（同一括号层级内向前找到 FROM 且中间无其他子句）"""
+    depth = 0
+    for token in reversed(tokens[:index]):
+        if token.value == ")":
+            depth += 1
+        elif token.value == "(":
+            if depth == 0:
+                return False
+            depth -= 1
+        elif depth == 0 and token.kind == "ident":
+            if token.upper == "FROM":
+                return True
+            if token.upper in ("SELECT", "WHERE", "GROUP", "ORDER", "HAVING", "ON", "BY"):
+                return False
+    return False
+
+
+def referenced_tables(sql: str) -> List[str]:
+    """SQL 中引用的真实表名（去重，保持出现顺序）"""
+    return list(dict.fromkeys(table_aliases(sql).values()))
+
+
+def _column_refs(tokens: List[Token], aliases: Dict[str, str]) -> List[Dict[str, str]]:
+    """提取片段中的列引用 [{"table": 表名或空, "column": 列名, "index": 位置}]"""
+    refs = []
+    for i, token in enumerate(tokens):
+        if token.kind not in ("ident", "qident"):
+            continue
+        if i + 1 < len(tokens) and tokens[i + 1].value in ("(", "."):
+            continue  # 函数名或限定前缀
+        table = ""
+        if i >= 2 and tokens[i - 1].value == "." and tokens[i - 2].kind in ("ident", "qident"):
+            table = aliases.get(tokens[i - 2].name, tokens[i - 2].name)
+        refs.append({"table": table, "column": token.name, "index": i})
+    return refs
+
+
+def filter_columns(sql: str) -> Optional[Dict[str, List[Dict[str, str]]]]:
+    """
+    提取过滤、分组、排序与其他引用列，供索引建议使用
+
+    Returns:
+        {"eq": [...], "range": [...], "group": [...], "order": [...], "other": [...]}，
+        每项为 {"table": 表名或空, "column": 列名}；非单条 SELECT 返回 None
+    """
+    try:
+        tokens = tokenize(sql)
+    except ValueError:
+        return None
+    clauses = split_clauses(tokens)
+    if clauses is None:
+        return None
+    aliases = table_aliases(sql)
+
+    result: Dict[str, List[Dict[str, str]]] = {"eq": [], "range": [], "group": [], "order": [], "other": []}
+    where = clauses.get("WHERE", [])
+    for ref in _column_refs(where, aliases):
+        i = ref.pop("index")
+        nxt = where[i + 1] if i + 1 < len(where) else None
+        if nxt is not None and (nxt.value in ("=", "==") or is_keyword(nxt, "IN", "IS")):
+            result["eq"].append(ref)
+        elif nxt is not None and (nxt.value in ("<", ">", "<=", ">=") or is_keyword(nxt, "BETWEEN", "LIKE", "GLOB")):
+            result["range"].append(ref)
+        else:
+            result["other"].append(ref)
+    for clause, key in (("GROUP BY", "group"), ("ORDER BY", "order"), ("SELECT", "other"), ("HAVING", "other")):
+        for ref in _column_refs(clauses.get(clause, []), aliases):
+            ref.pop("index")
+            result[key].append(ref)
+    return result
+
+
+# 结果随调用时刻或连接状态变化的函数，包含它们的查询不可缓存
+NONDETERMINISTIC_FUNCTIONS = {
+    "RANDOM", "RANDOMBLOB", "CHANGES", "TOTAL_CHANGES", "LAST_INSERT_ROWID",
+    "CURRENT_DATE", "CURRENT_TIME", "CURRENT_TIMESTAMP",
+}
+
+
+def render_tokens(tokens: List[Token]) -> str:
+    """以单个空格连接词法单元，未加引号的标识符与关键字统一为大写"""
+    parts = []
+    for token in tokens:
+        if token.kind == "ident":
+            parts.append(token.upper)
+        elif token.kind == "qident":
+            parts.append('"' + token.name.replace('"', '""') + '"')
+        else:
+            parts.append(token.value)
+    return " ".join(parts)
+
+
+def _sort_in_lists(tokens: List[Token]) -> List[Token]:
+    """将 IN (...) 中纯常量列表按字面值排序（顺序不影响结果）"""
+    result: List[Token] = []
+    i = 0
+    while i < len(tokens):
+        result.append(tokens[i])
+        if is_keyword(tokens[i], "IN") and i + 1 < len(tokens) and tokens[i + 1].value == "(":
+            # 匹配 ( 常量 [, 常量 ...] )
+            literals = []
+            j = i + 2
+            while j < len(tokens) and tokens[j].kind in ("string", "number"):
+                literals.append(tokens[j])
+                if j + 1 < len(tokens) and tokens[j + 1].value == ",":
+                    j += 2
+                else:
+                    j += 1
+                    break
+            if literals and j < len(tokens) and tokens[j].value == ")" and tokens[j - 1] is literals[-1]:
+                result.append(tokens[i + 1])
+                for k, literal in enumerate(sorted(literals, key=lambda t: (t.kind, t.value))):
+                    if k:
+                        result.append(Token("op", ","))
+                    result.append(literal)
+                result.append(tokens[j])
+                i = j + 1
+                continue
+        i += 1
+    return result
+
+
+def normalize_sql(sql: str) -> Optional[str]:
+    """
+    规范化 SQL 文本，用作缓存键
+
+    单条 SELECT 的选择列表保持原文（未命名表达式的结果列名取自原文），
+    其余部分去除注释与多余空白、统一关键字和未加引号标识符的大小写、
+    去掉末尾分号，并对 IN 常量列表排序；字符串常量保持原样。
+    其他语句只去除首尾空白与末尾分号。
+
+    Returns:
+        规范化文本，无法解析时返回 None
+    """
+    try:
+        tokens = tokenize(sql)
+    except ValueError:
+        return None
+    while tokens and tokens[-1].value == ";":
+        tokens = tokens[:-1]
+    if not tokens:
+        return None
+    if split_clauses(tokens) is None:
+        last = tokens[-1]
+        return sql[tokens[0].pos:last.pos + len(last.value)]
+
+    # 选择列表：SELECT 之后到顶层 FROM 之前
+    depth = 0
+    end = len(tokens)
+    for i, token in enumerate(tokens[1:], start=1):
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        elif depth == 0 and is_keyword(token, "FROM", "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT", "WINDOW"):
+            end = i
+            break
+    if end == 1:
+        return render_tokens(_sort_in_lists(tokens))
+    last = tokens[end - 1]
+    select_list = sql[tokens[1].pos:last.pos + len(last.value)]
+    rest = render_tokens(_sort_in_lists(tokens[end:]))
+    return f"SELECT {select_list} {rest}".rstrip()
+
+
+def is_cacheable_query(sql: str) -> bool:
+    """是否为结果可缓存的只读查询（单条 SELECT / WITH，且不含非确定性函数）"""
+    try:
+        tokens = tokenize(sql)
+    except ValueError:
+        return False
+    while tokens and tokens[-1].value == ";":
+        tokens = tokens[:-1]
+    if not tokens or not is_keyword(tokens[0], "SELECT", "WITH"):
+        return False
+    for token in tokens:
+        if token.value == ";":
+            return False
+        if token.kind == "ident" and token.upper in NONDETERMINISTIC_FUNCTIONS:
+            return False
+        # date('now') 之类依赖当前时间
+        if token.kind == "string" and token.value.lower() == "'now'":
+            return False
+    return True
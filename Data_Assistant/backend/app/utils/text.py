@@ -0,0 +1,67 @@
+"""
+文本规范化工具
+用于问题缓存键与相似问题检索：全角 / 半角折叠、大小写、标点与空白归一，字符 n-gram
+"""
+
+import re
+import unicodedata
+from collections import Counter
+from typing import Iterable
+
+_SPACE_RE = re.compile(r"\s+")
+# 只起分隔作用的标点（NFKC 之后的形式）：引号、括号与句读符号；
+# "." 后面不是数字时按句号处理，小数点保留
+_SEPARATOR_RE = re.compile(
+    "[" + re.escape("\"'`“”‘’「」『』《》〈〉()[]{}【】〔〕〖〗,、;:!?。·~") + r"]|\.(?!\d)"
+)
+
+
+def _is_word_char(ch: str) -> bool:
+    """需要以空格与相邻词分隔的字符（拉丁字母与数字）"""
+    return ch.isascii() and ch.isalnum()
+
+
+def normalize_question(text: str, casefold: bool = True) -> str:
+    """
+    规范化自然语言问题
+
+    NFKC 折叠全角字符（"ＳＵＭ"→"SUM"，"，"→","）后转小写（casefold=False 时保留大小写），
+    引号、括号与句读符号视为空白；
+    空白只在两侧均为拉丁字母或数字时保留为单个空格，中文之间的空白删除。
+    负号、小数点、百分号与比较运算符等符号保留，因为它们会改变问题的含义。
+
+    Examples:
+        >>> normalize_question("  各地区的 销售额？ ")
+        '各地区的销售额'
+        >>> normalize_question("Top５ products!")
+        'top5 products'
+        >>> normalize_question("增长超过-1.5%的地区？")
+        '增长超过-1.5%的地区'
+    """
+    text = unicodedata.normalize("NFKC", text)
+    if casefold:
+        text = text.casefold()
+    text = _SEPARATOR_RE.sub(" ", text)
+    words = _SPACE_RE.split(text.strip())
+    result = ""
+    for word in words:
+        if not word:
+            continue
+        if result and _is_word_char(result[-1]) and _is_word_char(word[0]):
+            result += " "
+        result += word
+    return result
+
+
+def char_ngrams(text: str, sizes: Iterable[int] = (1, 2)) -> Counter:
+    """
+    字符 n-gram 计数（输入应已规范化）
+
+    文本短于最小的 n 时以整段文本作为唯一的词项
+    """
+    grams: Counter = Counter()
+    for n in sizes:
+        grams.update(text[i:i + n] for i in range(len(text) - n + 1))
+    if not grams and text:
+        grams[text] += 1
+    return grams
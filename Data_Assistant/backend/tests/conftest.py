@@ -0,0 +1,49 @@
+"""
+测试公共部分
+- FakeLLM：返回固定 SQL 的假 LLM，各测试按需继承并覆盖
+- db：临时目录下的数据库（未打开，由测试在事件循环内 open / close）
+"""
+
+import pytest
+
+from app.core.llm import ToolCall
+from app.db.sqlite_manager import SQLiteManager
+
+REGION_TOTAL_SQL = "SELECT region, SUM(amount) AS total FROM sales GROUP BY region"
+
+
+class FakeLLM:
+    """
+    返回固定 SQL 的假 LLM
+
+    流式生成 SQL 复用 generate_sql_with_tool；默认不推荐图表，回答固定为 "完成"
+    """
+
+    def __init__(self, sql: str = REGION_TOTAL_SQL, reason: str = None):
+        self.sql = sql
+        self.reason = reason
+        self.sql_calls = 0
+
+    async def generate_sql_with_tool(self, question, schema, examples=None):
+        self.sql_calls += 1
+        arguments = {"sql": self.sql}
+        if self.reason is not None:
+            arguments["reason"] = self.reason
+        return ToolCall(id="call_1", type="function", function_name="execute_sql", function_arguments=arguments)
+
+    async def stream_sql_with_tool(self, question, schema, examples=None):
+        tool_call = await self.generate_sql_with_tool(question, schema, examples)
+        yield "sql", tool_call.function_arguments["sql"]
+        yield "tool_call", tool_call
+
+    async def recommend_chart(self, data, question, sql):
+        return None
+
+    async def generate_answer(self, question, sql, data, truncated=False, digest=None):
+        yield "完成"
+
+
+@pytest.fixture
+def db(tmp_path) -> SQLiteManager:
+    """临时数据库"""
+    return SQLiteManager(str(tmp_path / "test.db"))
@@ -0,0 +1,123 @@
+"""
+规则图表推荐测试
+测试内容：
+1. 结果列类型推断（时间 / 分类 / 数值）
+2. 分类 + 度量 → 柱状图，占比问题 → 饼图，时间 + 度量 → 折线图，两个分类 → 拆分系列
+3. 配置使用全部结果行；无法确定时返回 None 并由 Agent 回退到 LLM
+4. LLM 返回的紧凑图表规格的校验与本地数据绑定
+"""
+
+import asyncio
+
+from app.core import chart_rules
+from app.core.agent import DataAnalysisAgent
+from conftest import FakeLLM
+
+
+def test_profile_fields():
+    """列类型与基数"""
+    data = [
+        {"month": "2024-01", "region": "华东", "total": 10.5, "year": 2024},
+        {"month": "2024-02", "region": "华北", "total": 8, "year": 2024},
+    ]
+    kinds = {p.name: (p.kind, p.distinct) for p in chart_rules.profile_fields(data)}
+    assert kinds == {
+        "month": ("temporal", 2), "region": ("categorical", 2),
+        "total": ("numeric", 2), "year": ("temporal", 1),
+    }
+
+
+def test_choose_spec_rules():
+    """常见结果形态的图表选择"""
+    by_region = [{"region": r, "total": v} for r, v in (("华东", 30), ("华北", 20), ("华南", 10))]
+    assert chart_rules.choose_spec(by_region, "各地区的销售额").chart_type == "bar"
+    assert chart_rules.choose_spec(by_region, "各地区销售额占比").chart_type == "pie"
+
+    trend = [{"month": f"2024-{m:02d}", "total": m * 10, "orders": m} for m in range(12, 0, -1)]
+    spec = chart_rules.choose_spec(trend, "每月销售趋势")
+    assert spec.chart_type == "line" and spec.y == ["total", "orders"]
+    option = chart_rules.build_option(spec, trend)
+    # 时间轴排序，全部 12 个点都在图中
+    assert option["xAxis"]["data"][0] == "2024-01" and len(option["series"][0]["data"]) == 12
+
+    pivot = [
+        {"product": p, "region": r, "total": i}
+        for i, (p, r) in enumerate((p, r) for p in ("A", "B", "C", "D") for r in ("华东", "华北"))
+    ]
+    spec = chart_rules.choose_spec(pivot, "")
+    assert (spec.chart_type, spec.x, spec.series) == ("bar", "product", "region")
+    option = chart_rules.build_option(spec, pivot)
+    assert [s["name"] for s in option["series"]] == ["华东", "华北"]
+    assert option["series"][1]["data"] == [1, 3, 5, 7]
+
+    # 规则无法确定
+    assert chart_rules.choose_spec([{"total": 1}], "") is None
+    assert chart_rules.choose_spec([{"name": "a"}, {"name": "b"}], "") is None
+    assert chart_rules.choose_spec([{"region": "华东", "total": 1}, {"region": "华东", "total": 2}], "") is None
+
+
+def test_bar_uses_all_rows():
+    """大结果集生成完整的配置并开启缩放"""
+    data = [{"product": f"P{i}", "amount": i} for i in range(500)]
+    chart = chart_rules.recommend(data, "各产品的销售额")
+    option = chart["echarts_option"]
+    assert chart["chart_type"] == "bar"
+    assert len(option["xAxis"]["data"]) == 500 and option["series"][0]["data"][-1] == 499
+    assert "dataZoom" in option
+
+
+def test_bind_llm_spec():
+    """LLM 规格绑定全部数据，非法字段被拒绝"""
+    data = [{"product": f"P{i}", "amount": i * 2, "qty": i} for i in range(40)]
+    chart = chart_rules.bind(
+        {"chart_type": "line", "x": "product", "y": ["amount", "qty"], "series": None, "title": "趋势"}, data
+    )
+    option = chart["echarts_option"]
+    assert chart["chart_type"] == "line" and option["title"]["text"] == "趋势"
+    assert [len(s["data"]) for s in option["series"]] == [40, 40]
+
+    radar = chart_rules.bind({"chart_type": "radar", "x": "product", "y": ["amount", "qty"]}, data[:3])
+    assert radar["echarts_option"]["radar"]["indicator"][0] == {"name": "amount", "max": 4}
+    assert len(radar["echarts_option"]["series"][0]["data"]) == 3
+
+    assert chart_rules.bind({"chart_type": "bar", "x": "missing", "y": ["amount"]}, data) is None
+    assert chart_rules.bind({"chart_type": "gauge", "x": "product", "y": ["amount"]}, data) is None
+    assert chart_rules.bind({"chart_type": "bar", "x": "product", "y": ["nope"]}, data) is None
+    # 旧格式原样返回
+    legacy = {"chart_type": "bar", "echarts_option": {"series": []}}
+    assert chart_rules.bind(legacy, data) is legacy
+
+
+class ChartLLM(FakeLLM):
+    """记录图表推荐调用次数的假 LLM"""
+
+    def __init__(self, sql: str):
+        super().__init__(sql)
+        self.chart_calls = 0
+
+    async def recommend_chart(self, data, question, sql):
+        self.chart_calls += 1
+        return {"chart_type": "bar", "x": "product_name", "y": ["amount"], "series": "region", "title": "产品"}
+
+
+def test_agent_falls_back_to_llm(db):
+    """规则命中时不调用 LLM，无法确定时回退"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            llm = ChartLLM("SELECT region, SUM(amount) AS total FROM sales GROUP BY region")
+            agent = DataAnalysisAgent(llm=llm, db=db)
+            result = await agent.process_query("各地区的销售额")
+            assert llm.chart_calls == 0 and result.chart_config["chart_type"] == "bar"
+
+            # 规则无法确定：LLM 只返回规格，数据在本地绑定
+            llm.sql = "SELECT product_name, category, region, amount FROM sales"
+            result = await agent.process_query("列出产品、类别、地区与金额")
+            assert llm.chart_calls == 1
+            option = result.chart_config["echarts_option"]
+            assert {s["name"] for s in option["series"]} == {row["region"] for row in result.data}
+        finally:
+            await db.close()
+
+    asyncio.run(run())
@@ -0,0 +1,125 @@
+"""
+阶段执行器测试
+测试内容：
+1. 协程与异步生成器阶段并发运行，事件按产生顺序合并
+2. 阶段异常转换为 error 事件，退出时取消并关闭未完成的阶段
+3. Agent 的图表推荐与回答生成并发执行（流式与非流式）
+"""
+
+import asyncio
+import time
+
+from app.config import settings
+from app.core.agent import DataAnalysisAgent
+from app.core.executor import StageExecutor
+from conftest import FakeLLM
+
+DELAY = 0.2
+
+
+class SlowLLM(FakeLLM):
+    """图表推荐与回答生成各耗时约 DELAY 秒的假 LLM"""
+
+    def __init__(self, chart_error: bool = False):
+        super().__init__()
+        self.chart_error = chart_error
+
+    async def recommend_chart(self, data, question, sql):
+        await asyncio.sleep(DELAY)
+        if self.chart_error:
+            raise ValueError("bad chart")
+        return {"chart_type": "bar", "echarts_option": {}}
+
+    async def generate_answer(self, question, sql, data, truncated=False, digest=None):
+        for part in ("各", "地区", "销售额"):
+            await asyncio.sleep(DELAY / 4)
+            yield part
+
+
+def test_stages_run_concurrently_and_merge():
+    """两个阶段同时运行，回答片段先于图表输出"""
+    async def run():
+        async def slow_value():
+            await asyncio.sleep(DELAY)
+            return 42
+
+        async def chunks():
+            for i in range(3):
+                await asyncio.sleep(DELAY / 4)
+                yield i
+
+        started = time.perf_counter()
+        async with StageExecutor() as stages:
+            stages.run("value", slow_value())
+            stages.run("chunks", chunks())
+            events = [e async for e in stages.events()]
+        elapsed = time.perf_counter() - started
+
+        assert elapsed < DELAY * 1.6
+        assert [e.value for e in events if e.stage == "chunks" and not e.done] == [0, 1, 2]
+        assert events[-1].stage == "value" and events[-1].value == 42
+        assert set(stages.timings) == {"value", "chunks"}
+
+    asyncio.run(run())
+
+
+def test_stage_error_and_cancel():
+    """异常转为事件；提前退出时关闭未完成的生成器"""
+    async def run():
+        closed = []
+
+        async def broken():
+            raise ValueError("boom")
+
+        async def endless():
+            try:
+                while True:
+                    await asyncio.sleep(0.01)
+                    yield "x"
+            finally:
+                closed.append(True)
+
+        async with StageExecutor() as stages:
+            stages.run("broken", broken())
+            stages.run("endless", endless())
+            async for event in stages.events():
+                if event.stage == "broken":
+                    assert isinstance(event.error, ValueError) and event.done
+                    break
+        assert closed == [True]
+
+    asyncio.run(run())
+
+
+def test_agent_overlaps_chart_and_answer(db, monkeypatch):
+    """Agent 并发执行图表推荐与回答生成"""
+    # 关闭规则推荐，图表走 LLM
+    monkeypatch.setattr(settings, "chart_rules_enabled", False)
+
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            agent = DataAnalysisAgent(llm=SlowLLM(), db=db)
+
+            started = time.perf_counter()
+            events = [e async for e in agent.stream_process_query("各地区的销售额")]
+            assert time.perf_counter() - started < DELAY * 1.8
+            types = [e["type"] for e in events]
+            assert types.index("answer_chunk") < types.index("chart") < types.index("answer")
+            assert next(e for e in events if e["type"] == "answer")["content"] == "各地区销售额"
+
+            started = time.perf_counter()
+            result = await agent.process_query("各地区的销售额")
+            assert time.perf_counter() - started < DELAY * 1.8
+            assert result.chart_config["chart_type"] == "bar" and result.answer == "各地区销售额"
+
+            # 图表失败不影响回答
+            agent.llm = SlowLLM(chart_error=True)
+            events = [e async for e in agent.stream_process_query("各地区的销售额")]
+            types = [e["type"] for e in events]
+            assert "chart" not in types and types[-2:] == ["answer", "done"]
+        finally:
+            await db.close()
+
+    asyncio.run(run())
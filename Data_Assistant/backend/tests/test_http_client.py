@@ -0,0 +1,106 @@
+"""
+共享 HTTP 客户端测试
+测试内容：
+1. 多次对话与流式调用复用同一连接
+2. 连接池统计与关闭
+3. 事件循环变化后重新创建客户端
+"""
+
+import asyncio
+import json
+
+from app.core.http_client import SharedHTTPClient
+from app.core.llm import Qwen3LLM
+
+
+class KeepAliveServer:
+    """最小的 HTTP/1.1 保活服务器，模拟 chat/completions（含 SSE 流式响应）"""
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = 0
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = dict(
+                    line.split(": ", 1) for line in head.decode().split("\r\n")[1:] if ": " in line
+                )
+                length = int({k.lower(): v for k, v in headers.items()}.get("content-length", 0))
+                payload = json.loads(await reader.readexactly(length)) if length else {}
+                self.requests += 1
+                if payload.get("stream"):
+                    events = [{"choices": [{"delta": {"content": part}}]} for part in ("你", "好")]
+                    body = "".join(f"data: {json.dumps(e)}\n\n" for e in events) + "data: [DONE]\n\n"
+                    content_type = "text/event-stream"
+                else:
+                    body = json.dumps({"choices": [{"message": {"content": "ok"}}]})
+                    content_type = "application/json"
+                data = body.encode()
+                writer.write(
+                    f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(data)}\r\nConnection: keep-alive\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+
+def make_llm(http: SharedHTTPClient, base_url: str) -> Qwen3LLM:
+    return Qwen3LLM(api_key="test", http=http, base_url=base_url)
+
+
+def test_calls_reuse_one_connection():
+    """顺序的对话与流式调用复用同一个保活连接"""
+    async def run():
+        server = KeepAliveServer()
+        base_url = await server.start()
+        http = SharedHTTPClient()
+        llm = make_llm(http, base_url)
+        try:
+            for _ in range(3):
+                result = await llm.chat([{"role": "user", "content": "hi"}])
+                assert result["choices"][0]["message"]["content"] == "ok"
+            chunks = [c async for c in llm.stream_chat([{"role": "user", "content": "hi"}])]
+            assert len(chunks) == 2
+
+            assert server.requests == 4
+            assert server.connections == 1
+            stats = http.stats()
+            assert stats["clients_created"] == 1
+            assert stats["requests"] == 3 and stats["streams"] == 1
+            assert stats["pool"]["connections"] == 1 and stats["pool"]["idle"] == 1
+        finally:
+            await http.close()
+            await server.stop()
+        assert http.stats()["pool"]["connections"] == 0
+
+    asyncio.run(run())
+
+
+def test_client_recreated_for_new_event_loop():
+    """事件循环变化时重新创建客户端"""
+    http = SharedHTTPClient()
+
+    async def touch():
+        return http.client
+
+    first = asyncio.run(touch())
+    second = asyncio.run(touch())
+    assert first is not second
+    assert http.created == 2
+    asyncio.run(http.close())
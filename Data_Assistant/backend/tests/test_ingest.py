@@ -0,0 +1,194 @@
+"""
+批量导入测试
+测试内容：
+1. CSV 流式解析（跨块的多字节字符与行、引号内换行、只按 \\n 分行）、类型推断与分事务写入
+2. NDJSON 导入已有表，汇总表随导入增量维护
+3. 列数不符、未知列、建表失败等错误，拒绝导入内部表、会话表与系统表；表名为关键字时正常导入
+4. /api/datasets 上传接口
+"""
+
+import asyncio
+import json
+import sqlite3
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.api import datasets
+from app.config import settings
+from app.db.ingest import DatasetLoader, IngestError
+
+CSV_TEXT = (
+    "code,name,price,qty,note\r\n"
+    "007,\"苹果, 红富士\",3.5,10,\r\n"
+    "012,香蕉,2,,\"第一行\n第二行\"\r\n"
+    "100,橙子,4.25,7,普通\r\n"
+    "101,\"葡萄\",,3,\r\n"
+)
+
+
+async def byte_chunks(data: bytes, size: int):
+    """按固定大小切块，模拟网络分块到达"""
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def test_csv_streaming_and_type_inference(db):
+    """CSV 流式导入：新建表、类型推断、NULL 与分事务"""
+    async def run():
+        await db.open()
+        try:
+            loader = DatasetLoader(db)
+            report = await loader.load(
+                "fruits", byte_chunks(CSV_TEXT.encode("utf-8"), 5),
+                transaction_rows=3, indexes=["name"],
+            )
+            assert report.rows == 4
+            assert report.created
+            assert report.transactions == 2
+            assert report.columns == {
+                "code": "TEXT", "name": "TEXT", "price": "REAL", "qty": "INTEGER", "note": "TEXT",
+            }
+            assert report.indexes == ["idx_fruits_name"]
+            assert report.to_dict()["rows_per_second"] > 0
+
+            rows = await db.execute_query("SELECT * FROM fruits ORDER BY code")
+            assert rows[0] == {"code": "007", "name": "苹果, 红富士", "price": 3.5, "qty": 10, "note": None}
+            assert rows[1]["note"] == "第一行\n第二行"
+            assert rows[1]["qty"] is None and rows[1]["price"] == 2.0
+            assert rows[3]["price"] is None
+            assert "idx_fruits_name" in (await db.get_table_schema("fruits"))["indexes"]
+            assert "fruits" in await db.get_schema()
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_ndjson_into_existing_table_maintains_rollups(db, monkeypatch):
+    """NDJSON 导入已有表，汇总表在同一事务中增量更新；采样之后出现的新字段被忽略"""
+    monkeypatch.setattr(settings, "ingest_sample_rows", 3)
+    lines = [
+        '{"product_name": "Kindle", "category": "配件", "amount": 998, "quantity": 5, '
+        f'"sale_date": "2024-03-{day:02d}", "region": "华东"' + (', "channel": "online"}' if day == 10 else "}")
+        for day in range(1, 11)
+    ]
+    body = ("\n".join(lines) + "\n\n").encode("utf-8")
+    sql = "SELECT region, SUM(amount) AS total, COUNT(*) FROM sales GROUP BY region ORDER BY region"
+
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            await db.rollups.refresh()
+            report = await DatasetLoader(db).load("sales", byte_chunks(body, 64), fmt="ndjson", transaction_rows=4)
+            assert report.rows == 10 and not report.created
+            assert report.transactions == 3
+            assert report.ignored_columns == ["channel"]
+            assert report.columns["amount"] == "REAL"
+
+            for definition in db.rollups.definitions:
+                assert await db.rollups.is_fresh(definition)
+            rewritten = await db.rollups.rewrite(sql)
+            assert rewritten is not None
+            assert await db.execute_query(rewritten[0]) == await db.execute_query(sql)
+            rows = await db.execute_query("SELECT COUNT(*) AS n FROM sales WHERE product_name = 'Kindle'")
+            assert rows[0]["n"] == 10
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_lines_split_only_on_newline(db):
+    """字段中的 \\x0b、\\x0c、\\x1c、\\x85、\\u2028 不会把记录拆开"""
+    async def run():
+        await db.open()
+        try:
+            loader = DatasetLoader(db)
+            notes = ["a\x0bb", "c\x0cd", "e\x1cf", "g\x85h", "i\u2028j"]
+            text = "id,note\r\n" + "".join(f"{i},{note}\r\n" for i, note in enumerate(notes))
+            report = await loader.load("notes", byte_chunks(text.encode(), 5))
+            assert report.rows == len(notes)
+            rows = await db.execute_query("SELECT note FROM notes ORDER BY id")
+            assert [row["note"] for row in rows] == notes
+
+            lines = "".join(json.dumps({"id": i, "note": note}, ensure_ascii=False) + "\n" for i, note in enumerate(notes))
+            report = await loader.load("notes_json", byte_chunks(lines.encode(), 7), fmt="ndjson")
+            assert report.rows == len(notes)
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_invalid_input(db, monkeypatch):
+    """列数不符、已有表中不存在的列、无效表名、内部表"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            loader = DatasetLoader(db)
+            with pytest.raises(IngestError, match="第 3 条记录"):
+                await loader.load("t1", byte_chunks(b"a,b\n1,2\n3\n", 4), transaction_rows=1)
+            # 出错前已提交的事务保留
+            assert (await db.execute_query("SELECT COUNT(*) AS n FROM t1"))[0]["n"] == 1
+            with pytest.raises(IngestError, match="不存在列"):
+                await loader.load("sales", byte_chunks(b"product_name,color\nx,red\n", 64))
+            with pytest.raises(IngestError, match="无效的表名"):
+                await loader.load("bad name", byte_chunks(b"a\n1\n", 64))
+            # 建表失败转为 IngestError
+            async def broken_create(table_name, columns):
+                raise sqlite3.OperationalError("disk I/O error")
+
+            with monkeypatch.context() as patch:
+                patch.setattr(db, "create_table", broken_create)
+                with pytest.raises(IngestError, match="无法创建表 t2"):
+                    await loader.load("t2", byte_chunks(b"a\n1\n", 64))
+            # 表名为 SQL 关键字
+            report = await loader.load("order", byte_chunks(b"id,total\n1,9.5\n", 64))
+            assert report.created and report.rows == 1
+            assert (await db.execute_query('SELECT total FROM "order"'))[0]["total"] == 9.5
+            assert "表: order" in await db.get_schema()
+            # 内部表、会话表与系统表
+            db.hide_table("query_memory")
+            for name in ("query_memory", "Messages", "sessions", "sqlite_stat1"):
+                with pytest.raises(IngestError, match="内部表"):
+                    await loader.load(name, byte_chunks(b"role,content\nuser,x\n", 64))
+                assert not await db.table_exists(name)
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_upload_endpoint(db, monkeypatch):
+    """上传接口按 Content-Type 识别格式并返回导入统计"""
+    async def run():
+        await db.open()
+        monkeypatch.setattr(datasets, "dataset_loader", DatasetLoader(db))
+        app = FastAPI()
+        app.include_router(datasets.router)
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                response = await client.post(
+                    "/api/datasets/fruits?indexes=code",
+                    content=byte_chunks(CSV_TEXT.encode("utf-8"), 16),
+                    headers={"Content-Type": "text/csv"},
+                )
+                assert response.status_code == 200
+                body = response.json()
+                assert body["rows"] == 4 and body["format"] == "csv"
+                assert body["indexes"] == ["idx_fruits_code"]
+                assert "rows_per_second" in body
+
+                response = await client.post(
+                    "/api/datasets/fruits", content=b'{"code": "200"}\n[1]\n',
+                    headers={"Content-Type": "application/x-ndjson"},
+                )
+                assert response.status_code == 400
+        finally:
+            await db.close()
+
+    asyncio.run(run())
@@ -0,0 +1,108 @@
+"""
+列画像测试
+测试内容：
+1. 全表统计：取值枚举、数值范围、日期粒度、空值比例
+2. 大表分块采样：不同值估计、索引列精确范围
+3. 按表版本缓存：采样画像在 rowid 范围变化超过阈值时才重新计算，全表统计的画像在任何写入后重新计算；会话表不做画像
+"""
+
+import asyncio
+from collections import Counter
+
+from app.config import settings
+from app.db.profiler import estimate_distinct, profile_column
+
+
+def test_profile_column_statistics():
+    """取值枚举、数值范围、日期与空值"""
+    region = profile_column("region", "TEXT", ["华东", "华北", "华东", None], total=4)
+    assert region.distinct == 2 and region.top[0] == ("华东", 2)
+    assert region.null_ratio == 0.25
+    assert region.describe() == "2 个取值: 华东, 华北，空值 25%"
+
+    amount = profile_column("amount", "REAL", [3.5, 10, 7.25], total=3)
+    assert (amount.min, amount.max) == (3.5, 10)
+    assert amount.describe() == "范围 3.5 ~ 10，3 个不同值"
+
+    day = profile_column("d", "TEXT", ["2024-02-01", "2024-01-15"], total=2)
+    assert day.date_granularity == "day"
+    assert day.describe() == "日期 YYYY-MM-DD，2024-01-15 ~ 2024-02-01"
+    month = profile_column("m", "TEXT", ["2024-01", "2024-03"], total=2)
+    assert month.date_granularity == "month"
+
+    assert profile_column("id", "INTEGER", [1, 2], total=2, pk=True).describe() == "主键"
+
+
+def test_estimate_distinct():
+    """样本全为重复值时不放大，全为唯一值时按比例放大"""
+    assert estimate_distinct(Counter({"a": 50, "b": 50}), 100, 10000) == 2
+    assert estimate_distinct(Counter(range(100)), 100, 10000) == 1000
+    assert estimate_distinct(Counter(range(100)), 100, 100) == 100
+
+
+def test_sampled_profile_and_cache(db, monkeypatch):
+    """大表分块采样、索引列精确范围、按版本缓存"""
+    monkeypatch.setattr(settings, "profile_sample_rows", 320)
+
+    async def run():
+        await db.open()
+        try:
+            await db.create_table("events", {
+                "id": "INTEGER PRIMARY KEY", "kind": "TEXT", "score": "INTEGER", "day": "TEXT",
+            })
+            await db.insert_data("events", [
+                {"id": i, "kind": ("click", "view", "buy")[i % 3], "score": i,
+                 "day": f"2024-{i % 12 + 1:02d}-01"}
+                for i in range(1, 5001)
+            ])
+            await db.execute_update("CREATE INDEX idx_events_score ON events (score)")
+
+            schema = await db.get_schema()
+            profile = db.profiles.cached("events")
+            assert not profile.exact and profile.rows == 5000
+            assert profile.sampled_rows <= 320
+            score = profile.columns["score"]
+            assert (score.min, score.max) == (1, 5000) and score.range_exact
+            assert not score.distinct_exact and score.distinct > 1000
+            assert profile.columns["kind"].distinct == 3
+            assert "表: events（约 5000 行）" in schema
+            assert "kind (TEXT): 3 个取值" in schema
+            assert "score (INTEGER): 范围 1 ~ 5000" in schema
+
+            computed = db.profiles.computed
+            await db.get_schema()
+            assert db.profiles.computed == computed
+
+            # 零星写入：rowid 范围变化未超过阈值，沿用已有画像
+            await db.insert_data("events", [
+                {"id": i, "kind": "click", "score": i, "day": "2024-01-01"} for i in range(5001, 5011)
+            ])
+            await db.get_schema()
+            assert db.profiles.computed == computed and db.profiles.reused == 1
+
+            await db.insert_data("events", [{"id": 9000, "kind": "share", "score": 9000, "day": "2025-01-01"}])
+            schema = await db.get_schema()
+            assert db.profiles.computed == computed + 1
+            assert "4 个取值" in schema and "范围 1 ~ 9000" in schema
+
+            # 小表（全表统计）：UPDATE / DELETE 不改变 rowid 范围，仍重新计算
+            await db.create_table("tags", {"id": "INTEGER PRIMARY KEY", "name": "TEXT"})
+            await db.insert_data("tags", [{"id": i, "name": ("红", "绿")[i % 2]} for i in range(1, 11)])
+            schema = await db.get_schema()
+            assert db.profiles.cached("tags").exact and "表: tags（10 行）" in schema
+            assert "name (TEXT): 2 个取值" in schema
+            await db.execute_update("UPDATE tags SET name = '蓝' WHERE id = 2")
+            await db.execute_update("DELETE FROM tags WHERE id = 3")
+            schema = await db.get_schema()
+            assert "表: tags（9 行）" in schema
+            assert "name (TEXT): 3 个取值" in schema and "蓝" in schema
+
+            # 会话表不做画像
+            await db.create_table("messages", {"id": "TEXT PRIMARY KEY", "content": "TEXT"})
+            await db.insert_data("messages", [{"id": "m1", "content": "私密内容"}])
+            await db.get_schema()
+            assert db.profiles.cached("messages") is None
+        finally:
+            await db.close()
+
+    asyncio.run(run())
@@ -0,0 +1,120 @@
+"""
+查询计划检查与索引建议测试
+测试内容：
+1. 全表扫描 / 临时 B 树识别与 warn、reject、rewrite 模式；聚合查询不改写，改写前去掉末尾注释与分号
+2. 嵌套扫描识别
+3. 索引建议达到阈值后自动创建覆盖索引
+"""
+
+import asyncio
+
+from app.config import settings
+from app.db.query_plan import IndexAdvisor, QueryPlanGate
+
+
+def test_gate_modes(db, monkeypatch):
+    """超过行数阈值的全表扫描按模式放行、拒绝或改写"""
+    monkeypatch.setattr(settings, "query_gate_scan_rows", 5)
+    sql = "SELECT region, SUM(amount) AS total FROM sales GROUP BY region ORDER BY total DESC"
+
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            gate = QueryPlanGate(db)
+
+            issues = await gate.analyze(sql)
+            kinds = {issue.kind for issue in issues}
+            assert "full_scan" in kinds
+            assert "temp_btree" in kinds
+            assert issues[0].table == "sales"
+
+            monkeypatch.setattr(settings, "query_gate_mode", "warn")
+            verdict = await gate.check(sql)
+            assert verdict.action == "warn" and verdict.sql == sql
+
+            monkeypatch.setattr(settings, "query_gate_mode", "reject")
+            assert (await gate.check(sql)).action == "reject"
+
+            monkeypatch.setattr(settings, "query_gate_mode", "rewrite")
+            # 聚合 / 分组查询：LIMIT 不减少扫描，按警告放行
+            assert (await gate.check(sql)).action == "warn"
+            assert (await gate.check("SELECT COUNT(*) FROM sales WHERE amount > 0")).action == "warn"
+
+            detail = "SELECT * FROM sales ORDER BY amount DESC"
+            limit = f"LIMIT {settings.query_max_rows + 1}"
+            verdict = await gate.check(detail)
+            assert verdict.action == "rewrite" and verdict.sql == f"{detail} {limit}"
+            # 末尾的注释与分号在追加 LIMIT 前去掉
+            for tail in (" -- 按金额排序", ";\n-- 按金额排序\n", " /* 注释 */ ;"):
+                verdict = await gate.check(detail + tail)
+                assert verdict.action == "rewrite" and verdict.sql == f"{detail} {limit}"
+                assert len(await db.execute_query(verdict.sql)) == 8
+            # 已有 LIMIT 的查询无法改写，按警告放行
+            limited = detail + " LIMIT 3"
+            assert (await gate.check(limited)).action == "warn"
+
+            # 低于阈值不报告
+            monkeypatch.setattr(settings, "query_gate_scan_rows", 1000)
+            assert (await gate.check(sql)).action == "allow"
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_gate_nested_scan(db, monkeypatch):
+    """无索引的自连接识别为嵌套扫描，rewrite 模式下直接拒绝"""
+    monkeypatch.setattr(settings, "query_gate_nested_rows", 50)
+    monkeypatch.setattr(settings, "query_gate_mode", "rewrite")
+    sql = "SELECT a.id, b.id FROM sales a, sales b WHERE a.amount > b.amount + 1"
+
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            gate = QueryPlanGate(db)
+            issues = await gate.analyze(sql)
+            assert [issue.kind for issue in issues] == ["nested_scan"]
+            assert issues[0].rows == 64
+            assert (await gate.check(sql)).action == "reject"
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_index_advisor_creates_covering_index(db, monkeypatch):
+    """同一查询形态达到次数阈值后创建覆盖索引，之后计划改为索引扫描"""
+    monkeypatch.setattr(settings, "index_advisor_min_hits", 2)
+    monkeypatch.setattr(settings, "index_advisor_min_rows", 1)
+    monkeypatch.setattr(settings, "index_advisor_auto_create", True)
+    sql = (
+        "SELECT category, SUM(amount) AS total FROM sales "
+        "WHERE region = '华东' AND sale_date >= '2024-01-01' GROUP BY category"
+    )
+
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            advisor = IndexAdvisor(db)
+            assert await advisor.candidate(sql) == (
+                "sales", ("region", "sale_date", "category", "amount")
+            )
+            assert await advisor.observe(sql) is None
+            statement = await advisor.observe(sql)
+            assert statement.startswith('CREATE INDEX IF NOT EXISTS "idx_advisor_sales_region')
+            await advisor.drain()
+            assert not advisor._tasks
+            assert advisor.created == ["idx_advisor_sales_region_sale_date_category_amount"]
+
+            plan = " ".join(step["detail"] for step in await advisor.gate.explain(sql))
+            assert "COVERING INDEX idx_advisor_sales" in plan
+            # 已有索引覆盖时不再建议
+            assert await advisor.observe(sql) is None
+            assert advisor.proposals()[0]["created"] is True
+        finally:
+            await db.close()
+
+    asyncio.run(run())
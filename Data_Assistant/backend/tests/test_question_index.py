@@ -0,0 +1,185 @@
+"""
+相似问题检索测试
+测试内容：
+1. 字符 n-gram TF-IDF 检索排序
+2. 字面量代入（地区、年份、TOP N）与不合理代入的拒绝
+3. 从 messages 表增量加载历史问答对
+4. 原样复用只允许措辞差异：反义词、实体替换以及只差负号、百分号、小数点的问题退回少样本示例
+5. Agent：近似问题复用 SQL 跳过 LLM，中等相似度注入少样本示例
+"""
+
+import asyncio
+
+from app.config import settings
+from app.core.agent import DataAnalysisAgent
+from app.db.session_store import SessionStore
+from app.memory.question_index import QuestionIndex, substitute_literals, literal_columns
+from conftest import FakeLLM
+
+
+class ExampleLLM(FakeLLM):
+    """记录调用次数与少样本示例的假 LLM"""
+
+    def __init__(self, sql: str):
+        super().__init__(sql, reason="测试")
+        self.examples = []
+
+    async def generate_sql_with_tool(self, question, schema, examples=None):
+        self.examples.append(examples or [])
+        return await super().generate_sql_with_tool(question, schema, examples)
+
+
+def test_search_ranks_similar_questions():
+    """相似问题排在前面，无关问题不召回"""
+    index = QuestionIndex()
+    index.add("华东地区的销售额", "SELECT SUM(amount) FROM sales WHERE region = '华东'")
+    index.add("销量前5的产品", "SELECT product_name FROM sales GROUP BY product_name LIMIT 5")
+    index.add("各月份的订单数量趋势", "SELECT strftime('%Y-%m', sale_date), COUNT(*) FROM sales GROUP BY 1")
+
+    matches = index.search("华东销售总额是多少", 3)
+    assert matches[0].question == "华东地区的销售额"
+    assert index.search("每个月的订单数量趋势", 1)[0].question == "各月份的订单数量趋势"
+    assert index.search("xyz", 3) == []
+
+    # 同一问题只保留最新的 SQL
+    index.add("华东地区的销售额？", "SELECT 1")
+    assert len(index) == 3
+
+
+def test_substitute_literals():
+    """仅取值不同的问题代入新取值"""
+    sql, values = substitute_literals(
+        "华东地区的销售额", "华南地区的销售额", "SELECT SUM(amount) FROM sales WHERE region = '华东'"
+    )
+    assert sql == "SELECT SUM(amount) FROM sales WHERE region = '华南'" and values == {"华东": "华南"}
+
+    sql, _ = substitute_literals("销量前5的产品", "销量前10的产品", "SELECT p FROM t ORDER BY q DESC LIMIT 5")
+    assert sql.endswith("LIMIT 10")
+
+    # 年份整体替换，不误替换 LIMIT 1
+    sql, values = substitute_literals(
+        "2023年销售额最高的产品", "2024年销售额最高的产品",
+        "SELECT p FROM t WHERE strftime('%Y', d) = '2023' ORDER BY a DESC LIMIT 1",
+    )
+    assert values == {"2023": "2024"} and sql.endswith("= '2024' ORDER BY a DESC LIMIT 1")
+
+    # 差异不在字面量内
+    assert substitute_literals("华东地区的销售额", "华东地区的利润", "SELECT SUM(amount) FROM sales WHERE region = '华东'") is None
+    assert literal_columns("SELECT * FROM sales s WHERE s.region IN ('华东', '华南')") == {
+        "华东": ("sales", "region"), "华南": ("sales", "region"),
+    }
+
+
+def test_match_loads_messages_and_validates(db):
+    """从 messages 表加载问答对；代入取值须在数据中存在"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            store = SessionStore(db)
+            await store.initialize()
+            session = await store.create_session()
+            await store.add_message(session.id, "user", "华东地区的销售额")
+            await store.add_message(
+                session.id, "assistant", "华东销售额为 ...",
+                sql="SELECT SUM(amount) AS total FROM sales WHERE region = '华东'", data=[{"total": 1}],
+            )
+            # 执行失败的回答（无数据）不进入索引
+            await store.add_message(session.id, "user", "华东地区的利润")
+            await store.add_message(session.id, "assistant", "SQL 执行失败", sql="SELECT profit FROM sales")
+
+            index = QuestionIndex(db)
+            result = await index.match("华南地区的销售额")
+            assert len(index) == 1
+            assert result.sql == "SELECT SUM(amount) AS total FROM sales WHERE region = '华南'"
+            assert result.source.question == "华东地区的销售额"
+
+            # '各' 不是 region 的取值：退回少样本示例
+            result = await index.match("各地区的销售额")
+            assert result.sql is None and result.examples[0].question == "华东地区的销售额"
+
+            # 新消息增量加载
+            await store.add_message(session.id, "user", "销量前3的产品")
+            await store.add_message(
+                session.id, "assistant", "...",
+                sql="SELECT product_name, SUM(quantity) AS q FROM sales GROUP BY product_name ORDER BY q DESC LIMIT 3",
+                data=[{"product_name": "iPad Air", "q": 150}],
+            )
+            result = await index.match("销量前2的产品")
+            assert len(index) == 2 and result.sql.endswith("LIMIT 2")
+            assert (await index.match("完全无关的内容")).examples == []
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_reuse_requires_same_meaning(db, monkeypatch):
+    """字符相似但含义不同的问题不原样复用（即使相似度达到复用阈值）"""
+    monkeypatch.setattr(settings, "question_match_reuse", 0.5)
+
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            index = QuestionIndex(db)
+            sql = "SELECT product_name, SUM(amount) AS total FROM sales GROUP BY product_name ORDER BY total DESC LIMIT 1"
+            index.add("销售额最高的产品", sql)
+
+            # 只相差请求用词与标点：原样复用
+            result = await index.match("请问销售额最高的产品？")
+            assert result.sql == sql
+
+            # 反义词与实体替换：作为示例交给 LLM
+            for question in ("销售额最低的产品", "销售额最高的客户"):
+                result = await index.match(question)
+                assert result.sql is None, question
+                assert result.examples[0].question == "销售额最高的产品"
+            assert index.reused == 1
+
+            # 只差负号、百分号或小数点：条件不同，不原样复用
+            pairs = [
+                ("金额小于-100的订单数", "SELECT COUNT(*) FROM sales WHERE amount < -100", "金额小于100的订单数"),
+                ("金额增长超过10%的地区", "SELECT region FROM sales GROUP BY region HAVING SUM(amount) > 0", "金额增长超过10的地区"),
+                ("数量大于1.5倍平均值的订单", "SELECT * FROM sales WHERE quantity > (SELECT AVG(quantity) FROM sales)",
+                 "数量大于15倍平均值的订单"),
+            ]
+            for old, old_sql, new in pairs:
+                index.add(old, old_sql)
+                assert (await index.match(old)).sql == old_sql
+                assert (await index.match(new)).sql is None, new
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_agent_reuses_and_injects_examples(db):
+    """Agent 复用近似问题的 SQL，中等相似度时注入示例"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            llm = ExampleLLM("SELECT SUM(amount) AS total FROM sales WHERE region = '华东'")
+            agent = DataAnalysisAgent(llm=llm, db=db)
+
+            await agent.process_query("华东地区的销售额")
+            assert llm.sql_calls == 1 and llm.examples[0] == []
+
+            result = await agent.process_query("华北地区的销售额")
+            assert llm.sql_calls == 1
+            assert result.sql == "SELECT SUM(amount) AS total FROM sales WHERE region = '华北'"
+            assert result.data == await db.execute_query(result.sql)
+
+            events = [e async for e in agent.stream_process_query("西南地区的销售额")]
+            assert llm.sql_calls == 1
+            assert any(e["type"] == "reason" and "复用相似问题" in e["content"] for e in events)
+
+            # 措辞不同：调用 LLM，并带上相似问题作为示例
+            await agent.process_query("华东销售总额是多少")
+            assert llm.sql_calls == 2
+            assert llm.examples[-1] and llm.examples[-1][0].question == "华东地区的销售额"
+        finally:
+            await db.close()
+
+    asyncio.run(run())
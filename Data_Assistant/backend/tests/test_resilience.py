@@ -0,0 +1,248 @@
+"""
+LLM 调用弹性测试（本地注入故障的假服务器）
+测试内容：
+1. 429 / 5xx 与断开连接按退避重试，Retry-After 生效，重试用尽后抛出状态错误
+2. 等待超过端点 p95 时发出对冲请求，先成功返回者胜出（快速返回 5xx 的对冲请求不胜出）；对冲开启后快速返回的请求不发对冲
+3. 连续失败后熔断并直接失败，冷却后探测成功恢复；探测请求被取消时不会卡在半开状态
+4. 流式调用在收到响应头之前重试
+"""
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.core.http_client import SharedHTTPClient
+from app.core.llm import Qwen3LLM
+from app.core.resilience import CircuitOpenError, ResilientCaller
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+class FaultServer:
+    """
+    按脚本注入故障的 chat/completions 服务器
+
+    faults 中的每一项依次作用于一个请求：状态码、"drop"（不响应直接断开）或 (状态码, 延迟秒数)；
+    脚本用完后正常返回
+    """
+
+    def __init__(self, faults=()):
+        self.faults = list(faults)
+        self.requests = 0
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = {
+                    k.lower(): v
+                    for k, v in (line.split(": ", 1) for line in head.decode().split("\r\n")[1:] if ": " in line)
+                }
+                length = int(headers.get("content-length", 0))
+                payload = json.loads(await reader.readexactly(length)) if length else {}
+                self.requests += 1
+                fault = self.faults.pop(0) if self.faults else 200
+                if fault == "drop":
+                    break
+                status, delay = fault if isinstance(fault, tuple) else (fault, 0)
+                await asyncio.sleep(delay)
+                extra = "Retry-After: 0\r\n" if status == 429 else ""
+                if status != 200:
+                    body, content_type = json.dumps({"error": status}), "application/json"
+                elif payload.get("stream"):
+                    events = [{"choices": [{"delta": {"content": part}}]} for part in ("你", "好")]
+                    body = "".join(f"data: {json.dumps(e)}\n\n" for e in events) + "data: [DONE]\n\n"
+                    content_type = "text/event-stream"
+                else:
+                    body, content_type = json.dumps({"choices": [{"message": {"content": "ok"}}]}), "application/json"
+                data = body.encode()
+                writer.write(
+                    f"HTTP/1.1 {status} X\r\nContent-Type: {content_type}\r\n{extra}"
+                    f"Content-Length: {len(data)}\r\nConnection: keep-alive\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    """缩短退避与冷却时间"""
+    monkeypatch.setattr(settings, "llm_retry_base_delay", 0.01)
+    monkeypatch.setattr(settings, "llm_retry_max_delay", 0.05)
+    monkeypatch.setattr(settings, "llm_breaker_reset_seconds", 0.2)
+
+
+def run_with_server(faults, scenario):
+    async def run():
+        server = FaultServer(faults)
+        base_url = await server.start()
+        http = SharedHTTPClient()
+        resilience = ResilientCaller()
+        llm = Qwen3LLM(api_key="test", http=http, base_url=base_url, resilience=resilience)
+        try:
+            await scenario(server, llm, resilience)
+        finally:
+            await http.close()
+            await server.stop()
+
+    asyncio.run(run())
+
+
+def test_retry_with_backoff(fast_retries):
+    """可重试的故障被透明地重试"""
+    async def scenario(server, llm, resilience):
+        result = await llm.chat(MESSAGES)
+        assert result["choices"][0]["message"]["content"] == "ok"
+        assert server.requests == 4 and resilience.retries == 3
+
+        # 重试用尽：返回最后的错误状态
+        server.faults = [503] * 4
+        with pytest.raises(httpx.HTTPStatusError):
+            await llm.chat(MESSAGES)
+        assert server.requests == 8
+
+        # 4xx（429 除外）不重试
+        server.faults = [400]
+        with pytest.raises(httpx.HTTPStatusError):
+            await llm.chat(MESSAGES)
+        assert server.requests == 9
+
+    run_with_server([503, 429, "drop"], scenario)
+
+
+def test_hedged_request(monkeypatch):
+    """慢于 p95 的请求被对冲，先返回的响应胜出"""
+    monkeypatch.setattr(settings, "llm_hedge_min_samples", 5)
+
+    async def scenario(server, llm, resilience):
+        for _ in range(5):
+            await llm.chat(MESSAGES)
+        assert resilience.hedge_delay(f"{llm.base_url}/chat/completions") is not None
+
+        server.faults = [(200, 2.0)]
+        started = time.perf_counter()
+        result = await llm.chat(MESSAGES)
+        assert time.perf_counter() - started < 1.0
+        assert result["choices"][0]["message"]["content"] == "ok"
+        assert resilience.hedged == 1 and resilience.hedge_wins == 1
+        assert server.requests == 7
+
+        endpoint = resilience.stats()["endpoints"][f"{llm.base_url}/chat/completions"]
+        assert endpoint["requests"] == 6 and endpoint["breaker"] == "closed"
+
+    run_with_server([], scenario)
+
+
+def test_failed_hedge_does_not_win(monkeypatch):
+    """对冲请求快速返回 503 时继续等待较慢的正常响应，不触发重试"""
+    monkeypatch.setattr(settings, "llm_hedge_min_samples", 5)
+
+    async def scenario(server, llm, resilience):
+        for _ in range(5):
+            await llm.chat(MESSAGES)
+
+        server.faults = [(200, 0.3), 503]
+        result = await llm.chat(MESSAGES)
+        assert result["choices"][0]["message"]["content"] == "ok"
+        assert resilience.hedged == 1 and resilience.hedge_wins == 0
+        assert resilience.retries == 0 and server.requests == 7
+
+    run_with_server([], scenario)
+
+
+def test_fast_call_with_hedging_armed():
+    """对冲已开启时，在 p95 内返回的请求直接返回"""
+    async def scenario(server, llm, resilience):
+        endpoint = f"{llm.base_url}/chat/completions"
+        for _ in range(25):
+            resilience.latency(endpoint).record(1.0)
+        assert resilience.hedge_delay(endpoint) == 1.0
+
+        result = await llm.chat(MESSAGES)
+        assert result["choices"][0]["message"]["content"] == "ok"
+        assert resilience.hedged == 0 and server.requests == 1
+
+    run_with_server([], scenario)
+
+
+def test_circuit_breaker(fast_retries, monkeypatch):
+    """连续失败后熔断，冷却后放行探测请求"""
+    monkeypatch.setattr(settings, "llm_retry_max", 0)
+    monkeypatch.setattr(settings, "llm_breaker_failures", 2)
+
+    async def scenario(server, llm, resilience):
+        for _ in range(2):
+            with pytest.raises(httpx.HTTPStatusError):
+                await llm.chat(MESSAGES)
+        # 熔断期间不发出请求
+        with pytest.raises(CircuitOpenError):
+            await llm.chat(MESSAGES)
+        with pytest.raises(CircuitOpenError):
+            [c async for c in llm.stream_chat(MESSAGES)]
+        assert server.requests == 2 and resilience.rejected == 2
+
+        # 冷却后探测失败，重新熔断
+        await asyncio.sleep(0.25)
+        server.faults = [502]
+        with pytest.raises(httpx.HTTPStatusError):
+            await llm.chat(MESSAGES)
+        with pytest.raises(CircuitOpenError):
+            await llm.chat(MESSAGES)
+
+        # 冷却后探测成功，恢复正常
+        await asyncio.sleep(0.25)
+        assert (await llm.chat(MESSAGES))["choices"][0]["message"]["content"] == "ok"
+        assert (await llm.chat(MESSAGES))["choices"][0]["message"]["content"] == "ok"
+        assert server.requests == 5
+        assert resilience.stats()["endpoints"][f"{llm.base_url}/chat/completions"]["breaker_opened"] == 2
+
+    run_with_server([500, 500], scenario)
+
+
+def test_cancelled_probe_releases_breaker(fast_retries, monkeypatch):
+    """探测请求被取消后，下一个请求重新探测而不是一直被拒绝"""
+    monkeypatch.setattr(settings, "llm_retry_max", 0)
+    monkeypatch.setattr(settings, "llm_breaker_failures", 1)
+
+    async def scenario(server, llm, resilience):
+        with pytest.raises(httpx.HTTPStatusError):
+            await llm.chat(MESSAGES)
+        await asyncio.sleep(0.25)
+
+        # 探测请求在返回前被取消
+        server.faults = [(200, 1.0)]
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(llm.chat(MESSAGES), timeout=0.1)
+        assert resilience.breaker(f"{llm.base_url}/chat/completions").state == "half_open"
+
+        assert (await llm.chat(MESSAGES))["choices"][0]["message"]["content"] == "ok"
+        assert resilience.stats()["endpoints"][f"{llm.base_url}/chat/completions"]["breaker"] == "closed"
+
+    run_with_server([500], scenario)
+
+
+def test_stream_retries_before_first_byte(fast_retries):
+    """流式调用在收到响应头之前的故障被重试"""
+    async def scenario(server, llm, resilience):
+        chunks = [c async for c in llm.stream_chat(MESSAGES)]
+        assert [c["choices"][0]["delta"]["content"] for c in chunks] == ["你", "好"]
+        assert server.requests == 3 and resilience.retries == 2
+
+    run_with_server([503, "drop"], scenario)
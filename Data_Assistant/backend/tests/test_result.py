@@ -0,0 +1,35 @@
+"""
+列式结果测试
+测试内容：
+1. 类型推断与数组存储
+2. 与旧行字典格式互转
+"""
+
+from array import array
+
+from app.db.result import Columnar, decode_data, encode_data
+
+
+def test_types_and_array_backing():
+    """无空值数值列使用 array，出现空值或混合类型时退化为列表"""
+    data = Columnar(["id", "amount", "region", "note"])
+    data.append((1, 1.5, "华东", None))
+    data.append((2, 2, "华北", "x"))
+    assert data.types == ["integer", "real", "text", "text"]
+    assert isinstance(data.column("id"), array)
+    assert data.column("amount") == [1.5, 2]
+    data.append((None, 3.0, "华南", None))
+    assert isinstance(data.column("id"), list)
+    assert len(data) == 3
+    assert data.slice(1, 2).to_rows() == [{"id": 2, "amount": 2, "region": "华北", "note": "x"}]
+
+
+def test_row_dict_compat():
+    """旧的行字典格式可无损转换"""
+    rows = [{"region": "华东", "total": 24897.0}, {"region": "西南", "total": 2999.0}]
+    encoded = encode_data(rows)
+    assert encoded["columns"] == ["region", "total"]
+    assert encoded["values"] == [["华东", "西南"], [24897.0, 2999.0]]
+    assert decode_data(encoded) == rows
+    assert decode_data(rows) == rows
+    assert decode_data(None) is None
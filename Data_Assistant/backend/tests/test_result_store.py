@@ -0,0 +1,116 @@
+"""
+ResultStore 测试
+测试内容：
+1. 溢出文件分页读取
+2. 句柄过期与淘汰
+3. 客户端在首页后断开时停止查询并删除溢出文件
+4. 助手消息保存完整的（有界）结果而不只是第一页
+"""
+
+import asyncio
+import os
+
+from app.api import chat
+from app.config import settings
+from app.core.agent import DataAnalysisAgent
+from app.db.result import Columnar
+from app.db.result_store import ResultStore
+from conftest import FakeLLM
+
+
+def rows_of(page):
+    return Columnar.from_dict(page["data"]).to_rows()
+
+
+def test_pages_across_index_stride(tmp_path):
+    """跨越索引间隔的分页读取与原始顺序一致"""
+    async def run():
+        store = ResultStore(directory=str(tmp_path))
+        handle = await store.create(["x"])
+        for start in range(0, 1050, 300):
+            await store.append(handle, Columnar.from_rows([{"x": i} for i in range(start, min(start + 300, 1050))]))
+        store.finish(handle)
+
+        page = await store.page(handle.id, offset=0, limit=10)
+        assert [r["x"] for r in rows_of(page)] == list(range(10))
+        assert page["total"] == 1050 and page["has_more"]
+
+        page = await store.page(handle.id, offset=345, limit=100)
+        assert [r["x"] for r in rows_of(page)] == list(range(345, 445))
+
+        page = await store.page(handle.id, offset=1000, limit=100)
+        assert len(rows_of(page)) == 50 and not page["has_more"]
+        assert page["data"]["types"] == ["integer"]
+
+    asyncio.run(run())
+
+
+def test_expired_and_evicted_handles(tmp_path):
+    """过期或超出数量上限的句柄被删除"""
+    async def run():
+        store = ResultStore(directory=str(tmp_path), max_handles=2)
+        first = await store.create(["x"])
+        await store.create(["x"])
+        await store.create(["x"])
+        assert await store.page(first.id) is None
+        assert store.stats()["handles"] == 2
+
+        store.ttl = -1
+        handle = await store.create(["x"])
+        assert await store.page(handle.id) is None
+
+    asyncio.run(run())
+
+
+def test_disconnect_discards_spill_file(db, tmp_path, monkeypatch):
+    """收到首页后断开：溢出文件被删除"""
+    monkeypatch.setattr(settings, "result_page_size", 2)
+
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            store = ResultStore(directory=str(tmp_path / "results"))
+            agent = DataAnalysisAgent(llm=FakeLLM("SELECT * FROM sales"), db=db, results=store)
+
+            stream = agent.stream_process_query("所有销售记录")
+            async for event in stream:
+                if event["type"] == "data":
+                    assert event["has_more"] and store.stats()["handles"] == 1
+                    break
+            await stream.aclose()
+            assert store.stats()["handles"] == 0
+            assert os.listdir(tmp_path / "results") == []
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_persisted_message_keeps_full_result(db, tmp_path, monkeypatch):
+    """历史消息保存全部行；溢出文件已过期时退回第一页"""
+    monkeypatch.setattr(settings, "result_page_size", 2)
+
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            total = (await db.execute_query("SELECT COUNT(*) AS n FROM sales"))[0]["n"]
+            store = ResultStore(directory=str(tmp_path / "results"))
+            monkeypatch.setattr(chat, "result_store", store)
+            agent = DataAnalysisAgent(llm=FakeLLM("SELECT * FROM sales"), db=db, results=store)
+
+            events = [e async for e in agent.stream_process_query("所有销售记录")]
+            first = next(e for e in events if e["type"] == "data")["content"]
+            complete = next(e for e in events if e["type"] == "data_complete")
+            assert len(Columnar.from_dict(first)) == 2 and complete["total"] == total
+
+            data = await chat._persisted_data(first, complete)
+            assert len(Columnar.from_dict(data)) == total
+
+            await store.discard(complete["result_id"])
+            assert await chat._persisted_data(first, complete) == first
+        finally:
+            await db.close()
+
+    asyncio.run(run())
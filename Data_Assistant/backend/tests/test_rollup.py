@@ -0,0 +1,113 @@
+"""
+预聚合表测试
+测试内容：
+1. 改写后的查询与原查询结果一致（含列名），并选择最小的汇总表
+2. 无法由汇总表回答的查询不改写
+3. insert_data 增量维护（NULL 维度合并为一行），其他写入使汇总表过期并在后台重建
+4. 汇总表不出现在提供给模型的 Schema 中
+"""
+
+import asyncio
+
+from app.db.sqlite_manager import SQLiteManager
+
+ANSWERABLE = [
+    "SELECT region, SUM(amount) AS total FROM sales GROUP BY region ORDER BY total DESC",
+    "SELECT strftime('%Y-%m', sale_date) AS month, SUM(amount) FROM sales GROUP BY month ORDER BY month",
+    "SELECT s.category, AVG(s.quantity), COUNT(*) FROM sales s WHERE s.sale_date >= '2024-02-01' GROUP BY s.category",
+    "SELECT product_name, SUM(quantity) AS qty FROM sales GROUP BY product_name ORDER BY qty DESC LIMIT 3",
+    "SELECT COUNT(*), MAX(amount), MIN(sale_date) FROM sales WHERE region IN ('华东', '华北')",
+    "SELECT region, category, ROUND(AVG(amount), 2) AS avg_amount FROM sales GROUP BY region, category HAVING COUNT(*) >= 1",
+]
+
+UNANSWERABLE = [
+    "SELECT region FROM sales",
+    "SELECT * FROM sales",
+    "SELECT region, COUNT(DISTINCT product_name) FROM sales GROUP BY region",
+    "SELECT region, SUM(amount) FROM sales WHERE amount > 5000 GROUP BY region",
+    "SELECT region, SUM(amount * quantity) FROM sales GROUP BY region",
+]
+
+
+async def assert_equivalent(db: SQLiteManager, sql: str) -> str:
+    rewritten = await db.rollups.rewrite(sql)
+    assert rewritten is not None, sql
+    expected = await db.execute_query(sql)
+    actual = await db.execute_query(rewritten[0])
+    assert actual == expected, (sql, rewritten[0])
+    return rewritten[1]
+
+
+def test_rewrite_matches_source(db):
+    """可回答的聚合查询改写后结果一致，不可回答的保持原样"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            assert len(await db.rollups.refresh()) == 3
+            for sql in ANSWERABLE:
+                await assert_equivalent(db, sql)
+            for sql in UNANSWERABLE:
+                assert await db.rollups.rewrite(sql) is None, sql
+            # 按月查询只有月度汇总表能回答；按产品查询只有含产品维度的汇总表能回答
+            assert await assert_equivalent(db, ANSWERABLE[1]) == "sales_monthly_region_category"
+            assert await assert_equivalent(db, ANSWERABLE[3]) == "sales_daily_region_category_product"
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_incremental_maintenance_and_rebuild(db):
+    """insert_data 增量更新汇总表；其他写入使其过期，后台重建后恢复改写"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            await db.rollups.refresh()
+            await db.insert_data("sales", [
+                {"product_name": "iPhone 15", "category": "手机", "amount": 7999.0, "quantity": 5, "sale_date": "2024-01-15", "region": "华东"},
+                {"product_name": "Kindle", "category": None, "amount": 999.0, "quantity": 9, "sale_date": "2024-03-01", "region": "华中"},
+            ])
+            for sql in ANSWERABLE:
+                await assert_equivalent(db, sql)
+
+            # 维度为 NULL 的分组多次写入后仍是一行，且与空字符串分开
+            for category in (None, None, ""):
+                await db.insert_data("sales", [
+                    {"product_name": "Kindle", "category": category, "amount": 1.0, "quantity": 1,
+                     "sale_date": "2024-03-01", "region": "华中"},
+                ])
+            rows = await db.execute_query(
+                "SELECT category, row_count FROM sales_daily_region_category "
+                "WHERE sale_date = '2024-03-01' AND region = '华中' ORDER BY category"
+            )
+            assert rows == [{"category": None, "row_count": 3}, {"category": "", "row_count": 1}]
+            for sql in ANSWERABLE:
+                await assert_equivalent(db, sql)
+
+            await db.execute_update("DELETE FROM sales WHERE region = '华中'")
+            assert await db.rollups.rewrite(ANSWERABLE[0]) is None
+            await db.rollups._refreshing
+            for sql in ANSWERABLE:
+                await assert_equivalent(db, sql)
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_rollups_hidden_from_schema(db):
+    """汇总表不出现在 Schema 中"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            await db.rollups.refresh()
+            schema = await db.get_schema()
+            assert "sales" in schema
+            assert "sales_daily_region_category" not in schema
+        finally:
+            await db.close()
+
+    asyncio.run(run())
@@ -0,0 +1,110 @@
+"""
+Schema 链接测试
+测试内容：
+1. 按表名、列名、列注释与示例取值选出相关表，并补充外键引用的表
+2. 只渲染选中的表
+3. 表数较少、无任何命中时回退到完整 Schema
+4. DDL 变化后重建索引
+"""
+
+import asyncio
+
+from app.core.schema_linker import SchemaLinker, tokenize
+from app.db.sqlite_manager import SQLiteManager
+
+FILLER_TABLES = [
+    "audit_log", "user_accounts", "inventory_items", "warehouse_bins", "payment_methods",
+    "support_tickets", "marketing_campaigns", "web_sessions", "email_templates", "feature_flags",
+    "currency_rates", "tax_rules",
+]
+
+DDL = [
+    """CREATE TABLE customers (
+        id INTEGER PRIMARY KEY,
+        name TEXT,   -- 客户名称
+        city TEXT    -- 所在城市
+    )""",
+    """CREATE TABLE orders (
+        id INTEGER PRIMARY KEY,
+        customer_id INTEGER REFERENCES customers(id),
+        region TEXT,   -- 销售地区
+        amount REAL,   -- 订单金额
+        order_date TEXT
+    )""",
+    """CREATE TABLE departments (
+        id INTEGER PRIMARY KEY,
+        name TEXT
+    )""",
+    """CREATE TABLE employees (
+        id INTEGER PRIMARY KEY,
+        department_id INTEGER REFERENCES departments(id),
+        full_name TEXT,
+        salary REAL
+    )""",
+]
+
+
+async def build_wide_db(db: SQLiteManager):
+    for name in FILLER_TABLES:
+        await db.execute_update(f"CREATE TABLE {name} (id INTEGER PRIMARY KEY, label TEXT, created_at TEXT)")
+        await db.execute_update(f"INSERT INTO {name} (label, created_at) VALUES ('item', '2024-01-01')")
+    for statement in DDL:
+        await db.execute_update(statement)
+    await db.insert_data("customers", [{"name": "张三", "city": "上海"}, {"name": "李四", "city": "北京"}])
+    await db.insert_data("orders", [
+        {"customer_id": 1, "region": "华东", "amount": 100.0, "order_date": "2024-01-02"},
+        {"customer_id": 2, "region": "华北", "amount": 80.0, "order_date": "2024-01-03"},
+    ])
+
+
+def test_tokenize():
+    """英文拆词加三元组，中文单字加双字"""
+    terms = tokenize("orderDate 华东地区")
+    assert "order" in terms and "date" in terms and "~ord" in terms
+    assert "华" in terms and "华东" in terms and "地区" in terms
+
+
+def test_link_selects_relevant_tables(db):
+    """按注释、取值与列名选表，补充外键表，只渲染选中的表"""
+    async def run():
+        await db.open()
+        try:
+            await build_wide_db(db)
+            linker = SchemaLinker(db)
+
+            selected = await linker.link("华东地区的订单金额是多少")
+            assert selected[0] == "orders"
+            assert "customers" in selected
+
+            selected = await linker.link("average salary per department")
+            assert set(selected[:2]) == {"employees", "departments"}
+
+            schema = await linker.schema_for("华东地区的订单金额是多少")
+            assert "表: orders" in schema and "表: customers" in schema
+            assert "表: audit_log" not in schema
+            assert len(schema) < len(await db.get_schema())
+
+            assert await linker.link("xyz") is None
+            assert linker.stats()["fallbacks"] == 1
+
+            await db.execute_update("CREATE TABLE shipments (id INTEGER PRIMARY KEY, tracking_number TEXT)")
+            assert (await linker.link("tracking number of shipments"))[0] == "shipments"
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_small_database_uses_full_schema(db):
+    """表数不超过阈值时不做链接"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            linker = SchemaLinker(db)
+            assert await linker.link("各地区销售额") is None
+            assert await linker.schema_for("各地区销售额") == await db.get_schema()
+        finally:
+            await db.close()
+
+    asyncio.run(run())
@@ -0,0 +1,136 @@
+"""
+请求合并测试
+测试内容：
+1. 同一 key 只计算一次，后到的订阅者重放已产生的事件
+2. 异常传给所有订阅者，结束后相同的请求重新计算
+3. 所有订阅者断开时取消计算
+4. Agent 对同时到达的相同问题只调用一次 LLM 与查询
+"""
+
+import asyncio
+
+from app.core.agent import DataAnalysisAgent
+from app.core.singleflight import Singleflight
+from conftest import FakeLLM
+
+
+def test_followers_replay_events():
+    """领导者的事件被所有订阅者完整收到"""
+    async def run():
+        flights = Singleflight()
+        calls = []
+
+        async def numbers():
+            calls.append(1)
+            for i in range(4):
+                await asyncio.sleep(0.01)
+                yield i
+
+        async def consume(delay):
+            await asyncio.sleep(delay)
+            return [e async for e in flights.stream("k", numbers)]
+
+        # 第二个订阅者在已产生两个事件后加入
+        results = await asyncio.gather(consume(0), consume(0.025), consume(0))
+        assert results == [[0, 1, 2, 3]] * 3
+        assert len(calls) == 1
+        assert flights.stats() == {"in_flight": 0, "leaders": 1, "followers": 2}
+
+        # 计算结束后重新计算
+        assert [e async for e in flights.stream("k", numbers)] == [0, 1, 2, 3]
+        assert len(calls) == 2
+
+        async def value():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"answer": 42}
+
+        first, second = await asyncio.gather(flights.call("v", value), flights.call("v", value))
+        assert first is second and len(calls) == 3
+
+    asyncio.run(run())
+
+
+def test_error_and_cancel():
+    """异常传播；没有订阅者时停止计算"""
+    async def run():
+        flights = Singleflight()
+
+        async def broken():
+            yield "start"
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        async def consume():
+            events = []
+            try:
+                async for event in flights.stream("bad", broken):
+                    events.append(event)
+            except ValueError as e:
+                events.append(str(e))
+            return events
+
+        assert await asyncio.gather(consume(), consume()) == [["start", "boom"]] * 2
+
+        closed = []
+
+        async def endless():
+            try:
+                while True:
+                    await asyncio.sleep(0.01)
+                    yield "x"
+            finally:
+                closed.append(True)
+
+        stream = flights.stream("slow", endless)
+        assert await stream.__anext__() == "x"
+        await stream.aclose()
+        assert closed == [True] and flights.stats()["in_flight"] == 0
+
+    asyncio.run(run())
+
+
+class CountingLLM(FakeLLM):
+    """记录调用次数、回答较慢的假 LLM"""
+
+    def __init__(self):
+        super().__init__()
+        self.answer_calls = 0
+
+    async def generate_sql_with_tool(self, question, schema, examples=None):
+        await asyncio.sleep(0.05)
+        return await super().generate_sql_with_tool(question, schema, examples)
+
+    async def generate_answer(self, question, sql, data, truncated=False, digest=None):
+        self.answer_calls += 1
+        for part in ("各地区", "销售额"):
+            await asyncio.sleep(0.02)
+            yield part
+
+
+def test_agent_coalesces_identical_questions(db):
+    """同时到达的相同问题共享一次计算"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            llm = CountingLLM()
+            agent = DataAnalysisAgent(llm=llm, db=db)
+
+            async def ask(question):
+                return [e async for e in agent.stream_process_query(question)]
+
+            # 规范化后相同的问题合并
+            results = await asyncio.gather(*(ask(q) for q in ("各地区的销售额", "各地区的销售额 ", "各地区的销售额？") * 3))
+            assert llm.sql_calls == 1 and llm.answer_calls == 1
+            assert all(events == results[0] for events in results)
+            assert results[0][-1]["type"] == "done"
+
+            first, second = await asyncio.gather(
+                agent.process_query("按地区统计销售额"), agent.process_query("按地区统计销售额"),
+            )
+            assert first is second and llm.answer_calls == 2
+        finally:
+            await db.close()
+
+    asyncio.run(run())
@@ -0,0 +1,117 @@
+"""
+NL→SQL 缓存测试
+测试内容：
+1. 问题规范化（全角 / 半角、标点、空白）；负号、小数点与百分号不被去掉
+2. 命中、TTL 过期、LRU 淘汰，表结构变化后失效
+3. Agent 对重复问题跳过 SQL 生成的 LLM 调用
+"""
+
+import asyncio
+
+from app.config import settings
+from app.core.agent import DataAnalysisAgent
+from app.memory.sql_cache import SQLCache
+from app.utils.text import normalize_question
+from conftest import FakeLLM
+
+
+def test_normalize_question():
+    """全角折叠、标点与空白归一"""
+    assert normalize_question("各地区的 销售额？") == normalize_question("各地区的销售额")
+    assert normalize_question("ＴＯＰ ５ 产品！") == "top 5产品"
+    assert normalize_question("Sales,  by   region.") == "sales by region"
+    assert normalize_question("金额 > 5000") != normalize_question("金额 < 5000")
+    assert normalize_question("「各地区」的销售额（2024）") == normalize_question("各地区的销售额 2024")
+
+
+def test_normalize_keeps_meaningful_symbols():
+    """只差负号、百分号或小数点的问题规范化后不相同"""
+    pairs = [
+        ("金额小于-100的订单", "金额小于100的订单"),
+        ("增长超过10%的地区", "增长超过10的地区"),
+        ("单价大于1.5的产品", "单价大于15的产品"),
+        ("金额小于－１００的订单", "金额小于100的订单"),
+    ]
+    for a, b in pairs:
+        assert normalize_question(a) != normalize_question(b)
+    assert normalize_question("单价大于１．５的产品。") == "单价大于1.5的产品"
+
+
+def test_cache_hit_expiry_eviction_and_schema_change(db, monkeypatch):
+    """命中、过期、淘汰与表结构变化"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            cache = SQLCache(db)
+            args = {"sql": "SELECT COUNT(*) FROM sales", "reason": "计数"}
+            assert await cache.get("一共有多少笔销售？") is None
+            await cache.put("一共有多少笔销售？", args)
+            assert await cache.get("一共有多少笔销售") == args
+            assert await cache.get("一共有 多少笔销售?") == args
+            assert "nl2sql_cache" not in await db.get_schema()
+
+            # 数据写入不影响缓存
+            await db.insert_data("sales", [{"product_name": "X", "category": "手机", "amount": 1.0,
+                                            "quantity": 1, "sale_date": "2024-03-01", "region": "华东"}])
+            assert await cache.get("一共有多少笔销售") == args
+
+            # LRU：刚被访问的条目保留
+            monkeypatch.setattr(settings, "sql_cache_max_entries", 2)
+            await cache.put("问题二", {"sql": "SELECT 2"})
+            await asyncio.sleep(0.01)
+            assert await cache.get("一共有多少笔销售") == args
+            await cache.put("问题三", {"sql": "SELECT 3"})
+            assert await cache.get("问题二") is None
+            assert await cache.get("一共有多少笔销售") == args
+            assert cache.stats()["evictions"] == 1
+
+            # TTL
+            monkeypatch.setattr(settings, "sql_cache_ttl_seconds", 0)
+            await asyncio.sleep(0.01)
+            assert await cache.get("问题三") is None
+            monkeypatch.setattr(settings, "sql_cache_ttl_seconds", 3600)
+
+            # 表结构变化后全部失效，新建索引不算
+            await db.execute_update("CREATE INDEX idx_sales_region ON sales (region)")
+            assert await cache.get("一共有多少笔销售") == args
+            await db.create_table("targets", {"region": "TEXT", "goal": "REAL"})
+            assert await cache.get("一共有多少笔销售") is None
+
+            # 只差负号的问题不命中
+            negative = {"sql": "SELECT COUNT(*) FROM sales WHERE amount < -100"}
+            await cache.put("金额小于-100的订单有几笔", negative)
+            assert await cache.get("金额小于－100的订单有几笔？") == negative
+            assert await cache.get("金额小于100的订单有几笔") is None
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_agent_skips_llm_on_repeat_question(db):
+    """重复问题不再调用 LLM 生成 SQL，执行失败的 SQL 不写入缓存"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            llm = FakeLLM(reason="按地区汇总")
+            agent = DataAnalysisAgent(llm=llm, db=db)
+
+            first = await agent.process_query("各地区的销售额")
+            second = await agent.process_query("各地区的销售额？")
+            assert llm.sql_calls == 1
+            assert first.data == second.data and first.sql == second.sql
+
+            events = [e async for e in agent.stream_process_query("各地区的 销售额")]
+            assert llm.sql_calls == 1
+            assert any(e["type"] == "sql" for e in events)
+
+            llm.sql = "SELECT nope FROM sales"
+            await agent.process_query("一个失败的问题")
+            await agent.process_query("一个失败的问题")
+            assert llm.sql_calls == 3
+        finally:
+            await db.close()
+
+    asyncio.run(run())
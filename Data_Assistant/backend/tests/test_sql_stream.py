@@ -0,0 +1,152 @@
+"""
+流式函数调用测试
+测试内容：
+1. 不完整 JSON 参数中 sql 字段的增量读取（转义、其他字段在前）
+2. Qwen3LLM 在 sql 字段闭合时立即产出 SQL，不等待 reason
+3. Agent 下发部分 SQL，sql 完整即开始执行，reason 在查询后补发并写入缓存
+4. 客户端提前断开时关闭 LLM 流
+"""
+
+import asyncio
+import json
+
+from app.core.agent import DataAnalysisAgent
+from app.core.llm import Qwen3LLM, ToolCall, partial_json_field
+from conftest import FakeLLM
+
+SQL = "SELECT region, SUM(amount) AS total FROM sales GROUP BY region"
+
+
+def test_partial_json_field():
+    """任意前缀读取到的 sql 都是最终值的前缀"""
+    arguments = json.dumps({
+        "reason": '含有 "sql": "x" 的说明',
+        "extra": [1, {"a": "}"}],
+        "sql": 'SELECT "名称" FROM t WHERE a = \'😀\'\nAND b = 1',
+        "tail": True,
+    })
+    final = json.loads(arguments)["sql"]
+    values = []
+    for end in range(len(arguments) + 1):
+        value, complete = partial_json_field(arguments[:end], "sql")
+        if value is not None:
+            assert final.startswith(value)
+            values.append((value, complete))
+    assert values[-1] == (final, True)
+    # 字段闭合时后面的参数尚未到达
+    first_complete = next(end for end in range(len(arguments) + 1) if partial_json_field(arguments[:end], "sql")[1])
+    assert first_complete < arguments.index('"tail"')
+    assert partial_json_field('{"reason": "未完', "sql") == (None, False)
+
+
+def tool_call_chunks(arguments: str, size: int):
+    """按 OpenAI 兼容格式切分函数调用参数"""
+    yield {"choices": [{"delta": {"tool_calls": [
+        {"index": 0, "id": "call_1", "type": "function", "function": {"name": "execute_sql", "arguments": ""}}
+    ]}}]}
+    for i in range(0, len(arguments), size):
+        yield {"choices": [{"delta": {"tool_calls": [
+            {"index": 0, "function": {"arguments": arguments[i:i + size]}}
+        ]}}]}
+
+
+def test_llm_streams_sql_before_reason():
+    """sql 字段闭合即产出，reason 随后在 tool_call 中返回"""
+    arguments = json.dumps({"sql": SQL, "reason": "按地区汇总销售额"}, ensure_ascii=False)
+    llm = Qwen3LLM(api_key="test")
+    received = []
+
+    async def fake_stream_chat(messages, tools=None, tool_choice="auto"):
+        assert tools[0]["function"]["name"] == "execute_sql"
+        for chunk in tool_call_chunks(arguments, 6):
+            received.append(chunk)
+            yield chunk
+
+    llm.stream_chat = fake_stream_chat
+
+    async def run():
+        events = []
+        async for kind, value in llm.stream_sql_with_tool("各地区的销售额", "schema"):
+            events.append((kind, value, len(received)))
+        return events
+
+    events = asyncio.run(run())
+    partial = [value for kind, value, _ in events if kind == "sql_partial"]
+    assert partial and all(SQL.startswith(value) for value in partial)
+    kinds = [kind for kind, _, _ in events]
+    assert kinds[-2:] == ["sql", "tool_call"]
+    sql_event = events[-2]
+    assert sql_event[1] == SQL and sql_event[2] < len(received)
+    tool_call = events[-1][1]
+    assert tool_call.id == "call_1" and tool_call.function_arguments["reason"] == "按地区汇总销售额"
+
+
+class StreamingLLM(FakeLLM):
+    """sql 完整后延迟返回 reason 的假 LLM"""
+
+    def __init__(self, delay: float = 0.2):
+        super().__init__(SQL)
+        self.delay = delay
+        self.closed = False
+
+    async def generate_sql_with_tool(self, question, schema, examples=None):
+        raise AssertionError("应使用流式生成")
+
+    async def stream_sql_with_tool(self, question, schema, examples=None):
+        try:
+            yield "sql_partial", SQL[:20]
+            yield "sql", SQL
+            await asyncio.sleep(self.delay)
+            yield "tool_call", ToolCall(id="c", type="function", function_name="execute_sql",
+                                        function_arguments={"sql": SQL, "reason": "按地区汇总"})
+        finally:
+            self.closed = True
+
+
+def test_agent_executes_before_reason(db):
+    """部分 SQL 先下发，查询不等待 reason"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            llm = StreamingLLM()
+            agent = DataAnalysisAgent(llm=llm, db=db)
+            loop = asyncio.get_running_loop()
+
+            started = loop.time()
+            stamps = {}
+            events = []
+            async for event in agent.stream_process_query("各地区的销售额"):
+                stamps.setdefault(event["type"], loop.time() - started)
+                events.append(event)
+            types = [e["type"] for e in events]
+            assert types.index("sql_partial") < types.index("sql") < types.index("data") < types.index("reason")
+            # 查询在 reason 到达之前完成
+            assert stamps["data"] < llm.delay
+            assert next(e for e in events if e["type"] == "reason")["content"] == "按地区汇总"
+            # 缓存中保存完整参数
+            assert await agent.sql_cache.get("各地区的销售额") == {"sql": SQL, "reason": "按地区汇总"}
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_agent_cancels_on_disconnect(db):
+    """客户端断开后不再接收剩余参数"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            llm = StreamingLLM(delay=5)
+            agent = DataAnalysisAgent(llm=llm, db=db)
+            stream = agent.stream_process_query("各地区的销售额")
+            async for event in stream:
+                if event["type"] == "sql":
+                    break
+            await stream.aclose()
+            assert llm.closed
+        finally:
+            await db.close()
+
+    asyncio.run(run())
@@ -0,0 +1,316 @@
+"""
+SQLiteManager 测试
+测试内容：
+1. 连接池复用与统计
+2. 连接获取超时
+3. WAL 模式读写分离
+4. Schema 缓存失效；与本实例写入并发读取版本键时不误判为外部写入
+5. 有界查询与分批迭代
+6. 查询看门狗
+7. 查询结果缓存
+"""
+
+import asyncio
+import sqlite3
+
+import aiosqlite
+import pytest
+
+from app.db.pool import PoolTimeoutError
+from app.db.sqlite_manager import QueryCancelledError
+from app.utils.metrics import metrics
+
+
+def test_pool_reuses_connections(db):
+    """多次查询复用同一组连接"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            for i in range(10):
+                # 每次条件不同，避免命中结果缓存
+                await db.execute_query(f"SELECT COUNT(*) AS n FROM sales WHERE id > {i}")
+            stats = db.pool_stats()
+            assert stats["readers"]["size"] == db.pool._readers.size
+            assert stats["readers"]["checkouts"] >= 10
+            assert stats["readers"]["in_use"] == 0
+            assert stats["writers"]["checkouts"] >= 1
+        finally:
+            await db.close()
+        assert db.pool_stats()["opened"] is False
+
+    asyncio.run(run())
+
+
+def test_pool_checkout_timeout(db):
+    """写槽位被占用时，超时抛出 PoolTimeoutError"""
+    async def run():
+        db.pool.timeout = 0.05
+        await db.open()
+        try:
+            async with db.get_connection(write=True):
+                with pytest.raises(PoolTimeoutError):
+                    async with db.get_connection(write=True):
+                        pass
+            assert db.pool_stats()["writers"]["timeouts"] == 1
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_wal_readers_are_readonly(db):
+    """WAL 模式下读连接拒绝写入，写操作经由写任务完成"""
+    async def run():
+        await db.open()
+        try:
+            assert db.pool_stats()["journal_mode"] == "wal"
+            await db.initialize_sample_data()
+            with pytest.raises(sqlite3.OperationalError):
+                await db.execute_query("DELETE FROM sales")
+            rows = await db.execute_query("SELECT COUNT(*) AS n FROM sales")
+            assert rows[0]["n"] == 8
+            assert db.pool_stats()["writer_task"]["executed"] >= 2
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_wal_concurrent_reads_and_writes(db):
+    """并发读写不出现 database is locked"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+
+            async def writer(i):
+                await db.execute_update(
+                    "INSERT INTO sales (product_name, category, amount, quantity, sale_date, region) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (f"p{i}", "测试", 1.0, 1, "2024-03-01", "华东"),
+                )
+
+            async def reader():
+                return await db.execute_query(
+                    "SELECT region, SUM(amount) AS total FROM sales GROUP BY region"
+                )
+
+            tasks = [writer(i) for i in range(50)] + [reader() for _ in range(50)]
+            await asyncio.gather(*tasks)
+            rows = await db.execute_query("SELECT COUNT(*) AS n FROM sales")
+            assert rows[0]["n"] == 58
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_schema_cache_tracks_versions(db):
+    """Schema 缓存仅在 DDL 或数据变化时重建"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            first = await db.get_schema()
+            assert await db.get_schema() == first
+            assert db.schema_cache_stats()["hits"] == 1
+
+            # 本实例写入：只重建被写入的表
+            await db.create_table("notes", {"id": "INTEGER PRIMARY KEY", "text": "TEXT"})
+            schema = await db.get_schema()
+            assert "表: notes" in schema
+            await db.execute_update("INSERT INTO notes (text) VALUES (?)", ("hello",))
+            assert "hello" in await db.get_schema()
+
+            # 外部进程写入：通过 data_version 感知
+            conn = sqlite3.connect(db.db_path)
+            conn.execute("DELETE FROM notes")
+            conn.commit()
+            conn.close()
+            assert "hello" not in await db.get_schema()
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_local_writes_not_counted_as_external(db, monkeypatch):
+    """写入提交与记录之间读取版本键，不使外部写入代数递增"""
+    async def run():
+        await db.open()
+        try:
+            await db.create_table("notes", {"id": "INTEGER PRIMARY KEY", "text": "TEXT"})
+            _, generation, _ = await db.version_key()
+
+            async def job(conn):
+                await conn.execute("INSERT INTO notes (text) VALUES ('x')")
+                await conn.commit()
+                # 已提交、尚未记录：data_version 已变化，但写操作仍在进行
+                await db.version_key(["notes"])
+                await db._mark_written(["notes"])
+
+            for _ in range(3):
+                await db.pool.write(job)
+                assert (await db.version_key())[1] == generation
+
+            # 写入提交时另一个版本号读取正在进行：记录的 data_version 不能是该读取的旧快照
+            reading, committed = asyncio.Event(), asyncio.Event()
+            fetchone = aiosqlite.Cursor.fetchone
+
+            async def held_fetchone(cursor):
+                if cursor._conn is db.pool._probe and not reading.is_set():
+                    reading.set()
+                    await committed.wait()
+                return await fetchone(cursor)
+
+            async def concurrent_job(conn):
+                await reading.wait()
+                await conn.execute("INSERT INTO notes (text) VALUES ('y')")
+                await conn.commit()
+                committed.set()
+                await db._mark_written(["notes"])
+
+            monkeypatch.setattr(aiosqlite.Cursor, "fetchone", held_fetchone)
+            await asyncio.gather(db.pool.versions(), db.pool.write(concurrent_job))
+            assert db._data_version == (await db.pool.versions())[1]
+            assert (await db.version_key())[1] == generation
+
+            # 外部写入仍然被感知
+            conn = sqlite3.connect(db.db_path)
+            conn.execute("DELETE FROM notes")
+            conn.commit()
+            conn.close()
+            assert (await db.version_key())[1] == generation + 1
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_bounded_query_truncates(db):
+    """超过行数或字节上限时截断并标记"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            result = await db.execute_query_bounded("SELECT * FROM sales", max_rows=3)
+            assert len(result) == 3
+            assert result.truncated and result.truncate_reason == "max_rows"
+            assert result.columns[0] == "id"
+
+            result = await db.execute_query_bounded("SELECT * FROM sales", max_bytes=300)
+            assert result.truncated and result.truncate_reason == "max_bytes"
+            assert 0 < len(result) < 8
+
+            result = await db.execute_query_bounded("SELECT * FROM sales")
+            assert len(result) == 8 and not result.truncated
+
+            batches = [b async for b in db.iter_query("SELECT * FROM sales", batch_size=3)]
+            assert [len(b) for b in batches] == [3, 3, 2]
+            assert db.pool_stats()["readers"]["in_use"] == 0
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+CROSS_JOIN = (
+    "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 100000) "
+    "SELECT COUNT(*) FROM c a, c b"
+)
+
+
+def test_watchdog_cancels_runaway_query(db):
+    """超时或超出步数预算的查询被中断，连接可继续使用"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            before = metrics.get("query_cancelled")
+
+            with pytest.raises(QueryCancelledError) as exc:
+                await db.execute_query_bounded(CROSS_JOIN, timeout=0.2)
+            assert exc.value.reason == "timeout"
+
+            with pytest.raises(QueryCancelledError) as exc:
+                await db.execute_query_bounded(CROSS_JOIN, timeout=0, max_steps=100000)
+            assert exc.value.reason == "step_budget"
+
+            assert metrics.get("query_cancelled") == before + 2
+            result = await db.execute_query_bounded("SELECT COUNT(*) AS n FROM sales")
+            assert result.rows == [{"n": 8}]
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_result_cache_hits_and_invalidation(db):
+    """规范化后相同的查询命中缓存，写入相关表后失效"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            cache = db.result_cache
+            sql = "SELECT region, SUM(amount) AS total FROM sales WHERE region IN ('华东', '华北') GROUP BY region"
+            first = await db.execute_query_bounded(sql)
+            hits = cache.hits
+            # 大小写、空白、IN 列表顺序不同
+            same = "SELECT region, SUM(amount) AS total\n  from Sales where REGION in ('华北','华东') group by region;"
+            second = await db.execute_query_bounded(same)
+            assert cache.hits == hits + 1
+            assert second.rows == first.rows
+
+            # 选择列表原文不同（结果列名不同）不共享条目
+            await db.execute_query_bounded(sql.replace("AS total", "AS t"))
+            assert cache.hits == hits + 1
+
+            # 回调收到缓存的全部结果
+            received = []
+
+            async def on_batch(batch):
+                received.extend(batch.to_rows())
+
+            await db.execute_query_bounded(sql, on_batch=on_batch)
+            assert received == first.rows
+
+            # 写入后失效
+            await db.insert_data("sales", [{
+                "product_name": "iPhone 15", "category": "手机", "amount": 1.0,
+                "quantity": 1, "sale_date": "2024-03-01", "region": "华东",
+            }])
+            third = await db.execute_query_bounded(sql)
+            assert third.rows != first.rows
+            assert cache.stats()["invalidations"] >= 1
+
+            # 非确定性查询不缓存
+            before = len(cache)
+            await db.execute_query("SELECT random() AS r FROM sales LIMIT 1")
+            assert len(cache) == before
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_result_cache_lru_bounds():
+    """条目数与字节数超限时淘汰最久未用的条目"""
+    from app.db.result import Columnar, ResultSet
+    from app.db.result_cache import ResultCache
+
+    cache = ResultCache(max_entries=2, max_bytes=1000)
+    version = (1, 0, ())
+    for name in ("a", "b"):
+        cache.put((name,), version, ["t"], ResultSet(data=Columnar(["x"]), approx_bytes=100))
+    assert cache.get(("a",), version) is not None
+    cache.put(("c",), version, ["t"], ResultSet(data=Columnar(["x"]), approx_bytes=100))
+    assert cache.get(("b",), version) is None
+    assert cache.get(("a",), version) is not None
+    # 超过总容量四分之一的结果不缓存
+    cache.put(("big",), version, ["t"], ResultSet(data=Columnar(["x"]), approx_bytes=400))
+    assert cache.get(("big",), version) is None
+    # 版本变化即过期
+    assert cache.get(("a",), (2, 0, ())) is None
+    assert cache.stats()["evictions"] == 1
+
@@ -0,0 +1,126 @@
+"""
+结构化回答测试
+测试内容：
+1. 增量解析器在任意切分位置拆出图表规格与回答片段
+2. 缺少或无法解析图表块时全部作为回答
+3. Qwen3LLM 单次流式调用产出 chart / answer 事件
+4. Agent 结构化模式下只调用一次 LLM，图表规格在本地绑定
+"""
+
+import asyncio
+
+from app.config import settings
+from app.core.agent import DataAnalysisAgent
+from app.core.llm import Qwen3LLM, StructuredAnswerParser
+from conftest import FakeLLM
+
+OUTPUT = '<chart>\n{"chart_type": "bar", "x": "product_name", "y": ["amount"], "series": "region"}\n</chart>\n\n华东销售额最高，\n其次是华北。'
+ANSWER = "华东销售额最高，\n其次是华北。"
+
+
+def parse(text: str, size: int):
+    parser = StructuredAnswerParser()
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i:i + size]))
+    events.extend(parser.close())
+    return events
+
+
+def test_parser_any_split():
+    """任意片段长度都得到相同的结果"""
+    for size in range(1, len(OUTPUT) + 1):
+        events = parse(OUTPUT, size)
+        assert events[0] == ("chart", {"chart_type": "bar", "x": "product_name", "y": ["amount"], "series": "region"})
+        assert all(kind == "answer" for kind, _ in events[1:])
+        assert "".join(text for _, text in events[1:]) == ANSWER
+
+    # 回答片段随输入逐步产出，而不是在结束时一次产出
+    parser = StructuredAnswerParser()
+    assert parser.feed("<chart>null</chart>华东") == [("chart", None), ("answer", "华东")]
+    assert parser.feed("最高") == [("answer", "最高")]
+
+
+def test_parser_without_chart():
+    """没有图表块或图表块非法"""
+    assert parse("华东最高", 2) == [("answer", "华东"), ("answer", "最高")]
+    assert parse("<chart>{bad json</chart>回答", 3)[0] == ("chart", None)
+    # 代码块包裹的规格
+    assert parse('<chart>```json\n{"x": "a"}\n```</chart>好', 4)[0] == ("chart", {"x": "a"})
+    # 未闭合的图表块
+    assert parse('<chart>{"x": "a"}', 5) == [("chart", {"x": "a"})]
+
+
+def test_llm_single_call():
+    """单次流式调用拆分为图表与回答事件"""
+    llm = Qwen3LLM(api_key="test")
+    calls = []
+
+    async def fake_stream_chat(messages, tools=None, tool_choice="auto"):
+        calls.append(messages)
+        for i in range(0, len(OUTPUT), 7):
+            yield {"choices": [{"delta": {"content": OUTPUT[i:i + 7]}}]}
+
+    llm.stream_chat = fake_stream_chat
+
+    async def run():
+        data = [{"product_name": "A", "region": "华东", "amount": 10}]
+        return [e async for e in llm.generate_chart_and_answer("各产品销售额", "SELECT 1", data)]
+
+    events = asyncio.run(run())
+    assert len(calls) == 1 and "<chart>" in calls[0][0]["content"]
+    assert events[0][0] == "chart" and events[0][1]["x"] == "product_name"
+    assert "".join(text for kind, text in events if kind == "answer") == ANSWER
+
+
+class StructuredLLM(FakeLLM):
+    """只支持结构化输出的假 LLM"""
+
+    def __init__(self):
+        super().__init__("SELECT product_name, category, region, amount FROM sales")
+        self.chart_calls = 0
+        self.answer_calls = 0
+
+    async def recommend_chart(self, data, question, sql):
+        self.chart_calls += 1
+        return None
+
+    async def generate_answer(self, question, sql, data, truncated=False, digest=None):
+        self.answer_calls += 1
+        yield "不应调用"
+
+    async def generate_chart_and_answer(self, question, sql, data, truncated=False, digest=None):
+        parser = StructuredAnswerParser()
+        for i in range(0, len(OUTPUT), 5):
+            for event in parser.feed(OUTPUT[i:i + 5]):
+                yield event
+        for event in parser.close():
+            yield event
+
+
+def test_agent_structured_mode(db, monkeypatch):
+    """结构化模式下图表与回答来自同一次调用"""
+    monkeypatch.setattr(settings, "structured_answer_enabled", True)
+
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            llm = StructuredLLM()
+            agent = DataAnalysisAgent(llm=llm, db=db)
+
+            events = [e async for e in agent.stream_process_query("列出产品、类别、地区与金额")]
+            types = [e["type"] for e in events]
+            assert types.index("chart") < types.index("answer_chunk")
+            chart = next(e for e in events if e["type"] == "chart")["content"]
+            rows = (await db.execute_query("SELECT DISTINCT region FROM sales"))
+            assert {s["name"] for s in chart["echarts_option"]["series"]} == {r["region"] for r in rows}
+            assert next(e for e in events if e["type"] == "answer")["content"] == ANSWER
+
+            result = await agent.process_query("列出产品、类别、地区与金额")
+            assert result.chart_config["chart_type"] == "bar" and result.answer == ANSWER
+            assert llm.chart_calls == 0 and llm.answer_calls == 0
+        finally:
+            await db.close()
+
+    asyncio.run(run())
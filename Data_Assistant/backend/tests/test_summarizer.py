@@ -0,0 +1,87 @@
+"""
+结果摘要测试
+测试内容：
+1. 合计、占比、最高 / 最低基于全部结果行
+2. 时间维度的环比变化与异常值
+3. 空值处理、无度量列的分类摘要，摘要长度不随行数增长
+4. Agent 把摘要传给回答生成
+"""
+
+import asyncio
+
+from app.core.agent import DataAnalysisAgent
+from app.core.summarizer import summarize, fmt
+from app.db.result import Columnar
+from conftest import FakeLLM
+
+
+def make_result(columns, rows) -> Columnar:
+    result = Columnar(columns)
+    result.extend(rows)
+    return result
+
+
+def test_totals_shares_and_ranking():
+    """合计、占比与最高 / 最低"""
+    rows = [(f"R{i}", float(i + 1)) for i in range(10)]
+    digest = summarize(make_result(["region", "total"], rows))
+    assert "合计 55" in digest
+    assert "最高: R9 10 (18.2%)，R8 9 (16.4%)" in digest
+    assert "最低: R0 1 (1.8%)" in digest
+    assert "前 5 项合计占比 72.7%" in digest
+    assert fmt(1234567) == "1,234,567" and fmt(2.5) == "2.5" and fmt(3.0) == "3"
+
+
+def test_temporal_changes_and_outliers():
+    """按时间汇总后的变化与异常值"""
+    rows = []
+    for month in range(1, 13):
+        for region in ("华东", "华北"):
+            rows.append((f"2024-{month:02d}", region, 1000 if month == 7 else 100))
+    digest = summarize(make_result(["month", "region", "amount"], rows))
+    assert "按 month 汇总后 最高: 2024-07 2,000" in digest
+    assert "2024-07 +900.0%" in digest and "最大降幅 2024-08 -90.0%" in digest
+    assert "异常值: 2024-07 2,000" in digest
+
+
+def test_nulls_categories_and_fixed_size():
+    """空值、无度量列与摘要大小"""
+    digest = summarize(make_result(["region", "orders"], [("A", 3), ("B", None), ("C", 1)]))
+    assert "空值 1 个" in digest and "nan" not in digest
+
+    digest = summarize(make_result(["product", "region"], [("a", "x"), ("b", "x"), ("c", "y")]))
+    assert "region: 2 个取值，最常见: x (2 行)" in digest
+
+    small = summarize(make_result(["k", "v"], [(f"K{i}", i) for i in range(100)]))
+    large = summarize(make_result(["k", "v"], [(f"K{i}", i) for i in range(100_000)]))
+    assert len(large) < len(small) * 1.5
+    assert summarize(Columnar(["k"])) is None
+
+
+class DigestLLM(FakeLLM):
+    """记录回答摘要的假 LLM"""
+
+    def __init__(self):
+        super().__init__()
+        self.digests = []
+
+    async def generate_answer(self, question, sql, data, truncated=False, digest=None):
+        self.digests.append(digest)
+        yield "完成"
+
+
+def test_agent_passes_digest(db):
+    """Agent 在回答生成时附带摘要"""
+    async def run():
+        await db.open()
+        try:
+            await db.initialize_sample_data()
+            llm = DigestLLM()
+            agent = DataAnalysisAgent(llm=llm, db=db)
+            [e async for e in agent.stream_process_query("各地区的销售额")]
+            total = (await db.execute_query("SELECT SUM(amount) AS s FROM sales"))[0]["s"]
+            assert llm.digests[0].startswith("共 ") and f"合计 {fmt(total)}" in llm.digests[0]
+        finally:
+            await db.close()
+
+    asyncio.run(run())
@@ -0,0 +1,208 @@
+"""
+向量化聚合引擎差分测试
+测试内容：
+1. 支持的查询形态与 SQLite 结果一致（列名、行数、取值、排序）
+2. 不支持的查询形态回退
+3. 数据写入后快照过期，重新加载后结果一致
+4. 逐批构建类型化列（先空后有值、混合类型、超出预分配），超出行数上限时不加载
+"""
+
+import asyncio
+import math
+import random
+
+import pytest
+
+from app.config import settings
+from app.db.sqlite_manager import SQLiteManager
+from app.db.vector_engine import _ColumnBuilder
+
+pytest.importorskip("numpy")
+
+SUPPORTED = [
+    "SELECT region, SUM(amount) FROM sales GROUP BY region",
+    "SELECT region, SUM(amount) AS total FROM sales GROUP BY region ORDER BY total DESC LIMIT 3",
+    "SELECT category, AVG(quantity), COUNT(*), COUNT(category) FROM sales GROUP BY category",
+    "SELECT region, category, SUM(quantity) AS q FROM sales "
+    "WHERE sale_date >= '2024-03-01' AND sale_date < '2024-06-01' GROUP BY region, category ORDER BY region, category",
+    "SELECT COUNT(*), SUM(amount), MIN(sale_date), MAX(amount) FROM sales WHERE region IN ('华东', '华南')",
+    "SELECT product_name, ROUND(SUM(amount), 2) AS total FROM sales "
+    "WHERE amount BETWEEN 100 AND 5000 GROUP BY product_name ORDER BY total DESC",
+    "SELECT s.region, MAX(s.quantity) FROM sales s WHERE s.category IS NULL GROUP BY s.region",
+    "SELECT quantity, COUNT(*) FROM sales GROUP BY quantity ORDER BY 2 DESC, 1 LIMIT 5 OFFSET 2",
+    "SELECT COUNT(*) FROM sales WHERE region = '不存在'",
+    "SELECT region, SUM(amount) FROM sales WHERE region = '不存在' GROUP BY region",
+    "SELECT category, MIN(product_name), MAX(product_name) FROM sales "
+    "WHERE quantity > 10 AND region <> '华北' GROUP BY category",
+    "SELECT region, TOTAL(quantity), ROUND(AVG(amount)) FROM sales WHERE region < '华东' GROUP BY 1",
+    "select Region, sum( amount ) from sales where quantity <= -1 group by region;",
+]
+
+UNSUPPORTED = [
+    "SELECT * FROM sales",
+    "SELECT region, SUM(amount) FROM sales GROUP BY region HAVING SUM(amount) > 10",
+    "SELECT region, SUM(amount) FROM sales WHERE region = '华东' OR region = '华北' GROUP BY region",
+    "SELECT region, SUM(amount * quantity) FROM sales GROUP BY region",
+    "SELECT region, SUM(amount) FROM sales WHERE amount > '100' GROUP BY region",
+    "SELECT product_name, SUM(amount) FROM sales GROUP BY region",
+    "SELECT a.region, COUNT(*) FROM sales a JOIN sales b ON a.id = b.id GROUP BY a.region",
+    "SELECT region, COUNT(DISTINCT product_name) FROM sales GROUP BY region",
+]
+
+REGIONS = ["华东", "华北", "华南", "西南", "华中"]
+CATEGORIES = ["手机", "电脑", "平板", "配件", None]
+PRODUCTS = ["iPhone 15", "MacBook Pro", "iPad Air", "AirPods Pro", "Apple Watch", "Kindle"]
+
+
+def make_rows(count: int, seed: int):
+    rng = random.Random(seed)
+    return [
+        {
+            "product_name": rng.choice(PRODUCTS),
+            "category": rng.choice(CATEGORIES),
+            "amount": round(rng.uniform(10, 9000), 2),
+            "quantity": rng.randint(1, 200),
+            "sale_date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "region": rng.choice(REGIONS),
+        }
+        for _ in range(count)
+    ]
+
+
+@pytest.fixture
+def engine_settings(monkeypatch):
+    monkeypatch.setattr(settings, "vector_engine_enabled", True)
+    monkeypatch.setattr(settings, "vector_engine_min_rows", 0)
+    monkeypatch.setattr(settings, "result_cache_enabled", False)
+    monkeypatch.setattr(settings, "rollup_enabled", False)
+
+
+async def make_db(tmp_path) -> SQLiteManager:
+    db = SQLiteManager(str(tmp_path / "test.db"))
+    await db.open()
+    await db.initialize_sample_data()
+    await db.insert_data("sales", make_rows(3000, seed=7))
+    return db
+
+
+async def sqlite_result(db: SQLiteManager, sql: str):
+    async with db.get_connection() as conn:
+        cursor = await conn.execute(sql)
+        columns = [d[0] for d in cursor.description]
+        return columns, [tuple(row) for row in await cursor.fetchall()]
+
+
+def assert_same(sql, expected, actual):
+    columns, rows = expected
+    assert actual.columns == columns, sql
+    got = list(actual.iter_rows())
+    if "ORDER BY" not in sql.upper():
+        rows, got = sorted(rows, key=repr), sorted(got, key=repr)
+    assert len(got) == len(rows), sql
+    for want_row, got_row in zip(rows, got):
+        for want, value in zip(want_row, got_row):
+            if isinstance(want, float):
+                assert isinstance(value, float) and math.isclose(value, want, rel_tol=1e-9), (sql, want_row, got_row)
+            else:
+                assert value == want and type(value) is type(want), (sql, want_row, got_row)
+
+
+def test_supported_shapes_match_sqlite(tmp_path, engine_settings):
+    """支持的形态与 SQLite 结果一致"""
+    async def run():
+        db = await make_db(tmp_path)
+        try:
+            await db.vector.load("sales")
+            for sql in SUPPORTED:
+                data = await db.vector.try_execute(sql)
+                assert data is not None, sql
+                assert_same(sql, await sqlite_result(db, sql), data)
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_unsupported_shapes_fall_back(tmp_path, engine_settings):
+    """不支持的形态回退，经 execute_query_bounded 仍由 SQLite 给出结果"""
+    async def run():
+        db = await make_db(tmp_path)
+        try:
+            await db.vector.load("sales")
+            for sql in UNSUPPORTED:
+                assert await db.vector.try_execute(sql) is None, sql
+            result = await db.execute_query_bounded(UNSUPPORTED[1])
+            assert result.rows == (await db.execute_query(UNSUPPORTED[1]))
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_snapshot_reload_after_write(tmp_path, engine_settings):
+    """写入后快照过期：本次回退并在后台重新加载，之后结果包含新数据"""
+    sql = SUPPORTED[2]
+
+    async def run():
+        db = await make_db(tmp_path)
+        try:
+            await db.vector.load("sales")
+            before = db.vector.executed
+            result = await db.execute_query_bounded(sql)
+            assert db.vector.executed == before + 1
+            assert_same(sql, await sqlite_result(db, sql), result.data)
+
+            await db.insert_data("sales", make_rows(50, seed=11))
+            assert await db.vector.try_execute(sql) is None
+            await db.vector._loading["sales"]
+            data = await db.vector.try_execute(sql)
+            assert data is not None
+            assert_same(sql, await sqlite_result(db, sql), data)
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_column_builder_batches():
+    """分批写入与一次性构建的结果一致"""
+    text = _ColumnBuilder("region", 2)
+    number = _ColumnBuilder("amount", 2)
+    mixed = _ColumnBuilder("note", 2)
+    batches = [
+        [(None, None, 1), (None, None, "a")],
+        [("华南", 1.5, None), (None, None, None)],
+        [("华东", 2.0, "b"), ("华南", None, None), ("华北", 3.25, None)],
+    ]
+    offset = 0
+    for batch in batches:
+        for builder, values in zip((text, number, mixed), zip(*batch)):
+            builder.extend(values, offset)
+        offset += len(batch)
+
+    column = text.finish(offset)
+    assert column.dictionary == sorted(["华南", "华东", "华北"])
+    assert [column.dictionary[c] if c >= 0 else None for c in column.values] == \
+        [None, None, "华南", None, "华东", "华南", "华北"]
+    column = number.finish(offset)
+    assert column.values.dtype.kind == "f" and len(column.values) == offset
+    assert list(column.nulls) == [True, True, False, True, False, True, False]
+    assert mixed.finish(offset) is None
+
+
+def test_snapshot_size_limit(tmp_path, engine_settings, monkeypatch):
+    """超过行数上限的表不加载，版本不变时也不反复尝试"""
+    monkeypatch.setattr(settings, "vector_engine_max_rows", 100)
+
+    async def run():
+        db = await make_db(tmp_path)
+        try:
+            await db.vector.drain()
+            assert await db.vector.load("sales") is None
+            assert await db.vector.try_execute(SUPPORTED[0]) is None
+            assert not db.vector._loading
+            assert db.vector.stats()["skipped"] == ["sales"]
+        finally:
+            await db.close()
+
+    asyncio.run(run())
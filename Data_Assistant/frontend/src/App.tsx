@@ -19,7 +19,17 @@ function App() {
   } = useSession()
 
   const { messages, isLoading, error, sendMessage, loadMessages, clearError } = useChat()
-  const { chartConfig, rawData, chartType, changeChartType, setChartConfig, setRawData } = useChart()
+  const {
+    chartConfig,
+    rawData,
+    hasMoreRows,
+    loadingMore,
+    chartType,
+    changeChartType,
+    loadMoreRows,
+    setChartConfig,
+    setRawData,
+  } = useChart()
 
   // 当前选中的消息（用于右侧显示）
   const [selectedMessage, setSelectedMessage] = useState<Message | null>(null)
@@ -100,6 +110,9 @@ function App() {
           sql={currentSql}
           chartConfig={chartConfig}
           rawData={rawData}
+          hasMoreRows={hasMoreRows}
+          loadingMore={loadingMore}
+          onLoadMore={loadMoreRows}
           chartType={chartType}
           onChartTypeChange={changeChartType}
         />
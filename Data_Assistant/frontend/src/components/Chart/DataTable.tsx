@@ -3,11 +3,16 @@ import { useState, useMemo } from 'react'
 interface DataTableProps {
   data: Record<string, unknown>[]
   maxRows?: number
+  /** 服务端还有未加载的行 */
+  hasMoreRows?: boolean
+  loadingMore?: boolean
+  onLoadMore?: () => void
 }
 
 type SortDirection = 'asc' | 'desc' | null
 
-export function DataTable({ data, maxRows = 10 }: DataTableProps) {
+export function DataTable({ data, maxRows = 10, hasMoreRows = false, loadingMore = false, onLoadMore }: DataTableProps) {
+  const [visibleRows, setVisibleRows] = useState(maxRows)
   const [sortColumn, setSortColumn] = useState<string | null>(null)
   const [sortDirection, setSortDirection] = useState<SortDirection>(null)
   const [filterColumn, setFilterColumn] = useState<string | null>(null)
@@ -66,8 +71,17 @@ export function DataTable({ data, maxRows = 10 }: DataTableProps) {
     return result
   }, [data, filterColumn, filterValue, sortColumn, sortDirection])
 
-  const displayData = processedData.slice(0, maxRows)
-  const hasMore = processedData.length > maxRows
+  const displayData = processedData.slice(0, visibleRows)
+  const hasMore = processedData.length > visibleRows
+  const canLoadMore = hasMore || (hasMoreRows && !!onLoadMore)
+
+  // 先展开已加载的行，全部展开后再从服务端读取下一页
+  const handleLoadMore = () => {
+    if (!hasMore && onLoadMore) {
+      onLoadMore()
+    }
+    setVisibleRows((rows) => rows + maxRows)
+  }
 
   if (!data || data.length === 0) {
     return null
@@ -113,7 +127,8 @@ export function DataTable({ data, maxRows = 10 }: DataTableProps) {
             {processedData.length !== data.length && (
               <span className="text-primary-600 mr-1">已筛选 {processedData.length} 条</span>
             )}
-            {hasMore ? `显示前 ${maxRows} 条，共 ${processedData.length} 条` : `共 ${processedData.length} 条`}
+            {hasMore ? `显示前 ${visibleRows} 条，共 ${processedData.length} 条` : `共 ${processedData.length} 条`}
+            {hasMoreRows && '（还有更多）'}
           </span>
         </div>
       </div>
@@ -203,6 +218,15 @@ export function DataTable({ data, maxRows = 10 }: DataTableProps) {
             </tbody>
           </table>
         </div>
+        {canLoadMore && (
+          <button
+            onClick={handleLoadMore}
+            disabled={loadingMore}
+            className="w-full py-2 text-xs text-primary-600 border-t border-slate-100 hover:bg-slate-50 transition-colors disabled:text-slate-400"
+          >
+            {loadingMore ? '加载中...' : '加载更多'}
+          </button>
+        )}
       </div>
     </div>
   )
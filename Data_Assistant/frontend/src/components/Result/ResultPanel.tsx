@@ -7,6 +7,10 @@ interface ResultPanelProps {
   sql: string | null
   chartConfig: ChartConfig | null
   rawData: Record<string, unknown>[]
+  /** 服务端还有未加载的结果行 */
+  hasMoreRows?: boolean
+  loadingMore?: boolean
+  onLoadMore?: () => void
   chartType: ChartType
   onChartTypeChange: (type: ChartType) => void
 }
@@ -25,6 +29,9 @@ export function ResultPanel({
   sql,
   chartConfig,
   rawData,
+  hasMoreRows,
+  loadingMore,
+  onLoadMore,
   chartType,
   onChartTypeChange,
 }: ResultPanelProps) {
@@ -123,7 +130,13 @@ export function ResultPanel({
 
             {/* 数据表格 */}
             {activeTab === 'data' && rawData.length > 0 && (
-              <DataTable data={rawData} maxRows={15} />
+              <DataTable
+                data={rawData}
+                maxRows={15}
+                hasMoreRows={hasMoreRows}
+                loadingMore={loadingMore}
+                onLoadMore={onLoadMore}
+              />
             )}
           </div>
         )}
@@ -1,5 +1,7 @@
 import { useCallback } from 'react'
 import { useChartStore } from '@/stores/chartStore'
+import { getResultPage } from '@/services/api'
+import { decodeData } from '@/utils/columnar'
 import { ChartConfig, ChartType } from '@/types'
 import { CHART_STYLE, normalizeChartOption } from '@/utils/chartStyle'
 
@@ -94,10 +96,15 @@ export function useChart() {
     chartConfig, 
     sourceChartConfig,
     rawData, 
+    hasMoreRows,
+    loadingMore,
     chartType,
     setChartConfig, 
     setRawData, 
     setChartType,
+    setResultPaging,
+    appendRawData,
+    setLoadingMore,
     clearChart 
   } = useChartStore()
 
@@ -131,6 +138,26 @@ export function useChart() {
     [rawData, chartConfig, sourceChartConfig, setChartType, setChartConfig]
   )
 
+  // 从结果句柄读取下一页，追加到当前数据
+  const loadMoreRows = useCallback(async () => {
+    const { resultId, rawData: loaded, loadingMore: busy } = useChartStore.getState()
+    if (!resultId || busy) return
+    setLoadingMore(true)
+    try {
+      const { data: page } = await getResultPage(resultId, loaded.length)
+      // 读取期间已切换到其他结果
+      if (useChartStore.getState().resultId !== resultId) return
+      appendRawData(decodeData(page.data) ?? [], page.has_more)
+    } catch {
+      // 结果已过期（404）或请求失败：不再提供加载更多
+      if (useChartStore.getState().resultId === resultId) {
+        setResultPaging(null, false)
+      }
+    } finally {
+      setLoadingMore(false)
+    }
+  }, [appendRawData, setLoadingMore, setResultPaging])
+
   const loadMockChart = useCallback(() => {
     const mockData = [
       { week: '第一周', sales: 28000 },
@@ -147,11 +174,14 @@ export function useChart() {
   return {
     chartConfig,
     rawData,
+    hasMoreRows,
+    loadingMore,
     chartType,
     updateChart,
     changeChartType,
     clearChart,
     loadMockChart,
+    loadMoreRows,
     setChartConfig,
     setRawData,
   }
@@ -8,6 +8,7 @@ import {
   backendChartToConfig,
   updateSession as updateSessionApi,
 } from '@/services/api'
+import { decodeData } from '@/utils/columnar'
 import type { BackendChartResponse, Message } from '@/types'
 
 export function useChat() {
@@ -26,6 +27,7 @@ export function useChat() {
   } = useChatStore()
   const setChartConfig = useChartStore((s) => s.setChartConfig)
   const setRawData = useChartStore((s) => s.setRawData)
+  const setResultPaging = useChartStore((s) => s.setResultPaging)
   const setChartType = useChartStore((s) => s.setChartType)
   const setSourceChartConfig = useChartStore((s) => s.setSourceChartConfig)
 
@@ -88,9 +90,22 @@ export function useChat() {
             if (type === 'sql' && typeof c === 'string') {
               sqlResult = c
               setSqlPreview(c)
-            } else if (type === 'data' && Array.isArray(c)) {
-              dataResult = c
-              setRawData(c)
+            } else if (type === 'sql_partial' && typeof c === 'string') {
+              // 生成中的 SQL，完整 SQL 到达前逐步刷新预览
+              setSqlPreview(c)
+            } else if (type === 'data') {
+              // 列式或旧的行数组格式
+              const rows = decodeData(c)
+              if (rows) {
+                dataResult = rows
+                setRawData(rows)
+                // 首页之后的行通过 result_id 分页读取
+                setResultPaging(event.result_id ?? null, !!event.has_more)
+              }
+            } else if (type === 'data_complete' && event.result_id) {
+              // 结果写入完成，按总行数确定是否还有未加载的行
+              const loaded = useChartStore.getState().rawData.length
+              setResultPaging(event.result_id, (event.total ?? 0) > loaded)
             } else if (type === 'chart' && c && typeof c === 'object' && 'echarts_option' in c) {
               chartResult = c as BackendChartResponse
               const config = backendChartToConfig(chartResult)
@@ -134,6 +149,7 @@ export function useChat() {
       setSqlPreview,
       setError,
       setRawData,
+      setResultPaging,
       setChartConfig,
       setChartType,
     ]
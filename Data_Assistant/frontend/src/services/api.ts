@@ -4,6 +4,7 @@ import type {
   ChartConfig,
   ChartType,
   MessageFromApi,
+  ResultPage,
   Session,
   SSEMessage,
 } from '@/types'
@@ -47,6 +48,10 @@ export const getSessionMessages = (sessionId: string) =>
 export const sendChatQuery = (sessionId: string, question: string) =>
   api.post('/api/chat/query', { session_id: sessionId, question })
 
+/** 分页读取查询结果（data 事件只包含首页） */
+export const getResultPage = (resultId: string, offset: number, limit?: number) =>
+  api.get<ResultPage>(`/api/chat/results/${resultId}`, { params: { offset, limit } })
+
 /** SSE 流式查询：解析 data 行并回调 onEvent */
 export async function sendChatQueryStream(
   sessionId: string,
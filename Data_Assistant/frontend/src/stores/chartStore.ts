@@ -6,12 +6,19 @@ interface ChartState {
   /** 来自后端/消息的原始图表配置，用于切换回同类型时恢复一致样式 */
   sourceChartConfig: ChartConfig | null
   rawData: Record<string, unknown>[]
+  /** 当前结果的句柄，后续行通过 getResultPage 分页读取 */
+  resultId: string | null
+  hasMoreRows: boolean
+  loadingMore: boolean
   chartType: ChartType
 
   // Actions
   setChartConfig: (config: ChartConfig | null) => void
   setSourceChartConfig: (config: ChartConfig | null) => void
   setRawData: (data: Record<string, unknown>[]) => void
+  setResultPaging: (resultId: string | null, hasMore: boolean) => void
+  appendRawData: (data: Record<string, unknown>[], hasMore: boolean) => void
+  setLoadingMore: (loading: boolean) => void
   setChartType: (type: ChartType) => void
   clearChart: () => void
 }
@@ -20,11 +27,26 @@ export const useChartStore = create<ChartState>((set) => ({
   chartConfig: null,
   sourceChartConfig: null,
   rawData: [],
+  resultId: null,
+  hasMoreRows: false,
+  loadingMore: false,
   chartType: 'bar',
 
   setChartConfig: (config) => set({ chartConfig: config }),
   setSourceChartConfig: (config) => set({ sourceChartConfig: config }),
-  setRawData: (data) => set({ rawData: data }),
+  // 替换数据时清空分页状态，新结果的句柄由 setResultPaging 设置
+  setRawData: (data) => set({ rawData: data, resultId: null, hasMoreRows: false }),
+  setResultPaging: (resultId, hasMore) => set({ resultId, hasMoreRows: hasMore }),
+  appendRawData: (data, hasMore) => set((state) => ({ rawData: [...state.rawData, ...data], hasMoreRows: hasMore })),
+  setLoadingMore: (loading) => set({ loadingMore: loading }),
   setChartType: (type) => set({ chartType: type }),
-  clearChart: () => set({ chartConfig: null, sourceChartConfig: null, rawData: [], chartType: 'bar' }),
+  clearChart: () =>
+    set({
+      chartConfig: null,
+      sourceChartConfig: null,
+      rawData: [],
+      resultId: null,
+      hasMoreRows: false,
+      chartType: 'bar',
+    }),
 }))
@@ -66,6 +66,7 @@ export interface ChatQuerySyncResponse {
   data?: Record<string, unknown>[]
   chart?: BackendChartResponse
   answer?: string
+  truncated?: boolean
   error?: string
 }
 
@@ -73,16 +74,51 @@ export interface ChatQuerySyncResponse {
 export type SSEEventType =
   | 'status'
   | 'reason'
+  | 'sql_partial'
   | 'sql'
   | 'data'
+  | 'data_complete'
+  | 'warning'
   | 'chart'
   | 'answer_chunk'
   | 'answer'
   | 'error'
   | 'done'
 
+// 列式查询结果（与后端 app/db/result.py 一致）
+export interface ColumnarData {
+  columns: string[]
+  types: string[]
+  /** 按列存储：values[j][i] 为第 i 行第 j 列 */
+  values: unknown[][]
+}
+
 export interface SSEMessage {
   type: SSEEventType
-  content: string | Record<string, unknown>[] | BackendChartResponse | null
+  content: string | Record<string, unknown>[] | ColumnarData | BackendChartResponse | null
+  /** data 事件：content 的编码格式 */
+  format?: 'columnar'
   count?: number
+  /** data / data_complete 事件：结果句柄，可通过 getResultPage 分页读取 */
+  result_id?: string
+  offset?: number
+  has_more?: boolean
+  /** data_complete 事件：结果总行数 */
+  total?: number
+  /** data_complete 事件：结果超过后端上限被截断 */
+  truncated?: boolean
+  truncate_reason?: 'max_rows' | 'max_bytes' | null
+  /** error 事件：错误类别（query_cancelled / query_rejected） */
+  code?: string
+}
+
+// 分页结果（与后端 /api/chat/results/{id} 一致）
+export interface ResultPage {
+  result_id: string
+  data: ColumnarData
+  offset: number
+  total: number
+  complete: boolean
+  has_more: boolean
+  truncated: boolean
 }
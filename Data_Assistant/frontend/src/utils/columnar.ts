@@ -0,0 +1,36 @@
+/**
+ * 列式查询结果解码：{ columns, types, values } → 行对象数组
+ * 兼容旧的行对象数组格式
+ */
+
+import type { ColumnarData } from '@/types'
+
+export function isColumnar(value: unknown): value is ColumnarData {
+  return (
+    !!value &&
+    typeof value === 'object' &&
+    !Array.isArray(value) &&
+    Array.isArray((value as ColumnarData).columns) &&
+    Array.isArray((value as ColumnarData).values)
+  )
+}
+
+export function columnarToRows(data: ColumnarData): Record<string, unknown>[] {
+  const length = data.values[0]?.length ?? 0
+  const rows: Record<string, unknown>[] = new Array(length)
+  for (let i = 0; i < length; i++) {
+    const row: Record<string, unknown> = {}
+    data.columns.forEach((column, j) => {
+      row[column] = data.values[j][i]
+    })
+    rows[i] = row
+  }
+  return rows
+}
+
+/** 统一解码为行对象数组 */
+export function decodeData(value: unknown): Record<string, unknown>[] | null {
+  if (isColumnar(value)) return columnarToRows(value)
+  if (Array.isArray(value)) return value as Record<string, unknown>[]
+  return null
+}